@@ -19,15 +19,26 @@
 # under the License.
 
 import collections
+import contextlib
 import fnmatch
+import functools
+import hashlib
 import itertools
-
+import random
+import time
+
+import eventlet
+from eventlet import event
+from eventlet import greenpool
+from eventlet import queue
+from eventlet import timeout
 from oslo.config import cfg
 from oslo_context import context
 import six
 from six.moves.urllib import parse as urlparse
 from stevedore import extension
 
+from ceilometer.agent import plugin_base
 from ceilometer import coordination
 from ceilometer.i18n import _
 from ceilometer.openstack.common import log
@@ -37,8 +48,69 @@ from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+OPTS = [
+    cfg.IntOpt('pollster_workers',
+               default=1,
+               help='Number of pollsters run concurrently by every polling '
+                    'task, 1 running them one after the other. Only the '
+                    'pollsters waiting on green I/O, such as the ones '
+                    'calling HTTP APIs, run concurrently: the libvirt calls '
+                    'of the compute pollsters block the whole agent.'),
+    cfg.FloatOpt('pollster_timeout',
+                 default=0,
+                 help='Number of seconds after which a pollster is '
+                      'interrupted, the samples it already produced being '
+                      'published. Only the pollsters waiting on I/O can be '
+                      'interrupted. 0 means no timeout.'),
+    cfg.IntOpt('pollster_batch_size',
+               default=100,
+               help='Number of samples produced by a pollster that are '
+                    'published together while it is still polling.'),
+    cfg.BoolOpt('spread_polling',
+                default=True,
+                help='Delay the first run of every polling task by a phase '
+                     'derived from the host name, spreading the polling of '
+                     'the agents over the polling interval.'),
+    cfg.FloatOpt('polling_jitter',
+                 default=0.1,
+                 help='Maximum fraction of the polling interval by which '
+                      'every run of a polling task is randomly delayed.'),
+    cfg.StrOpt('overrun_policy',
+               default='skip',
+               choices=['skip', 'coalesce'],
+               help='What to do with the runs of a polling task missed '
+                    'while a run outlasted the polling interval: skip them '
+                    'until the next scheduled run, or coalesce them into a '
+                    'single run starting immediately.'),
+    cfg.IntOpt('polling_stats_interval',
+               default=600,
+               help='Number of seconds between the logs of the timings of '
+                    'the polling tasks and of the discovery cache counters. '
+                    '0 disables them.'),
+    cfg.IntOpt('discovery_cache_ttl',
+               default=300,
+               help='Number of seconds the resources discovered are shared '
+                    'by the polling tasks of the agent. 0 means they are '
+                    'discovered again by every polling cycle.'),
+    cfg.DictOpt('discovery_cache_ttls',
+                default={},
+                help='Number of seconds the resources discovered are '
+                     'shared by the polling tasks, by discoverer name, '
+                     'overriding discovery_cache_ttl. For example: '
+                     'local_instances:60,endpoint:3600'),
+    cfg.IntOpt('discovery_stale_grace',
+               default=0,
+               help='Number of seconds after their expiry during which the '
+                    'resources of a discoverer are returned while they are '
+                    'discovered again in the background, instead of waiting '
+                    'for them. Resources expired for longer are always '
+                    'discovered again first. 0 disables it.'),
+]
+
+cfg.CONF.register_opts(OPTS, group='polling')
 cfg.CONF.import_opt('heartbeat', 'ceilometer.coordination',
                     group='coordination')
+cfg.CONF.import_opt('host', 'ceilometer.service')
 
 
 class PollsterListForbidden(Exception):
@@ -110,37 +182,242 @@ class PollingTask(object):
         self.resources[key].setup(pipeline)
 
     def poll_and_publish(self):
-        """Polling sample and publish into pipeline."""
+        """Polling sample and publish into pipeline.
+
+        The pollsters are run concurrently by a pool of greenthreads, the
+        samples they produce being published in batches from the calling
+        greenthread as soon as they are available.
+        """
         cache = {}
         discovery_cache = {}
+        polls = []
         for source_name in self.pollster_matches:
-            with self.publishers[source_name] as publisher:
-                for pollster in self.pollster_matches[source_name]:
-                    LOG.info(_("Polling pollster %(poll)s in the context of "
-                               "%(src)s"),
-                             dict(poll=pollster.name, src=source_name))
-                    pollster_resources = None
-                    if pollster.obj.default_discovery:
-                        pollster_resources = self.manager.discover(
-                            [pollster.obj.default_discovery], discovery_cache)
-                    key = Resources.key(source_name, pollster)
-                    source_resources = list(
-                        self.resources[key].get(discovery_cache))
-                    polling_resources = (source_resources or
-                                         pollster_resources)
-
-                    try:
-                        samples = list(pollster.obj.get_samples(
-                            manager=self.manager,
-                            cache=cache,
-                            resources=polling_resources
-                        ))
-                        publisher(samples)
-                    except Exception as err:
-                        LOG.warning(_(
-                            'Continue after error from %(name)s: %(error)s')
-                            % ({'name': pollster.name, 'error': err}),
-                            exc_info=True)
+            for pollster in self.pollster_matches[source_name]:
+                pollster_resources = None
+                if pollster.obj.default_discovery:
+                    pollster_resources = self.manager.discover(
+                        [pollster.obj.default_discovery], discovery_cache)
+                key = Resources.key(source_name, pollster)
+                source_resources = list(
+                    self.resources[key].get(discovery_cache))
+                polls.append((source_name, pollster,
+                              source_resources or pollster_resources))
+        cache[plugin_base.CACHE_KEY_POLLSTERS] = [
+            pollster.obj for source_name, pollster, resources in polls]
+
+        batches = queue.LightQueue()
+        pool = greenpool.GreenPool(max(cfg.CONF.polling.pollster_workers, 1))
+
+        def spawn():
+            for source_name, pollster, resources in polls:
+                pool.spawn_n(self._poll, batches, source_name, pollster,
+                             cache, resources)
+
+        publishers = [(source_name, self.publishers[source_name])
+                      for source_name in self.pollster_matches]
+        with _publishing(publishers) as publish:
+            eventlet.spawn_n(spawn)
+            pending = len(polls)
+            while pending:
+                source_name, samples = batches.get()
+                if samples is None:
+                    pending -= 1
+                else:
+                    publish[source_name](samples)
+
+    def _poll(self, batches, source_name, pollster, cache, resources):
+        """Run a pollster, queuing the samples it produces in batches."""
+        LOG.info(_("Polling pollster %(poll)s in the context of %(src)s"),
+                 dict(poll=pollster.name, src=source_name))
+        batch_size = max(cfg.CONF.polling.pollster_batch_size, 1)
+        samples = []
+        timer = timeout.Timeout(cfg.CONF.polling.pollster_timeout or None)
+        try:
+            for sample in pollster.obj.get_samples(manager=self.manager,
+                                                   cache=cache,
+                                                   resources=resources):
+                samples.append(sample)
+                if len(samples) >= batch_size:
+                    batches.put((source_name, samples))
+                    samples = []
+        except timeout.Timeout as t:
+            if t is not timer:
+                raise
+            LOG.warning(_('Pollster %(name)s timed out after %(timeout)s '
+                          'seconds') %
+                        {'name': pollster.name,
+                         'timeout': cfg.CONF.polling.pollster_timeout})
+        except Exception as err:
+            LOG.warning(_(
+                'Continue after error from %(name)s: %(error)s')
+                % ({'name': pollster.name, 'error': err}),
+                exc_info=True)
+        finally:
+            timer.cancel()
+            if samples:
+                batches.put((source_name, samples))
+            batches.put((source_name, None))
+
+
+@contextlib.contextmanager
+def _publishing(publishers):
+    """Enter the publish contexts of several sources.
+
+    :param publishers: list of (source name, publish context)
+    :return: the publish functions, by source name
+    """
+    if not publishers:
+        yield {}
+        return
+    (source_name, publish_context), others = publishers[0], publishers[1:]
+    with publish_context as publish:
+        with _publishing(others) as published:
+            published[source_name] = publish
+            yield published
+
+
+class PollingScheduler(object):
+    """Run a polling task on a fixed schedule, recording its timings.
+
+    Runs are scheduled every interval seconds from the first one, each of
+    them being randomly delayed by at most jitter seconds. A run outlasting
+    the interval is counted as an overrun, the runs missed meanwhile being
+    skipped or coalesced into a single run starting immediately, depending
+    on the policy. The scheduler is called by a dynamic timer and returns
+    the number of seconds to wait for the next run.
+    """
+
+    def __init__(self, interval, run, jitter=0, policy='skip'):
+        self.interval = interval
+        self.run = run
+        self.jitter = jitter
+        self.policy = policy
+        self._next = None
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.last_duration = 0
+        self.max_duration = 0
+        self.total_duration = 0
+
+    def __call__(self):
+        start = time.time()
+        if self._next is None:
+            self._next = start
+        try:
+            self.run()
+        finally:
+            end = time.time()
+            self._record(end - start)
+        self._next += self.interval
+        if end > self._next:
+            missed = int((end - self._next) // self.interval) + 1
+            self.skipped += missed
+            LOG.warn(_('Polling every %(interval)s seconds ran for '
+                       '%(duration).2f seconds, missing %(missed)d runs '
+                       '(overrun policy: %(policy)s, %(overruns)d overruns '
+                       'and %(skipped)d runs missed in %(runs)d runs)'),
+                     {'interval': self.interval, 'duration': end - start,
+                      'missed': missed, 'policy': self.policy,
+                      'overruns': self.overruns, 'skipped': self.skipped,
+                      'runs': self.runs})
+            if self.policy == 'coalesce':
+                self._next = end
+                return 0
+            self._next += missed * self.interval
+        return self._next - end + random.uniform(0, self.jitter)
+
+    def _record(self, duration):
+        self.runs += 1
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
+        if duration > self.interval:
+            self.overruns += 1
+
+    def stats(self):
+        """Return the timings of the runs of the polling task."""
+        return {'interval': self.interval,
+                'runs': self.runs,
+                'overruns': self.overruns,
+                'skipped': self.skipped,
+                'last_duration': self.last_duration,
+                'max_duration': self.max_duration,
+                'mean_duration': (self.total_duration / self.runs
+                                  if self.runs else 0)}
+
+
+class DiscoveryCache(object):
+    """Resources discovered, shared by the polling tasks of an agent.
+
+    The resources discovered for every url are kept for the ttl of their
+    discoverer, concurrent discoveries of the same url waiting for the
+    first one. Once expired, they are discovered again before being
+    returned, or, during a grace period, returned while being discovered
+    again in the background.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._pending = {}
+        self.counters = collections.Counter()
+
+    def get(self, url, ttl, discover, grace=0):
+        """Return the resources of an url, discovering them if needed.
+
+        :param url: the discovery url
+        :param ttl: the number of seconds the resources are kept
+        :param discover: the callable discovering the resources
+        :param grace: the number of seconds after their expiry during which
+                      the resources are returned while being discovered
+                      again in the background
+        """
+        entry = self._entries.get(url)
+        now = time.time()
+        if entry is not None and entry[0] > now:
+            self.counters['hits'] += 1
+            return entry[1]
+        pending = self._pending.get(url)
+        if entry is not None and entry[0] + grace > now:
+            self.counters['stale'] += 1
+            if pending is None:
+                eventlet.spawn_n(self._refresh_in_background, url, ttl,
+                                 discover)
+            return entry[1]
+        if pending is not None:
+            self.counters['coalesced'] += 1
+            return pending.wait()
+        self.counters['misses'] += 1
+        return self._refresh(url, ttl, discover)
+
+    def _refresh(self, url, ttl, discover):
+        pending = self._pending[url] = event.Event()
+        try:
+            resources = discover()
+        except Exception as err:
+            del self._pending[url]
+            pending.send_exception(err)
+            raise
+        del self._pending[url]
+        if ttl > 0:
+            self._entries[url] = (time.time() + ttl, resources)
+        else:
+            self._entries.pop(url, None)
+        pending.send(resources)
+        return resources
+
+    def _refresh_in_background(self, url, ttl, discover):
+        try:
+            self._refresh(url, ttl, discover)
+        except Exception as err:
+            LOG.exception(_('Unable to discover resources: %s') % err)
+
+    def stats(self):
+        """Return the size and the counters of the cache."""
+        stats = dict((k, self.counters[k]) for k in
+                     ('hits', 'misses', 'stale', 'coalesced'))
+        stats['size'] = len(self._entries)
+        return stats
 
 
 class AgentManager(os_service.Service):
@@ -173,6 +450,8 @@ class AgentManager(os_service.Service):
         self.extensions = list(itertools.chain(*list(extensions)))
 
         self.discovery_manager = self._extensions('discover')
+        self.discovery_cache = DiscoveryCache()
+        self.schedulers = {}
         self.context = context.RequestContext('admin', 'admin', is_admin=True)
         self.partition_coordinator = coordination.PartitionCoordinator()
 
@@ -235,13 +514,45 @@ class AgentManager(os_service.Service):
         # allow time for coordination if necessary
         delay_start = self.partition_coordinator.is_active()
 
+        conf = cfg.CONF.polling
         for interval, task in six.iteritems(self.setup_polling_tasks()):
-            self.tg.add_timer(interval,
-                              self.interval_task,
-                              initial_delay=interval if delay_start else None,
-                              task=task)
+            scheduler = PollingScheduler(
+                interval, functools.partial(self.interval_task, task),
+                jitter=interval * max(conf.polling_jitter, 0),
+                policy=conf.overrun_policy)
+            self.schedulers[interval] = scheduler
+            initial_delay = interval if delay_start else 0
+            if conf.spread_polling:
+                initial_delay += self._phase(interval)
+            self.tg.add_dynamic_timer(scheduler,
+                                      initial_delay=initial_delay or None)
         self.tg.add_timer(cfg.CONF.coordination.heartbeat,
                           self.partition_coordinator.heartbeat)
+        if conf.polling_stats_interval > 0:
+            self.tg.add_timer(conf.polling_stats_interval,
+                              self.log_polling_stats,
+                              initial_delay=conf.polling_stats_interval)
+
+    def _phase(self, interval):
+        """Return the offset of the polling of this agent in an interval."""
+        key = '%s-%s-%s' % (cfg.CONF.host, self.group_prefix, interval)
+        digest = int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+        return digest % (interval * 1000) / 1000.0
+
+    def polling_stats(self):
+        """Return the timings of every polling task, by interval."""
+        return dict((interval, scheduler.stats())
+                    for interval, scheduler in six.iteritems(self.schedulers))
+
+    def log_polling_stats(self):
+        """Log the timings of the polling tasks and the discovery cache."""
+        for interval, stats in sorted(six.iteritems(self.polling_stats())):
+            LOG.info(_('Polling every %(interval)s seconds: %(runs)d runs, '
+                       '%(overruns)d overruns, %(skipped)d runs missed, '
+                       'last %(last_duration).2f seconds, max '
+                       '%(max_duration).2f seconds, mean %(mean_duration).2f '
+                       'seconds'), stats)
+        LOG.info(_('Discovery cache: %s'), self.discovery_cache.stats())
 
     @staticmethod
     def interval_task(task):
@@ -258,6 +569,16 @@ class AgentManager(os_service.Service):
                 return d.obj
         return None
 
+    @staticmethod
+    def _discovery_ttl(name):
+        conf = cfg.CONF.polling
+        try:
+            return int(conf.discovery_cache_ttls.get(
+                name, conf.discovery_cache_ttl))
+        except ValueError:
+            LOG.warning(_('Invalid discovery cache ttl of %s') % name)
+            return conf.discovery_cache_ttl
+
     def discover(self, discovery=None, discovery_cache=None):
         resources = []
         discovery = discovery or []
@@ -269,7 +590,10 @@ class AgentManager(os_service.Service):
             discoverer = self._discoverer(name)
             if discoverer:
                 try:
-                    discovered = discoverer.discover(self, param)
+                    discovered = self.discovery_cache.get(
+                        url, self._discovery_ttl(name),
+                        functools.partial(discoverer.discover, self, param),
+                        cfg.CONF.polling.discovery_stale_grace)
                     partitioned = self.partition_coordinator.extract_my_subset(
                         self.construct_group_id(discoverer.group_id),
                         discovered)
@@ -39,6 +39,9 @@ LOG = log.getLogger(__name__)
 ExchangeTopics = collections.namedtuple('ExchangeTopics',
                                         ['exchange', 'topics'])
 
+# key of the pollsters run by the polling task in the cache of the pollsters
+CACHE_KEY_POLLSTERS = 'pollsters'
+
 
 def _get_keystone():
     try:
@@ -175,11 +178,9 @@ class NotificationBase(PluginBase):
             return
 
         if self.requeue:
-            meters = [
-                utils.meter_message_from_counter(
-                    sample, cfg.CONF.publisher.metering_secret)
-                for sample in self.process_notification(notification)
-            ]
+            meters = utils.meter_messages_from_counters(
+                list(self.process_notification(notification)),
+                cfg.CONF.publisher.metering_secret)
             for notifier in self.transporter:
                 notifier.sample(context.to_dict(),
                                 event_type='ceilometer.pipeline',
@@ -216,7 +217,8 @@ class PollsterBase(PluginBase):
         :param cache: A dictionary to allow pollsters to pass data
                       between themselves when recomputing it would be
                       expensive (e.g., asking another service for a
-                      list of objects).
+                      list of objects). The pollsters run by the
+                      polling task are listed under CACHE_KEY_POLLSTERS.
         :param resources: A list of resources the pollster will get data
                           from. It's up to the specific pollster to decide
                           how to use it. It is usually supplied by a discovery,
@@ -15,18 +15,24 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import socket
+import threading
+import time
 
 import msgpack
 from oslo.config import cfg
 import oslo.messaging
 from oslo.utils import units
+from six.moves import queue
 
 from ceilometer import dispatcher
 from ceilometer import messaging
 from ceilometer.i18n import _, _LE
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import service as os_service
+from ceilometer.publisher import file as file_publisher
+from ceilometer.publisher import utils as publisher_utils
 
 OPTS = [
     cfg.StrOpt('udp_address',
@@ -36,6 +42,40 @@ OPTS = [
     cfg.IntOpt('udp_port',
                default=4952,
                help='Port to which the UDP socket is bound.'),
+    cfg.IntOpt('udp_queue_size',
+               default=10000,
+               help='Number of datagrams received on the UDP socket queued '
+               'for dispatching, the datagrams received when the queue is '
+               'full are dropped.'),
+    cfg.IntOpt('udp_batch_size',
+               default=100,
+               help='Maximum number of samples received on the UDP socket '
+               'dispatched together.'),
+    cfg.FloatOpt('udp_batch_timeout',
+                 default=0.5,
+                 help='Maximum number of seconds a sample received on the UDP '
+                 'socket waits for a batch to fill before being dispatched.'),
+    cfg.IntOpt('udp_stats_interval',
+               default=60,
+               help='Number of seconds between two logs of the counters of '
+               'datagrams received, dropped, decoded and dispatched.'),
+    cfg.IntOpt('batch_size',
+               default=1,
+               help='Number of samples received from the message bus '
+               'dispatched together, their messages being acknowledged once '
+               'the batch is dispatched. The batches can not hold more '
+               'messages than are processed concurrently by the listeners. '
+               '1 dispatches every message on its own.'),
+    cfg.FloatOpt('batch_timeout',
+                 default=0.1,
+                 help='Maximum number of seconds a message received from the '
+                 'message bus waits for a batch to fill before being '
+                 'dispatched.'),
+    cfg.ListOpt('trusted_transports',
+                default=[],
+                help='Messaging transports, such as the in-process fake '
+                'transport, whose samples are dispatched without verifying '
+                'their signature.'),
     cfg.BoolOpt('requeue_sample_on_dispatcher_error',
                 default=False,
                 help='Requeue the sample on the collector sample queue '
@@ -53,14 +93,86 @@ cfg.CONF.import_opt('metering_topic', 'ceilometer.publisher.messaging',
 LOG = log.getLogger(__name__)
 
 
+class _Batch(object):
+    def __init__(self):
+        self.samples = []
+        self.closed = False
+        self.done = threading.Event()
+        self.error = None
+
+
+class SampleBatcher(object):
+    """Dispatch together the samples added by concurrent callers.
+
+    Every caller blocks until the batch holding its samples is dispatched,
+    and gets the exception raised by the dispatch if any, so that the
+    messages are acknowledged or requeued only once stored. A batch is
+    dispatched once it holds size samples, or by its first caller once
+    timeout seconds have passed.
+    """
+
+    def __init__(self, dispatch, size, timeout):
+        self.dispatch = dispatch
+        self.size = size
+        self.timeout = timeout
+        self._batch = None
+        self._lock = threading.Lock()
+
+    def add(self, samples):
+        with self._lock:
+            batch = self._batch
+            first = batch is None
+            if first:
+                batch = self._batch = _Batch()
+            batch.samples.extend(samples)
+            full = len(batch.samples) >= self.size
+        if full:
+            self._flush(batch)
+        elif first:
+            batch.done.wait(self.timeout)
+            self._flush(batch)
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    def _flush(self, batch):
+        with self._lock:
+            if batch.closed:
+                return
+            batch.closed = True
+            if self._batch is batch:
+                self._batch = None
+        try:
+            self.dispatch(batch.samples)
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+
 class CollectorService(os_service.Service):
     """Listener for the collector service."""
+    def __init__(self, *args, **kwargs):
+        super(CollectorService, self).__init__(*args, **kwargs)
+        self.batcher = None
+        self.trusted = False
+
     def start(self):
         """Bind the UDP socket and handle incoming data."""
         # ensure dispatcher is configured before starting other services
         self.dispatcher_manager = dispatcher.load_dispatcher_manager()
+        if (cfg.CONF.dispatcher_queue.queue_size > 0 and
+                cfg.CONF.collector.requeue_sample_on_dispatcher_error):
+            LOG.warn(_('The samples are acknowledged once queued for the '
+                       'dispatchers when dispatcher_queue.queue_size is set, '
+                       'requeue_sample_on_dispatcher_error has no effect'))
         self.rpc_server = None
         self.notification_server = None
+        self.batcher = None
+        if cfg.CONF.collector.batch_size > 1:
+            self.batcher = SampleBatcher(self._record_batch,
+                                         cfg.CONF.collector.batch_size,
+                                         cfg.CONF.collector.batch_timeout)
         super(CollectorService, self).start()
 
         if cfg.CONF.collector.udp_address:
@@ -69,6 +181,10 @@ class CollectorService(os_service.Service):
         allow_requeue = cfg.CONF.collector.requeue_sample_on_dispatcher_error
         transport = messaging.get_transport(optional=True)
         if transport:
+            url = oslo.messaging.TransportURL.parse(cfg.CONF,
+                                                    cfg.CONF.transport_url)
+            self.trusted = (url.transport in
+                            cfg.CONF.collector.trusted_transports)
             self.rpc_server = messaging.get_rpc_server(
                 transport, cfg.CONF.publisher_rpc.metering_topic, self)
 
@@ -88,25 +204,93 @@ class CollectorService(os_service.Service):
     def start_udp(self):
         udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            # NOTE: let the collector workers share the port, the kernel
+            # balancing the datagrams between their sockets.
+            udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         udp.bind((cfg.CONF.collector.udp_address,
                   cfg.CONF.collector.udp_port))
 
         self.udp_run = True
+        self.udp_queue = queue.Queue(cfg.CONF.collector.udp_queue_size)
+        self.udp_stats = collections.Counter()
+        self.tg.add_timer(cfg.CONF.collector.udp_stats_interval,
+                          self._log_udp_stats)
+        # NOTE: the socket is drained by its own thread so that datagrams
+        # are still received while a batch is being dispatched.
+        self.tg.add_thread(self._receive_udp, udp)
+        self.tg.add_thread(self._dispatch_udp)
+
+    def _receive_udp(self, udp):
         while self.udp_run:
             # NOTE(jd) Arbitrary limit of 64K because that ought to be
             # enough for anybody.
             data, source = udp.recvfrom(64 * units.Ki)
+            self.udp_stats['received'] += 1
+            try:
+                self.udp_queue.put_nowait((data, source))
+            except queue.Full:
+                self.udp_stats['dropped'] += 1
+                LOG.debug(_("UDP: Queue full, dropping data sent by %s"),
+                          str(source))
+
+    def _dispatch_udp(self):
+        """Decode the queued datagrams and dispatch them in batches.
+
+        A batch is dispatched once it holds udp_batch_size samples or once
+        its first sample has waited for udp_batch_timeout seconds.
+        """
+        batch_size = cfg.CONF.collector.udp_batch_size
+        batch_timeout = cfg.CONF.collector.udp_batch_timeout
+        batch = []
+        deadline = None
+        while self.udp_run or not self.udp_queue.empty():
+            if deadline is None:
+                timeout = batch_timeout
+            else:
+                timeout = max(0, deadline - time.time())
             try:
-                sample = msgpack.loads(data, encoding='utf-8')
-            except Exception:
-                LOG.warn(_("UDP: Cannot decode data sent by %s"), str(source))
+                data, source = self.udp_queue.get(timeout=timeout)
+            except queue.Empty:
+                pass
             else:
-                try:
-                    LOG.debug(_("UDP: Storing %s"), str(sample))
-                    self.dispatcher_manager.map_method('record_metering_data',
-                                                       sample)
-                except Exception:
-                    LOG.exception(_("UDP: Unable to store meter"))
+                samples = self._decode_udp(data, source)
+                if samples and not batch:
+                    deadline = time.time() + batch_timeout
+                batch.extend(samples)
+            if batch and (len(batch) >= batch_size or
+                          time.time() >= deadline):
+                self._record_udp(batch)
+                batch = []
+                deadline = None
+        if batch:
+            self._record_udp(batch)
+
+    def _decode_udp(self, data, source):
+        try:
+            sample = msgpack.loads(data, encoding='utf-8')
+        except Exception:
+            LOG.warn(_("UDP: Cannot decode data sent by %s"), str(source))
+            return []
+        self.udp_stats['decoded'] += 1
+        return sample if isinstance(sample, list) else [sample]
+
+    def _record_udp(self, samples):
+        try:
+            LOG.debug(_("UDP: Storing %s"), str(samples))
+            self.dispatcher_manager.map_method('record_metering_data',
+                                               samples)
+        except Exception:
+            LOG.exception(_("UDP: Unable to store meter"))
+        else:
+            self.udp_stats['dispatched'] += len(samples)
+
+    def _log_udp_stats(self):
+        stats = dict((k, self.udp_stats[k]) for k in
+                     ('received', 'dropped', 'decoded', 'dispatched'))
+        LOG.info(_("UDP: %(received)d datagrams received, %(dropped)d "
+                   "dropped, %(decoded)d decoded, %(dispatched)d samples "
+                   "dispatched"), stats)
 
     def stop(self):
         self.udp_run = False
@@ -114,6 +298,7 @@ class CollectorService(os_service.Service):
             self.rpc_server.stop()
         if self.notification_server:
             self.notification_server.stop()
+        file_publisher.close_sinks()
         super(CollectorService, self).stop()
 
     def sample(self, ctxt, publisher_id, event_type, payload, metadata):
@@ -124,8 +309,7 @@ class CollectorService(os_service.Service):
 
         """
         try:
-            self.dispatcher_manager.map_method('record_metering_data',
-                                               data=payload)
+            self._record_metering_data(payload)
         except Exception:
             if cfg.CONF.collector.requeue_sample_on_dispatcher_error:
                 LOG.exception(_LE("Dispatcher failed to handle the sample, "
@@ -139,4 +323,20 @@ class CollectorService(os_service.Service):
         When the notification messages are re-published through the
         RPC publisher, this method receives them for processing.
         """
-        self.dispatcher_manager.map_method('record_metering_data', data=data)
+        self._record_metering_data(data)
+
+    def _record_metering_data(self, data):
+        if self.batcher is None:
+            if self.trusted:
+                data = publisher_utils.TrustedMessages(
+                    data if isinstance(data, list) else [data])
+            self.dispatcher_manager.map_method('record_metering_data',
+                                               data=data)
+        else:
+            self.batcher.add(data if isinstance(data, list) else [data])
+
+    def _record_batch(self, samples):
+        if self.trusted:
+            samples = publisher_utils.TrustedMessages(samples)
+        self.dispatcher_manager.map_method('record_metering_data',
+                                           data=samples)
@@ -15,31 +15,158 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import datetime
+
 from oslo.config import cfg
+from oslo.utils import timeutils
 
+import ceilometer
 from ceilometer.agent import plugin_base
+from ceilometer.compute.virt import inspector as virt_inspector
+from ceilometer.i18n import _
 from ceilometer import nova_client
+from ceilometer.openstack.common import log
 
 OPTS = [
     cfg.BoolOpt('workload_partitioning',
                 default=False,
                 help='Enable work-load partitioning, allowing multiple '
-                     'compute agents to be run simultaneously.')
+                     'compute agents to be run simultaneously.'),
+    cfg.StrOpt('instance_discovery_method',
+               default='incremental',
+               choices=['naive', 'incremental'],
+               help='Method used to discover the instances of the host: '
+                    'naive lists them all from nova at every polling '
+                    'cycle, incremental keeps them in a local inventory '
+                    'updated with the instances changed since the last '
+                    'cycle.'),
+    cfg.IntOpt('resync_interval',
+               default=3600,
+               help='Number of seconds after which the inventory of the '
+                    'incremental discovery is rebuilt from all the '
+                    'instances of the host. 0 means never.'),
+    cfg.IntOpt('min_resync_interval',
+               default=300,
+               help='Minimum number of seconds between two rebuilds of the '
+                    'inventory of the incremental discovery triggered by '
+                    'the hypervisor cross check.'),
+    cfg.IntOpt('changes_since_margin',
+               default=60,
+               help='Number of seconds by which the incremental discovery '
+                    'moves back the time of its previous query when asking '
+                    'nova for the instances changed since then, covering '
+                    'the clock skew between the agent and nova.'),
+    cfg.BoolOpt('hypervisor_cross_check',
+                default=True,
+                help='Check the inventory of the incremental discovery '
+                     'against the instances defined on the hypervisor, '
+                     'discovering only these, evicting the other ones, such '
+                     'as the instances migrated to another host, and '
+                     'rebuilding the inventory when one of them is missing '
+                     'from it. The instances still missing once rebuilt, '
+                     'not managed by nova, are ignored until the next '
+                     'resync.'),
 ]
 cfg.CONF.register_opts(OPTS, group='compute')
 
+LOG = log.getLogger(__name__)
+
+
+def _is_deleted(instance):
+    return (getattr(instance, 'OS-EXT-STS:vm_state', None) == 'deleted' or
+            getattr(instance, 'status', None) == 'DELETED')
+
 
 class InstanceDiscovery(plugin_base.DiscoveryBase):
     def __init__(self):
         super(InstanceDiscovery, self).__init__()
         self.nova_cli = nova_client.Client()
+        self.instances = collections.OrderedDict()
+        self.last_run = None
+        self.last_resync = None
+        # ids of the instances of the hypervisor unknown to nova
+        self.unknown_ids = set()
+        self._inspector = None
 
     def discover(self, manager, param=None):
         """Discover resources to monitor."""
-        instances = self.nova_cli.instance_get_all_by_host(cfg.CONF.host)
+        if cfg.CONF.compute.instance_discovery_method == 'naive':
+            instances = self.nova_cli.instance_get_all_by_host(
+                cfg.CONF.host)
+        else:
+            instances = self._discover_incrementally()
         return [i for i in instances
                 if getattr(i, 'OS-EXT-STS:vm_state', None) != 'error']
 
+    def _discover_incrementally(self):
+        now = timeutils.utcnow()
+        interval = cfg.CONF.compute.resync_interval
+        resync = (self.last_run is None or
+                  (interval > 0 and
+                   timeutils.delta_seconds(self.last_resync, now) >=
+                   interval))
+        self._update(now, resync)
+        if not cfg.CONF.compute.hypervisor_cross_check:
+            return list(self.instances.values())
+
+        local_ids = self._list_local_instance_ids()
+        if local_ids is None:
+            return list(self.instances.values())
+        unknown_ids = local_ids - set(self.instances) - self.unknown_ids
+        if (unknown_ids and not resync and
+                timeutils.delta_seconds(self.last_resync, now) >=
+                cfg.CONF.compute.min_resync_interval):
+            LOG.debug('Instances running on the hypervisor are unknown, '
+                      'rebuilding the inventory')
+            self._update(now, True)
+            resync = True
+        if resync:
+            # NOTE: the instances nova does not know, e.g. the domains not
+            # managed by nova, are ignored until the next resync.
+            self.unknown_ids = local_ids - set(self.instances)
+        for instance_id in list(self.instances):
+            if instance_id not in local_ids:
+                LOG.debug('Instance %s is not on the hypervisor, evicting it '
+                          'from the inventory', instance_id)
+                del self.instances[instance_id]
+        return list(self.instances.values())
+
+    def _update(self, now, resync):
+        """Update the inventory from the instances changed since last run.
+
+        :param now: the time the update started
+        :param resync: whether to rebuild the inventory from all instances
+        """
+        since = None
+        if not resync:
+            since = timeutils.isotime(self.last_run - datetime.timedelta(
+                seconds=cfg.CONF.compute.changes_since_margin))
+        instances = self.nova_cli.instance_get_all_by_host(cfg.CONF.host,
+                                                           since)
+        if resync:
+            self.instances.clear()
+            self.last_resync = now
+        for instance in instances:
+            if _is_deleted(instance):
+                self.instances.pop(instance.id, None)
+            else:
+                self.instances[instance.id] = instance
+        self.last_run = now
+
+    def _list_local_instance_ids(self):
+        if self._inspector is None:
+            self._inspector = virt_inspector.get_hypervisor_inspector()
+        try:
+            return set(self._inspector.list_instance_ids())
+        except ceilometer.NotImplementedError:
+            LOG.debug('%s does not list the instances of the hypervisor',
+                      self._inspector.__class__.__name__)
+        except Exception as err:
+            LOG.warn(_('Unable to list the instances of the hypervisor: '
+                       '%s'), err)
+        return None
+
     @property
     def group_id(self):
         if cfg.CONF.compute.workload_partitioning:
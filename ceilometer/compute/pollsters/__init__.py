@@ -33,6 +33,21 @@ class BaseComputePollster(plugin_base.PollsterBase):
             BaseComputePollster._inspector = inspector
         return inspector
 
+    CACHE_KEY_INSPECTOR = 'inspector'
+
+    def _get_inspector(self, cache):
+        """Return the inspector shared by the pollsters of a polling cycle.
+
+        The snapshot of the statistics of every instance taken by the
+        inspector, if any, is kept in the cache of the cycle.
+        """
+        inspector = cache.get(self.CACHE_KEY_INSPECTOR)
+        if inspector is None:
+            inspector = self.inspector.snapshot()
+            if inspector is not self.inspector:
+                cache[self.CACHE_KEY_INSPECTOR] = inspector
+        return inspector
+
     @property
     def default_discovery(self):
         return 'local_instances'
@@ -30,10 +30,11 @@ LOG = log.getLogger(__name__)
 class CPUPollster(pollsters.BaseComputePollster):
 
     def get_samples(self, manager, cache, resources):
+        inspector = self._get_inspector(cache)
         for instance in resources:
             LOG.debug(_('checking instance %s'), instance.id)
             try:
-                cpu_info = self.inspector.inspect_cpus(instance)
+                cpu_info = inspector.inspect_cpus(instance)
                 LOG.debug(_("CPUTIME USAGE: %(instance)s %(time)d"),
                           {'instance': instance.__dict__,
                            'time': cpu_info.time})
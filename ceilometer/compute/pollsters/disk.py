@@ -106,11 +106,12 @@ class _Base(pollsters.BaseComputePollster):
         """Return one or more Sample."""
 
     def get_samples(self, manager, cache, resources):
+        inspector = self._get_inspector(cache)
         for instance in resources:
             instance_name = util.instance_name(instance)
             try:
                 c_data = self._populate_cache(
-                    self.inspector,
+                    inspector,
                     cache,
                     instance,
                 )
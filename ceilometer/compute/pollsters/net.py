@@ -90,13 +90,14 @@ class _Base(pollsters.BaseComputePollster):
 
     def get_samples(self, manager, cache, resources):
         self._inspection_duration = self._record_poll_time()
+        inspector = self._get_inspector(cache)
         for instance in resources:
             instance_name = util.instance_name(instance)
             LOG.debug(_('checking net info for instance %s'), instance.id)
             try:
                 vnics = self._get_vnics_for_instance(
                     cache,
-                    self.inspector,
+                    inspector,
                     instance,
                 )
                 for vnic, info in vnics:
@@ -147,6 +147,21 @@ class InstanceNotFoundException(InspectorException):
 #
 class Inspector(object):
 
+    def snapshot(self):
+        """Return the inspector to use for a polling cycle.
+
+        Inspectors able to collect the statistics of every instance in one
+        pass return an inspector serving them, the others return themselves.
+        """
+        return self
+
+    def list_instance_ids(self):
+        """List the instances running on the hypervisor.
+
+        :return: the UUIDs of the instances
+        """
+        raise ceilometer.NotImplementedError
+
     def inspect_cpus(self, instance):
         """Inspect the CPU statistics for an instance.
 
@@ -16,6 +16,11 @@
 # under the License.
 """Implementation of Inspector abstraction for libvirt."""
 
+import collections
+import itertools
+import time
+
+from eventlet import patcher
 from lxml import etree
 from oslo.config import cfg
 from oslo.utils import units
@@ -39,11 +44,56 @@ OPTS = [
                default='',
                help='Override the default libvirt URI '
                     '(which is dependent on libvirt_type).'),
+    cfg.BoolOpt('libvirt_bulk_stats',
+                default=True,
+                help='Collect the statistics of every domain of the host '
+                     'in one pass per polling cycle, using the all-domain '
+                     'statistics API of libvirt when available.'),
+    cfg.IntOpt('libvirt_devices_cache_ttl',
+               default=3600,
+               help='Number of seconds the interfaces and disks parsed from '
+                    'the XML description of a domain are cached. They are '
+                    'only cached while the lifecycle and device events of '
+                    'libvirt are received, see libvirt_events. 0 disables '
+                    'the cache.'),
+    cfg.BoolOpt('libvirt_events',
+                default=True,
+                help='Invalidate the cached devices of a domain on its '
+                     'lifecycle and device events, running the libvirt '
+                     'event loop in a native thread.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(OPTS)
 
+# Named tuple representing the devices of a domain.
+#
+# interfaces: the list of the virt_inspector.Interface of the domain
+# disks: the list of the virt_inspector.Disk of the domain
+#
+DomainDevices = collections.namedtuple('DomainDevices',
+                                       ['interfaces', 'disks'])
+
+
+_event_loop = None
+
+
+def _start_event_loop():
+    """Run the default libvirt event loop in a native thread, once."""
+    global _event_loop
+    if _event_loop is None:
+        libvirt.virEventRegisterDefaultImpl()
+        threading = patcher.original('threading')
+        _event_loop = threading.Thread(target=_run_event_loop,
+                                       name='libvirt-events')
+        _event_loop.daemon = True
+        _event_loop.start()
+
+
+def _run_event_loop():
+    while True:
+        libvirt.virEventRunDefaultImpl()
+
 
 def retry_on_disconnect(function):
     def decorator(self, *args, **kwargs):
@@ -68,6 +118,21 @@ class LibvirtInspector(virt_inspector.Inspector):
     def __init__(self):
         self.uri = self._get_uri()
         self.connection = None
+        self.bulk_stats = CONF.libvirt_bulk_stats
+        # NOTE: the devices of every domain are cached by UUID along the ID
+        # of the domain, which changes every time it is started.
+        self._devices = {}
+        # NOTE: the devices are invalidated by the libvirt event thread,
+        # possibly while they are being parsed. Every invalidation bumps
+        # the generation of the devices, which are only cached if their
+        # generation did not change meanwhile.
+        self._devices_lock = patcher.original('threading').Lock()
+        self._generation = itertools.count(1)
+        self._generations = {}
+        self._epoch = 0
+        # whether all the events changing the devices are received
+        self._devices_watched = False
+        self.devices_cache = collections.Counter()
 
     def _get_uri(self):
         return CONF.libvirt_uri or self.per_type_uris.get(CONF.libvirt_type,
@@ -78,11 +143,74 @@ class LibvirtInspector(virt_inspector.Inspector):
             global libvirt
             if libvirt is None:
                 libvirt = __import__('libvirt')
+            use_events = (CONF.libvirt_events and
+                          CONF.libvirt_devices_cache_ttl > 0)
+            if use_events:
+                _start_event_loop()
             LOG.debug('Connecting to libvirt: %s', self.uri)
             self.connection = libvirt.openReadOnly(self.uri)
+            # NOTE: the devices cached for the former connection may have
+            # changed meanwhile.
+            self._devices_watched = False
+            self._invalidate_devices()
+            if use_events:
+                self._devices_watched = self._register_events(
+                    self.connection)
+            if (CONF.libvirt_devices_cache_ttl > 0 and
+                    not self._devices_watched):
+                LOG.info(_('The devices of the domains are not cached, '
+                           'their events are not received from libvirt'))
 
         return self.connection
 
+    def _register_events(self, connection):
+        """Register to the events changing the devices of the domains.
+
+        :return: whether all of them are registered
+        """
+        registered = True
+        for name in ('VIR_DOMAIN_EVENT_ID_LIFECYCLE',
+                     'VIR_DOMAIN_EVENT_ID_DEVICE_ADDED',
+                     'VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED'):
+            event_id = getattr(libvirt, name, None)
+            if event_id is None:
+                LOG.warn(_('The %s events are not provided by libvirt'),
+                         name)
+                registered = False
+                continue
+            try:
+                connection.domainEventRegisterAny(
+                    None, event_id, self._on_domain_event, None)
+            except libvirt.libvirtError as e:
+                LOG.warn(_('Failed to register to the %(event)s events of '
+                           'libvirt: %(error)s'), {'event': name, 'error': e})
+                registered = False
+        return registered
+
+    def _on_domain_event(self, connection, domain, *args):
+        self._invalidate_devices([domain.UUIDString()])
+
+    def _invalidate_devices(self, uuids=None):
+        """Remove the cached devices of some domains, or of all of them."""
+        with self._devices_lock:
+            if uuids is None:
+                uuids = list(self._devices)
+                self._epoch = next(self._generation)
+                self._generations.clear()
+            else:
+                for uuid in uuids:
+                    self._generations[uuid] = next(self._generation)
+            for uuid in uuids:
+                if self._devices.pop(uuid, None) is not None:
+                    self.devices_cache['invalidations'] += 1
+
+    def devices_cache_stats(self):
+        """Return the size and the counters of the cache of devices."""
+        stats = dict((k, self.devices_cache[k])
+                     for k in ('hits', 'misses', 'invalidations'))
+        stats['size'] = len(self._devices)
+        return stats
+
     @retry_on_disconnect
     def _lookup_by_uuid(self, instance):
         instance_name = util.instance_name(instance)
@@ -105,23 +233,11 @@ class LibvirtInspector(virt_inspector.Inspector):
                                'ex': ex})
             raise virt_inspector.InstanceNotFoundException(msg)
 
-    def inspect_cpus(self, instance):
-        domain = self._lookup_by_uuid(instance)
-        dom_info = domain.info()
-        return virt_inspector.CPUStats(number=dom_info[3], time=dom_info[4])
-
-    def inspect_vnics(self, instance):
-        instance_name = util.instance_name(instance)
-        domain = self._lookup_by_uuid(instance)
-        state = domain.info()[0]
-        if state == libvirt.VIR_DOMAIN_SHUTOFF:
-            LOG.warn(_('Failed to inspect vnics of instance Name '
-                       '%(instance_name)s UUID %(instance_uuid)s, '
-                       'domain is in state of SHUTOFF'),
-                     {'instance_name': instance_name,
-                      'instance_uuid': instance.id})
-            return
-        tree = etree.fromstring(domain.XMLDesc(0))
+    @staticmethod
+    def _parse_devices(xml):
+        """Return the devices of a domain from its XML description."""
+        tree = etree.fromstring(xml)
+        interfaces = []
         for iface in tree.findall('devices/interface'):
             target = iface.find('target')
             if target is not None:
@@ -139,9 +255,87 @@ class LibvirtInspector(virt_inspector.Inspector):
 
             params = dict((p.get('name').lower(), p.get('value'))
                           for p in iface.findall('filterref/parameter'))
-            interface = virt_inspector.Interface(name=name, mac=mac_address,
-                                                 fref=fref, parameters=params)
-            dom_stats = domain.interfaceStats(name)
+            interfaces.append(virt_inspector.Interface(
+                name=name, mac=mac_address, fref=fref, parameters=params))
+        disks = [virt_inspector.Disk(device=device) for device in filter(
+            bool,
+            [disk.get("dev")
+             for disk in tree.findall('devices/disk/target')])]
+        return DomainDevices(interfaces=interfaces, disks=disks)
+
+    def _get_devices(self, domain):
+        ttl = CONF.libvirt_devices_cache_ttl
+        if ttl <= 0 or not self._devices_watched:
+            return self._parse_devices(domain.XMLDesc(0))
+        uuid = domain.UUIDString()
+        domain_id = domain.ID()
+        now = time.time()
+        with self._devices_lock:
+            entry = self._devices.get(uuid)
+            generation = (self._epoch, self._generations.get(uuid))
+        if entry is not None and entry[0] == domain_id and entry[1] > now:
+            self.devices_cache['hits'] += 1
+            return entry[2]
+        self.devices_cache['misses'] += 1
+        devices = self._parse_devices(domain.XMLDesc(0))
+        with self._devices_lock:
+            if generation == (self._epoch, self._generations.get(uuid)):
+                self._devices[uuid] = (domain_id, now + ttl, devices)
+        return devices
+
+    def snapshot(self):
+        if not self.bulk_stats:
+            return self
+        try:
+            domain_stats = self._get_all_domain_stats()
+        except AttributeError:
+            LOG.info(_('The all-domain statistics API is not provided by '
+                       'libvirt, inspecting every instance separately'))
+            self.bulk_stats = False
+            return self
+        except Exception as err:
+            LOG.warn(_('Failed to collect the statistics of every domain, '
+                       'inspecting every instance separately: %s'), err)
+            return self
+        snapshot = LibvirtSnapshot(self, domain_stats)
+        self._invalidate_devices(set(self._devices) - snapshot.uuids())
+        LOG.debug('Cache of the libvirt domain devices: %s',
+                  self.devices_cache_stats())
+        return snapshot
+
+    @retry_on_disconnect
+    def _get_all_domain_stats(self):
+        stats = (libvirt.VIR_DOMAIN_STATS_STATE |
+                 libvirt.VIR_DOMAIN_STATS_CPU_TOTAL |
+                 libvirt.VIR_DOMAIN_STATS_VCPU |
+                 libvirt.VIR_DOMAIN_STATS_BALLOON |
+                 libvirt.VIR_DOMAIN_STATS_INTERFACE |
+                 libvirt.VIR_DOMAIN_STATS_BLOCK)
+        return self._get_connection().getAllDomainStats(stats)
+
+    @retry_on_disconnect
+    def list_instance_ids(self):
+        return [domain.UUIDString()
+                for domain in self._get_connection().listAllDomains(0)]
+
+    def inspect_cpus(self, instance):
+        domain = self._lookup_by_uuid(instance)
+        dom_info = domain.info()
+        return virt_inspector.CPUStats(number=dom_info[3], time=dom_info[4])
+
+    def inspect_vnics(self, instance):
+        instance_name = util.instance_name(instance)
+        domain = self._lookup_by_uuid(instance)
+        state = domain.info()[0]
+        if state == libvirt.VIR_DOMAIN_SHUTOFF:
+            LOG.warn(_('Failed to inspect vnics of instance Name '
+                       '%(instance_name)s UUID %(instance_uuid)s, '
+                       'domain is in state of SHUTOFF'),
+                     {'instance_name': instance_name,
+                      'instance_uuid': instance.id})
+            return
+        for interface in self._get_devices(domain).interfaces:
+            dom_stats = domain.interfaceStats(interface.name)
             stats = virt_inspector.InterfaceStats(rx_bytes=dom_stats[0],
                                                   rx_packets=dom_stats[1],
                                                   tx_bytes=dom_stats[4],
@@ -159,13 +353,8 @@ class LibvirtInspector(virt_inspector.Inspector):
                      {'instance_name': instance_name,
                       'instance_uuid': instance.id})
             return
-        tree = etree.fromstring(domain.XMLDesc(0))
-        for device in filter(
-                bool,
-                [target.get("dev")
-                 for target in tree.findall('devices/disk/target')]):
-            disk = virt_inspector.Disk(device=device)
-            block_stats = domain.blockStats(device)
+        for disk in self._get_devices(domain).disks:
+            block_stats = domain.blockStats(disk.device)
             stats = virt_inspector.DiskStats(read_requests=block_stats[0],
                                              read_bytes=block_stats[1],
                                              write_requests=block_stats[2],
@@ -208,3 +397,107 @@ class LibvirtInspector(virt_inspector.Inspector):
             LOG.warn(_('Failed to inspect memory usage of %(instance_uuid)s, '
                        'can not get info from libvirt: %(error)s'),
                      {'instance_uuid': instance.id, 'error': e})
+
+
+def _device_stats(stats, prefix, fields):
+    """Return the statistics of the devices of a domain by name.
+
+    :param stats: the statistics of a domain returned by getAllDomainStats
+    :param prefix: the prefix of the devices in the statistics, net or block
+    :param fields: the fields to return for every device
+    """
+    devices = {}
+    for i in range(stats.get('%s.count' % prefix, 0)):
+        key = '%s.%d.' % (prefix, i)
+        devices[stats.get(key + 'name')] = [stats.get(key + field)
+                                            for field in fields]
+    return devices
+
+
+class LibvirtSnapshot(object):
+    """Inspector serving the statistics of every domain of the host.
+
+    The statistics are collected in one pass by the all-domain statistics
+    API of libvirt and the XML description of every domain is parsed at
+    most once. The inspections of the domains missing from the statistics
+    or shut off, and the other inspections, are delegated to the inspector.
+    """
+
+    def __init__(self, inspector, domain_stats):
+        self.inspector = inspector
+        self._stats = dict((domain.UUIDString(), (domain, stats))
+                           for domain, stats in domain_stats)
+        self._devices = {}
+
+    def __getattr__(self, name):
+        return getattr(self.inspector, name)
+
+    def uuids(self):
+        """Return the UUIDs of the domains of the snapshot."""
+        return set(self._stats)
+
+    def _get_stats(self, instance):
+        domain, stats = self._stats.get(instance.id, (None, None))
+        if stats and stats.get('state.state') != libvirt.VIR_DOMAIN_SHUTOFF:
+            return domain, stats
+        return None, None
+
+    def _get_devices(self, domain):
+        uuid = domain.UUIDString()
+        if uuid not in self._devices:
+            self._devices[uuid] = self.inspector._get_devices(domain)
+        return self._devices[uuid]
+
+    def inspect_cpus(self, instance):
+        domain, stats = self._get_stats(instance)
+        if stats is None or 'cpu.time' not in stats:
+            return self.inspector.inspect_cpus(instance)
+        return virt_inspector.CPUStats(number=stats.get('vcpu.current'),
+                                       time=stats['cpu.time'])
+
+    def inspect_vnics(self, instance):
+        domain, stats = self._get_stats(instance)
+        if stats is None:
+            return self.inspector.inspect_vnics(instance)
+        return self._inspect_vnics(domain, stats)
+
+    def _inspect_vnics(self, domain, stats):
+        net = _device_stats(stats, 'net', ['rx.bytes', 'rx.pkts',
+                                           'tx.bytes', 'tx.pkts'])
+        for interface in self._get_devices(domain).interfaces:
+            if interface.name in net:
+                rx_bytes, rx_packets, tx_bytes, tx_packets = net[
+                    interface.name]
+                yield (interface, virt_inspector.InterfaceStats(
+                    rx_bytes=rx_bytes, rx_packets=rx_packets,
+                    tx_bytes=tx_bytes, tx_packets=tx_packets))
+
+    def inspect_disks(self, instance):
+        domain, stats = self._get_stats(instance)
+        if stats is None:
+            return self.inspector.inspect_disks(instance)
+        return self._inspect_disks(domain, stats)
+
+    def _inspect_disks(self, domain, stats):
+        block = _device_stats(stats, 'block', ['rd.reqs', 'rd.bytes',
+                                               'wr.reqs', 'wr.bytes'])
+        for disk in self._get_devices(domain).disks:
+            if disk.device in block:
+                read_requests, read_bytes, write_requests, write_bytes = (
+                    block[disk.device])
+                # NOTE: the error count is not provided by the all-domain
+                # statistics, as by blockStats for the qemu driver.
+                yield (disk, virt_inspector.DiskStats(
+                    read_requests=read_requests, read_bytes=read_bytes,
+                    write_requests=write_requests, write_bytes=write_bytes,
+                    errors=-1))
+
+    def inspect_memory_usage(self, instance, duration=None):
+        domain, stats = self._get_stats(instance)
+        if (stats is None or not stats.get('balloon.available') or
+                not stats.get('balloon.unused')):
+            return self.inspector.inspect_memory_usage(instance, duration)
+        # Stat provided from libvirt is in KB, converting it to MB.
+        return virt_inspector.MemoryUsageStats(
+            usage=(stats['balloon.available'] - stats['balloon.unused']) /
+            units.Ki)
@@ -21,6 +21,7 @@ from oslo.config import cfg
 import six
 from stevedore import named
 
+from ceilometer.dispatcher import queued
 from ceilometer.i18n import _
 from ceilometer.openstack.common import log
 
@@ -50,6 +51,9 @@ def load_dispatcher_manager():
     if not list(dispatcher_manager):
         LOG.warning(_('Failed to load any dispatchers for %s'),
                     DISPATCHER_NAMESPACE)
+    if cfg.CONF.dispatcher_queue.queue_size > 0:
+        for ext in dispatcher_manager:
+            ext.obj = queued.QueuedDispatcher(ext.name, ext.obj)
     return dispatcher_manager
 
 
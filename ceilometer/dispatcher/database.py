@@ -14,6 +14,8 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import uuid
+
 from oslo.utils import timeutils
 
 from ceilometer import dispatcher
@@ -71,7 +73,10 @@ class DatabaseDispatcher(dispatcher.Base):
         if not isinstance(data, list):
             data = [data]
 
-        for meter in data:
+        meters = []
+        verified = publisher_utils.verify_signatures(
+            data, self.conf.publisher.metering_secret)
+        for meter, valid in zip(data, verified):
             LOG.debug(_(
                 'metering data %(counter_name)s '
                 'for %(resource_id)s @ %(timestamp)s: %(counter_volume)s')
@@ -79,9 +84,12 @@ class DatabaseDispatcher(dispatcher.Base):
                     'resource_id': meter['resource_id'],
                     'timestamp': meter.get('timestamp', 'NO TIMESTAMP'),
                     'counter_volume': meter['counter_volume']}))
-            if publisher_utils.verify_signature(
-                    meter,
-                    self.conf.publisher.metering_secret):
+            if valid:
+                # NOTE: the samples are shared with the other dispatchers, so
+                # they are copied before being modified. The id given to
+                # every copy lets the backends not duplicate the samples of
+                # a batch recorded again one by one.
+                meter = dict(meter, _id=uuid.uuid4().hex)
                 try:
                     # Convert the timestamp to a datetime instance.
                     # Storage engines are responsible for converting
@@ -89,15 +97,33 @@ class DatabaseDispatcher(dispatcher.Base):
                     if meter.get('timestamp'):
                         ts = timeutils.parse_isotime(meter['timestamp'])
                         meter['timestamp'] = timeutils.normalize_time(ts)
-                    self.meter_conn.record_metering_data(meter)
                 except Exception as err:
                     LOG.exception(_('Failed to record metering data: %s'),
                                   err)
+                else:
+                    meters.append(meter)
             else:
                 LOG.warning(_(
                     'message signature invalid, discarding message: %r'),
                     meter)
 
+        if not meters:
+            return
+        try:
+            self.meter_conn.record_metering_data_batch(meters)
+        except Exception as err:
+            LOG.exception(_('Failed to record a batch of %(count)d samples, '
+                            'recording them one by one: %(err)s'),
+                          {'count': len(meters), 'err': err})
+            # NOTE: fall back to per-sample calls so that a single bad
+            # sample does not cause the whole batch to be lost.
+            for meter in meters:
+                try:
+                    self.meter_conn.record_metering_data(meter)
+                except Exception as err:
+                    LOG.exception(_('Failed to record metering data: %s'),
+                                  err)
+
     def record_events(self, events):
         if not isinstance(events, list):
             events = [events]
@@ -19,8 +19,10 @@ import logging
 import logging.handlers
 
 from oslo.config import cfg
+from oslo.utils import units
 
 from ceilometer import dispatcher
+from ceilometer.publisher import file as file_publisher
 
 OPTS = [
     cfg.StrOpt('file_path',
@@ -32,6 +34,38 @@ OPTS = [
     cfg.IntOpt('backup_count',
                default=0,
                help='The max number of the files to keep.'),
+    cfg.StrOpt('format',
+               default='log',
+               choices=file_publisher.FORMATS,
+               help='Format of the records: log writes every record '
+                    'through a logging handler, json and msgpack buffer '
+                    'the records and write them as newline-delimited JSON '
+                    'or msgpack in large writes.'),
+    cfg.IntOpt('buffer_size',
+               default=units.Mi,
+               help='Number of bytes buffered before being written to the '
+                    'file, with the json and msgpack formats.'),
+    cfg.FloatOpt('flush_interval',
+                 default=1.0,
+                 help='Maximum number of seconds a record is buffered before '
+                      'being written to the file, with the json and msgpack '
+                      'formats.'),
+    cfg.IntOpt('rotate_interval',
+               default=0,
+               help='Number of seconds after which the file is rotated, '
+                    'with the json and msgpack formats. 0 only rotates the '
+                    'file once larger than max_bytes.'),
+    cfg.StrOpt('compression',
+               default='none',
+               choices=file_publisher.COMPRESSIONS,
+               help='Compression of the rotated files, with the json and '
+                    'msgpack formats. zstd requires the zstandard module.'),
+    cfg.StrOpt('fsync',
+               default='never',
+               choices=file_publisher.FSYNC_POLICIES,
+               help='When the file is synced to disk, with the json and '
+                    'msgpack formats: never, after every write of the '
+                    'buffer, or on rotation.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="dispatcher_file")
@@ -52,14 +86,29 @@ class FileDispatcher(dispatcher.Base):
 
     [collector]
     dispatchers = file
+
+    The json and msgpack formats record the meters in large buffered
+    writes, see BufferedFileSink.
     """
 
     def __init__(self, conf):
         super(FileDispatcher, self).__init__(conf)
         self.log = None
-
+        self.sink = None
+
+        conf = self.conf.dispatcher_file
+        if conf.file_path and conf.format != 'log':
+            self.sink = file_publisher.BufferedFileSink(
+                conf.file_path, conf.format,
+                buffer_size=conf.buffer_size,
+                flush_interval=conf.flush_interval,
+                max_bytes=conf.max_bytes or 0,
+                rotate_interval=conf.rotate_interval,
+                backup_count=conf.backup_count or 0,
+                compression=conf.compression,
+                fsync=conf.fsync)
         # if the directory and path are configured, then log to the file
-        if self.conf.dispatcher_file.file_path:
+        elif conf.file_path:
             dispatcher_logger = logging.Logger('dispatcher.file')
             dispatcher_logger.setLevel(logging.INFO)
             # create rotating file handler which logs meters
@@ -77,10 +126,16 @@ class FileDispatcher(dispatcher.Base):
             self.log = dispatcher_logger
 
     def record_metering_data(self, data):
-        if self.log:
+        if self.sink:
+            if not isinstance(data, list):
+                data = [data]
+            self.sink.write(data)
+        elif self.log:
             self.log.info(data)
 
     def record_events(self, events):
-        if self.log:
+        if self.sink:
+            self.sink.write(events)
+        elif self.log:
             self.log.info(events)
         return []
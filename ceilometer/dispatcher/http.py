@@ -16,6 +16,7 @@
 
 import json
 
+import eventlet
 from oslo.config import cfg
 import requests
 
@@ -40,6 +41,23 @@ http_dispatcher_opts = [
                default=5,
                help='The max time in second to wait for a request to '
                     'timeout.'),
+    cfg.IntOpt('batch_size',
+               default=1,
+               help='Maximum number of meters posted together as a JSON '
+                    'array. 1 posts every meter on its own, as a JSON '
+                    'object.'),
+    cfg.IntOpt('max_requests',
+               default=10,
+               help='Maximum number of requests in flight, and of '
+                    'connections kept alive to the target.'),
+    cfg.IntOpt('max_retries',
+               default=3,
+               help='Number of times a request failing to connect, timing '
+                    'out or getting a server error is retried.'),
+    cfg.FloatOpt('retry_backoff',
+                 default=0.5,
+                 help='Seconds to wait before the first retry of a request, '
+                      'doubled for every following retry.'),
 ]
 
 cfg.CONF.register_opts(http_dispatcher_opts, group="dispatcher_http")
@@ -58,6 +76,7 @@ class HttpDispatcher(dispatcher.Base):
         target = www.example.com
         cadf_only = true
         timeout = 2
+        batch_size = 100
     """
     def __init__(self, conf):
         super(HttpDispatcher, self).__init__(conf)
@@ -65,6 +84,17 @@ class HttpDispatcher(dispatcher.Base):
         self.timeout = self.conf.dispatcher_http.timeout
         self.target = self.conf.dispatcher_http.target
         self.cadf_only = self.conf.dispatcher_http.cadf_only
+        self.batch_size = self.conf.dispatcher_http.batch_size
+        self.max_retries = self.conf.dispatcher_http.max_retries
+        self.retry_backoff = self.conf.dispatcher_http.retry_backoff
+        max_requests = self.conf.dispatcher_http.max_requests
+        # NOTE: the session keeps the connections to the target alive, and
+        # the pool bounds the number of requests sent concurrently.
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_requests)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = eventlet.GreenPool(max_requests)
 
     def record_metering_data(self, data):
         if self.target == '':
@@ -78,7 +108,10 @@ class HttpDispatcher(dispatcher.Base):
         if not isinstance(data, list):
             data = [data]
 
-        for meter in data:
+        payloads = []
+        verified = publisher_utils.verify_signatures(
+            data, self.conf.publisher.metering_secret)
+        for meter, valid in zip(data, verified):
             LOG.debug(_(
                 'metering data %(counter_name)s '
                 'for %(resource_id)s @ %(timestamp)s: %(counter_volume)s')
@@ -86,34 +119,58 @@ class HttpDispatcher(dispatcher.Base):
                     'resource_id': meter['resource_id'],
                     'timestamp': meter.get('timestamp', 'NO TIMESTAMP'),
                     'counter_volume': meter['counter_volume']}))
-            if publisher_utils.verify_signature(
-                    meter,
-                    self.conf.publisher.metering_secret):
-                try:
-                    if self.cadf_only:
-                        # Only cadf messages are being wanted.
-                        req_data = meter.get('resource_metadata',
-                                             {}).get('request')
-                        if req_data and 'CADF_EVENT' in req_data:
-                            data = req_data['CADF_EVENT']
-                        else:
-                            continue
-                    else:
-                        # Every meter should be posted to the target
-                        data = meter
-                    res = requests.post(self.target,
-                                        data=json.dumps(data),
-                                        headers=self.headers,
-                                        timeout=self.timeout)
-                    LOG.debug(_('Message posting finished with status code '
-                                '%d.') % res.status_code)
-                except Exception as err:
-                    LOG.exception(_('Failed to record metering data: %s'),
-                                  err)
+            if valid:
+                if self.cadf_only:
+                    # Only cadf messages are being wanted.
+                    req_data = meter.get('resource_metadata',
+                                         {}).get('request')
+                    if req_data and 'CADF_EVENT' in req_data:
+                        payloads.append(req_data['CADF_EVENT'])
+                else:
+                    # Every meter should be posted to the target
+                    payloads.append(meter)
             else:
                 LOG.warning(_(
                     'message signature invalid, discarding message: %r'),
                     meter)
 
+        if self.batch_size > 1:
+            bodies = [payloads[i:i + self.batch_size]
+                      for i in range(0, len(payloads), self.batch_size)]
+        else:
+            bodies = payloads
+        for body in self.pool.imap(self._post, bodies):
+            pass
+
+    def _post(self, body):
+        """Post a body to the target, retrying with exponential backoff."""
+        try:
+            data = json.dumps(body)
+        except Exception as err:
+            LOG.exception(_('Failed to record metering data: %s'), err)
+            return
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                eventlet.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                res = self.session.post(self.target,
+                                        data=data,
+                                        headers=self.headers,
+                                        timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                error = err
+            except Exception as err:
+                LOG.exception(_('Failed to record metering data: %s'), err)
+                return
+            else:
+                LOG.debug(_('Message posting finished with status code '
+                            '%d.') % res.status_code)
+                if res.status_code < 500:
+                    return
+                error = _('status code %d') % res.status_code
+        LOG.error(_('Failed to record metering data after %(attempts)d '
+                    'attempts: %(error)s'),
+                  {'attempts': self.max_retries + 1, 'error': error})
+
     def record_events(self, events):
         pass
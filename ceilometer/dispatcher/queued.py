@@ -0,0 +1,222 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import copy
+import errno
+import glob
+import os
+import threading
+import time
+
+from oslo.config import cfg
+from oslo.serialization import jsonutils
+from six.moves import queue
+
+from ceilometer.i18n import _
+from ceilometer.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.IntOpt('queue_size',
+               default=0,
+               help='Number of batches of samples queued for every '
+                    'dispatcher, each dispatcher recording them from its '
+                    'own workers so that a slow dispatcher does not delay '
+                    'the others. The samples are acknowledged once queued: '
+                    'those the dispatcher fails to record are logged and '
+                    'lost instead of being requeued, as are those still '
+                    'queued when the process stops. 0 records the samples '
+                    'with every dispatcher in turn, acknowledging them once '
+                    'recorded.'),
+    cfg.IntOpt('workers',
+               default=1,
+               help='Number of workers recording the queued samples of '
+                    'every dispatcher.'),
+    cfg.StrOpt('overflow_policy',
+               default='block',
+               choices=['block', 'drop_oldest', 'spill'],
+               help='What to do with the samples when the queue of a '
+                    'dispatcher is full: block until there is room for them, '
+                    'drop the oldest queued samples, which are lost, or '
+                    'spill them to a file in spill_path, replayed once the '
+                    'queue is empty.'),
+    cfg.StrOpt('spill_path',
+               help='Directory holding the samples spilled by the '
+                    'dispatchers, required by the spill overflow policy. '
+                    'Every process spills to files of its own, the files '
+                    'of the processes which died being replayed by the '
+                    'others.'),
+    cfg.IntOpt('stats_interval',
+               default=60,
+               help='Number of seconds between two logs of the queue depth, '
+                    'counters and latency of every dispatcher.'),
+]
+
+cfg.CONF.register_opts(OPTS, group="dispatcher_queue")
+
+
+class QueuedDispatcher(object):
+    """Record the samples with a dispatcher from its own queue and workers.
+
+    The samples are recorded by the workers, the callers only waiting for
+    them to be queued. Events are recorded synchronously, their callers
+    needing the result of the dispatcher.
+    """
+
+    def __init__(self, name, dispatcher, conf=cfg.CONF):
+        self.name = name
+        self.dispatcher = dispatcher
+        self.policy = conf.dispatcher_queue.overflow_policy
+        self.stats_interval = conf.dispatcher_queue.stats_interval
+        self.spill_path = conf.dispatcher_queue.spill_path
+        if not self.spill_path and self.policy == 'spill':
+            LOG.warn(_("No spill_path set, the dispatcher %s drops the "
+                       "oldest samples when its queue is full"), name)
+            self.policy = 'drop_oldest'
+        self.queue = queue.Queue(conf.dispatcher_queue.queue_size)
+        self.counters = collections.Counter()
+        self.latency_max = 0
+        self._lock = threading.Lock()
+        self._last_stats = time.time()
+        for i in range(conf.dispatcher_queue.workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+
+    def record_metering_data(self, data):
+        # NOTE: the dispatchers may modify the samples they record, while
+        # the other dispatchers still have them queued.
+        data = copy.deepcopy(data)
+        if self.policy == 'block':
+            self.queue.put(data)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(data)
+                return
+            except queue.Full:
+                if self.policy == 'spill':
+                    self._spill(data)
+                    return
+            try:
+                self.queue.get_nowait()
+                self.counters['dropped'] += 1
+            except queue.Empty:
+                pass
+
+    def record_events(self, events):
+        return self.dispatcher.record_events(events)
+
+    def stats(self):
+        """Return the queue depth, counters and latency of the dispatcher."""
+        stats = dict((k, self.counters[k]) for k in
+                     ('recorded', 'failed', 'dropped', 'spilled'))
+        recorded = stats['recorded'] + stats['failed']
+        stats.update(name=self.name,
+                     depth=self.queue.qsize(),
+                     latency_avg=(self.counters['latency'] / recorded
+                                  if recorded else 0),
+                     latency_max=self.latency_max)
+        return stats
+
+    def _work(self):
+        while True:
+            try:
+                data = self.queue.get(timeout=1)
+            except queue.Empty:
+                self._replay()
+                continue
+            self._record(data)
+            if self.queue.empty():
+                self._replay()
+
+    def _record(self, data):
+        start = time.time()
+        try:
+            self.dispatcher.record_metering_data(data)
+        except Exception:
+            self.counters['failed'] += 1
+            LOG.exception(_("Dispatcher %s failed to record metering data"),
+                          self.name)
+        else:
+            self.counters['recorded'] += 1
+        latency = time.time() - start
+        self.counters['latency'] += latency
+        self.latency_max = max(self.latency_max, latency)
+        if start - self._last_stats >= self.stats_interval:
+            self._last_stats = start
+            LOG.info(_("Dispatcher %(name)s: %(depth)d queued, %(recorded)d "
+                       "recorded, %(failed)d failed, %(dropped)d dropped, "
+                       "%(spilled)d spilled, %(latency_avg).3fs average and "
+                       "%(latency_max).3fs maximum latency"), self.stats())
+
+    def _spill_file(self, pid, suffix='spill'):
+        return os.path.join(self.spill_path,
+                            '%s.%d.%s' % (self.name, pid, suffix))
+
+    def _spill(self, data):
+        # NOTE: every process appends to a file of its own, its workers
+        # serializing their appends with the lock.
+        with self._lock:
+            try:
+                os.makedirs(self.spill_path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            with open(self._spill_file(os.getpid()), 'a') as f:
+                f.write(jsonutils.dumps(data) + '\n')
+        self.counters['spilled'] += 1
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError as e:
+            return e.errno != errno.ESRCH
+        return True
+
+    def _replay(self):
+        """Record the spilled samples.
+
+        The spill files of the process, and those of the processes which
+        died, are renamed after the process replaying them so that they are
+        replayed once, and so that the samples of a process which died while
+        replaying them are replayed by another one.
+        """
+        if not self.spill_path:
+            return
+        pid = os.getpid()
+        claimed = self._spill_file(pid, 'replay')
+        paths = glob.glob(os.path.join(self.spill_path,
+                                       '%s.*.spill' % self.name))
+        paths += glob.glob(os.path.join(self.spill_path,
+                                        '%s.*.replay' % self.name))
+        for path in sorted(paths):
+            owner = path.rsplit('.', 2)[1]
+            if (path == claimed or not owner.isdigit() or
+                    int(owner) != pid and self._is_alive(int(owner))):
+                continue
+            with self._lock:
+                if os.path.exists(claimed):
+                    # NOTE: another worker of this process is replaying.
+                    return
+                try:
+                    os.rename(path, claimed)
+                except OSError:
+                    continue
+            with open(claimed) as f:
+                for line in f:
+                    self._record(jsonutils.loads(line))
+            os.remove(claimed)
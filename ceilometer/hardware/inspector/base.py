@@ -37,3 +37,15 @@ class Inspector(object):
         :return metadata: dict to construct sample's metadata
         :return extra: dict of extra metadata to help constructing sample
         """
+
+    def prefetch(self, hosts, identifiers):
+        """Query the data of many metrics of many hosts at once.
+
+        Called by the pollsters before inspect_generic, the inspectors
+        querying the hosts more efficiently all at once populating the
+        cache of every host.
+
+        :param hosts: list of (host, cache), the cache of every host being
+                      the one then passed to inspect_generic for it
+        :param identifiers: the identifiers of the metrics to query
+        """
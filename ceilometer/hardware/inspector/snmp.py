@@ -19,15 +19,78 @@
 # under the License.
 """Inspector for collecting data over SNMP"""
 
+import asyncore
+import time
+
+from eventlet import greenpool
+from eventlet import timeout
+from oslo.config import cfg
+from pysnmp.carrier.asynsock import dispatch
+from pysnmp.entity import engine
 from pysnmp.entity.rfc3413.oneliner import cmdgen
 
 from ceilometer.hardware.inspector import base
+from ceilometer.i18n import _
+from ceilometer.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.IntOpt('snmp_workers',
+               default=64,
+               help='Maximum number of hosts queried concurrently over SNMP '
+                    'by every polling cycle.'),
+    cfg.FloatOpt('snmp_timeout',
+                 default=1.0,
+                 help='Number of seconds waited for the response of a host '
+                      'to every SNMP request.'),
+    cfg.IntOpt('snmp_retries',
+               default=2,
+               help='Number of times an SNMP request left unanswered is '
+                    'sent again.'),
+    cfg.IntOpt('snmp_failure_threshold',
+               default=3,
+               help='Number of consecutive SNMP requests a host must fail '
+                    'to answer before it is no longer queried for '
+                    'snmp_failure_cooldown seconds. 0 means the hosts are '
+                    'always queried.'),
+    cfg.IntOpt('snmp_failure_cooldown',
+               default=300,
+               help='Number of seconds a host failing to answer is no longer '
+                    'queried for, before being tried again.'),
+]
+cfg.CONF.register_opts(OPTS, group='hardware')
 
 
 class SNMPException(Exception):
     pass
 
 
+class SNMPUnreachable(SNMPException):
+    """The host did not answer, or is not queried after failing to."""
+
+
+class _SelectDispatcher(dispatch.AsynsockDispatcher):
+    """Transport dispatcher waiting for the answers with select().
+
+    pysnmp waits with poll(), which eventlet does not monkey patch, so a
+    request blocks the other greenthreads until the host answers. The
+    monkey patched select() lets the hosts be queried concurrently.
+    """
+
+    def runDispatcher(self, timeout=0.0):
+        while self.jobsArePending() or self.transportsAreWorking():
+            asyncore.loop(timeout or self.timeout, use_poll=False,
+                          map=self.getSocketMap(), count=1)
+            self.handleTimerTick(time.time())
+
+
+def _command_generator():
+    snmp_engine = engine.SnmpEngine()
+    snmp_engine.registerTransportDispatcher(_SelectDispatcher())
+    return cmdgen.CommandGenerator(snmp_engine)
+
+
 def parse_snmp_return(ret, is_bulk=False):
     """Check the return value of snmp operations
 
@@ -106,6 +169,7 @@ class SNMPInspector(base.Inspector):
     }
 
     _CACHE_KEY_OID = "snmp_cached_oid"
+    _CACHE_KEY_ERROR = "snmp_error"
 
     '''
 
@@ -269,30 +333,56 @@ class SNMPInspector(base.Inspector):
         },
     }
 
+    # oids queried by the post_op functions
+    _POST_OP_OIDS = {
+        '_post_op_net': [_interface_ip_oid],
+    }
+
     def __init__(self):
         super(SNMPInspector, self).__init__()
-        self._cmdGen = cmdgen.CommandGenerator()
+        self._cmdGen = _command_generator()
+        # NOTE: a command generator runs its own dispatcher, so every
+        # concurrent request takes a generator of its own from this pool.
+        self._cmdGens = [self._cmdGen]
+        # hostname -> (consecutive failures, time until which it is skipped)
+        self._failures = {}
 
     def _query_oids(self, host, oids, cache, is_bulk):
         # send GetRequest or GetBulkRequest to get oid values and
         # populate the values into cache
+        self._check_reachable(host)
+        conf = cfg.CONF.hardware
         authData = self._get_auth_strategy(host)
         transport = cmdgen.UdpTransportTarget((host.hostname,
-                                               host.port or self._port))
+                                               host.port or self._port),
+                                              timeout=conf.snmp_timeout,
+                                              retries=conf.snmp_retries)
         oid_cache = cache.setdefault(self._CACHE_KEY_OID, {})
 
+        cmd_gen = (self._cmdGens.pop() if self._cmdGens
+                   else _command_generator())
         if is_bulk:
-            ret = self._cmdGen.bulkCmd(authData,
-                                       transport,
-                                       0, 100,
-                                       *oids,
-                                       lookupValues=True)
+            ret = cmd_gen.bulkCmd(authData,
+                                  transport,
+                                  0, 100,
+                                  *oids,
+                                  lookupValues=True)
         else:
-            ret = self._cmdGen.getCmd(authData,
-                                      transport,
-                                      *oids,
-                                      lookupValues=True)
+            ret = cmd_gen.getCmd(authData,
+                                 transport,
+                                 *oids,
+                                 lookupValues=True)
+        # a generator interrupted by an exception is not used again
+        self._cmdGens.append(cmd_gen)
         (error, data) = parse_snmp_return(ret, is_bulk)
+        if error and ret[0]:
+            self._host_failed(host)
+            raise SNMPUnreachable("Host %(host)s did not answer, oids "
+                                  "%(oid)s, %(err)s" %
+                                  dict(oid=oids,
+                                       host=host.hostname,
+                                       err=data))
+        self._failures.pop(host.hostname, None)
         if error:
             raise SNMPException("An error occurred, oids %(oid)s, "
                                 "host %(host)s, %(err)s" %
@@ -354,7 +444,83 @@ class SNMPInspector(base.Inspector):
                 new_oids.append(metadata[0])
         return new_oids
 
+    def _check_reachable(self, host):
+        failures, until = self._failures.get(host.hostname, (0, 0))
+        if until > time.time():
+            raise SNMPUnreachable("Host %s is not queried after failing to "
+                                  "answer %d times" % (host.hostname,
+                                                       failures))
+
+    def _host_failed(self, host):
+        conf = cfg.CONF.hardware
+        failures = self._failures.get(host.hostname, (0, 0))[0] + 1
+        until = 0
+        if 0 < conf.snmp_failure_threshold <= failures:
+            until = time.time() + conf.snmp_failure_cooldown
+            LOG.warn(_('Host %(host)s failed to answer %(failures)d times, '
+                       'not querying it for %(cooldown)d seconds'),
+                     {'host': host.hostname, 'failures': failures,
+                      'cooldown': conf.snmp_failure_cooldown})
+        self._failures[host.hostname] = (failures, until)
+
+    def _merged_oids(self, identifiers):
+        exact = set()
+        prefix = set()
+        for identifier in identifiers:
+            meter_def = self.MAPPING.get(identifier)
+            if meter_def is None:
+                continue
+            oids = (exact if meter_def['matching_type'] == EXACT
+                    else prefix)
+            oids.add(meter_def['metric_oid'][0])
+            oids.update(oid for oid, converter
+                        in meter_def['metadata'].values())
+            prefix.update(self._POST_OP_OIDS.get(meter_def['post_op'], []))
+        return sorted(exact), sorted(prefix)
+
+    def _prefetch_host(self, host, cache, exact, prefix):
+        conf = cfg.CONF.hardware
+        # bound the whole exchange, a GetBulkRequest walking several rows
+        deadline = 2 * conf.snmp_timeout * (conf.snmp_retries + 1)
+        try:
+            with timeout.Timeout(deadline):
+                if exact:
+                    self._query_oids(host, exact, cache, False)
+                if prefix:
+                    self._query_oids(host, prefix, cache, True)
+        except timeout.Timeout:
+            self._host_failed(host)
+            cache[self._CACHE_KEY_ERROR] = (
+                "Host %s did not answer within %.1f seconds" %
+                (host.hostname, deadline))
+        except SNMPUnreachable as err:
+            cache[self._CACHE_KEY_ERROR] = str(err)
+        except Exception as err:
+            # the meters are queried one by one by inspect_generic
+            LOG.debug(_('Prefetching host %(host)s failed: %(err)s'),
+                      {'host': host.hostname, 'err': err})
+
+    def prefetch(self, hosts, identifiers):
+        """Query the oids of all the identifiers of many hosts at once.
+
+        The oids of all the identifiers are merged into a GetRequest for
+        the EXACT ones and a GetBulkRequest for the PREFIX ones sent to
+        every host, up to snmp_workers hosts being queried concurrently.
+        A host which did not answer is not queried again by inspect_generic
+        with the same cache.
+        """
+        exact, prefix = self._merged_oids(identifiers)
+        if not hosts or not (exact or prefix):
+            return
+        pool = greenpool.GreenPool(
+            max(1, min(cfg.CONF.hardware.snmp_workers, len(hosts))))
+        for host, cache in hosts:
+            pool.spawn_n(self._prefetch_host, host, cache, exact, prefix)
+        pool.waitall()
+
     def inspect_generic(self, host, identifier, cache, extra_metadata=None):
+        if self._CACHE_KEY_ERROR in cache:
+            raise SNMPUnreachable(cache[self._CACHE_KEY_ERROR])
         # the snmp definition for the corresponding meter
         meter_def = self.MAPPING[identifier]
         # collect oids that needs to be queried
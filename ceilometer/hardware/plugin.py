@@ -20,8 +20,10 @@
 """Base class for plugins used by the hardware agent."""
 
 import abc
+import collections
 import itertools
 
+from eventlet import event
 from oslo.utils import netutils
 import six
 
@@ -38,6 +40,8 @@ class HardwarePollster(plugin_base.PollsterBase):
     """Base class for plugins that support the polling API."""
 
     CACHE_KEY = None
+    CACHE_KEY_HOSTS = 'hardware_hosts'
+    CACHE_KEY_PREFETCH = 'hardware_prefetch'
     IDENTIFIER = None
 
     def __init__(self):
@@ -84,11 +88,11 @@ class HardwarePollster(plugin_base.PollsterBase):
         :param cache: A dictionary for passing data between plugins
         :param resources: end point to poll data from
         """
-        resources = resources or []
+        resources = [self._parse_resource(r) for r in resources or []]
         h_cache = cache.setdefault(self.CACHE_KEY, {})
+        host_caches = self._prefetch(manager, cache, resources)
         sample_iters = []
-        for resource in resources:
-            parsed_url, res, extra_metadata = self._parse_resource(resource)
+        for parsed_url, res, extra_metadata in resources:
             ins = self._get_inspector(parsed_url)
             try:
                 # Call hardware inspector to poll for the data
@@ -98,7 +102,7 @@ class HardwarePollster(plugin_base.PollsterBase):
                     i_cache[self.IDENTIFIER] = list(ins.inspect_generic(
                         parsed_url,
                         self.IDENTIFIER,
-                        i_cache,
+                        host_caches.setdefault(res, {}),
                         extra_metadata))
                 # Generate samples
                 if i_cache[self.IDENTIFIER]:
@@ -113,6 +117,49 @@ class HardwarePollster(plugin_base.PollsterBase):
                                    err=err))
         return itertools.chain(*sample_iters)
 
+    def _identifiers(self, cache):
+        identifiers = set(pollster.IDENTIFIER for pollster in
+                          cache.get(plugin_base.CACHE_KEY_POLLSTERS, [])
+                          if isinstance(pollster, HardwarePollster))
+        identifiers.add(self.IDENTIFIER)
+        return identifiers
+
+    def _prefetch(self, manager, cache, resources):
+        """Let the inspectors query every host once for all the pollsters.
+
+        The first hardware pollster polling a host in a polling cycle has
+        its inspector prefetch the data of all the hardware pollsters of
+        the polling task, the others waiting for it. The caches passed to
+        the inspector are shared by all the hardware pollsters.
+
+        :return: the caches of the hosts, by resource id
+        """
+        host_caches = cache.setdefault(self.CACHE_KEY_HOSTS, {})
+        prefetching = cache.setdefault(self.CACHE_KEY_PREFETCH, {})
+        targets = collections.defaultdict(list)
+        waiting = []
+        for parsed_url, res, extra_metadata in resources:
+            if res in prefetching:
+                waiting.append(prefetching[res])
+                continue
+            prefetching[res] = event.Event()
+            targets[parsed_url.scheme].append(
+                (parsed_url, host_caches.setdefault(res, {}), res))
+        identifiers = self._identifiers(cache)
+        for hosts in targets.values():
+            try:
+                ins = self._get_inspector(hosts[0][0])
+                ins.prefetch([(url, c) for url, c, res in hosts],
+                             identifiers)
+            except Exception as err:
+                LOG.exception(_('inspector prefetch failed: %s'), err)
+            finally:
+                for url, c, res in hosts:
+                    prefetching[res].send()
+        for done in waiting:
+            done.wait()
+        return host_caches
+
     def generate_samples(self, host_url, data):
         """Generate an iterable Sample from the data returned by inspector
 
@@ -27,6 +27,7 @@ from ceilometer import messaging
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import service as os_service
 from ceilometer import pipeline
+from ceilometer.publisher import file as file_publisher
 
 
 LOG = log.getLogger(__name__)
@@ -192,4 +193,5 @@ class NotificationService(os_service.Service):
     def stop(self):
         self.partition_coordinator.leave_group(self.group_id)
         self._kill_listeners(self.listeners + self.pipeline_listeners)
+        file_publisher.close_sinks()
         super(NotificationService, self).stop()
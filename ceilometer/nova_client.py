@@ -14,6 +14,7 @@
 # under the License.
 
 import functools
+import time
 
 import novaclient
 from novaclient.v1_1 import client as nova_client
@@ -26,6 +27,11 @@ OPTS = [
     cfg.BoolOpt('nova_http_log_debug',
                 default=False,
                 help='Allow novaclient\'s debug log output.'),
+    cfg.IntOpt('nova_metadata_cache_ttl',
+               default=600,
+               help='Number of seconds the flavors and images looked up '
+                    'for the instances are cached across requests. 0 '
+                    'caches them for a single request only.'),
 ]
 
 SERVICE_OPTS = [
@@ -77,13 +83,20 @@ class Client(object):
             timeout=cfg.CONF.http_timeout,
             http_log_debug=cfg.CONF.nova_http_log_debug,
             no_cache=True)
+        self._flavor_cache = {}
+        self._image_cache = {}
+        self._metadata_expiry = 0
 
     def _with_flavor_and_image(self, instances):
-        flavor_cache = {}
-        image_cache = {}
+        ttl = cfg.CONF.nova_metadata_cache_ttl
+        now = time.time()
+        if ttl <= 0 or now >= self._metadata_expiry:
+            self._flavor_cache = {}
+            self._image_cache = {}
+            self._metadata_expiry = now + ttl
         for instance in instances:
-            self._with_flavor(instance, flavor_cache)
-            self._with_image(instance, image_cache)
+            self._with_flavor(instance, self._flavor_cache)
+            self._with_image(instance, self._image_cache)
 
         return instances
 
@@ -138,9 +151,15 @@ class Client(object):
             setattr(instance, attr, ameta)
 
     @logged
-    def instance_get_all_by_host(self, hostname):
-        """Returns list of instances on particular host."""
+    def instance_get_all_by_host(self, hostname, since=None):
+        """Returns list of instances on particular host.
+
+        If since is specified, only instances modified since that ISO 8601
+        timestamp, including the deleted ones, are returned.
+        """
         search_opts = {'host': hostname, 'all_tenants': True}
+        if since:
+            search_opts['changes-since'] = since
         return self._with_flavor_and_image(self.nova_client.servers.list(
             detailed=True,
             search_opts=search_opts))
@@ -13,6 +13,7 @@
 # under the License.
 import itertools
 
+import ceilometer.agent.base
 import ceilometer.agent.manager
 import ceilometer.alarm.notifier.rest
 import ceilometer.alarm.rpc
@@ -34,9 +35,11 @@ import ceilometer.coordination
 import ceilometer.data_processing.notifications
 import ceilometer.dispatcher
 import ceilometer.dispatcher.file
+import ceilometer.dispatcher.queued
 import ceilometer.energy.kwapi
 import ceilometer.event.converter
 import ceilometer.hardware.discovery
+import ceilometer.hardware.inspector.snmp
 import ceilometer.identity.notifications
 import ceilometer.image.glance
 import ceilometer.image.notifications
@@ -59,6 +62,7 @@ import ceilometer.publisher.utils
 import ceilometer.sample
 import ceilometer.service
 import ceilometer.storage
+import ceilometer.transformer.store
 import ceilometer.utils
 import ceilometer.volume.notifications
 
@@ -113,11 +117,16 @@ def list_opts():
         ('coordination', ceilometer.coordination.OPTS),
         ('database', ceilometer.storage.OPTS),
         ('dispatcher_file', ceilometer.dispatcher.file.OPTS),
+        ('dispatcher_queue', ceilometer.dispatcher.queued.OPTS),
         ('event', ceilometer.event.converter.OPTS),
-        ('hardware', ceilometer.hardware.discovery.OPTS),
+        ('hardware',
+         itertools.chain(ceilometer.hardware.discovery.OPTS,
+                         ceilometer.hardware.inspector.snmp.OPTS)),
         ('impi', ceilometer.ipmi.platform.intel_node_manager.OPTS),
         ('notification', ceilometer.notification.OPTS),
-        ('polling', ceilometer.agent.manager.OPTS),
+        ('polling',
+         itertools.chain(ceilometer.agent.base.OPTS,
+                         ceilometer.agent.manager.OPTS)),
         ('publisher', ceilometer.publisher.utils.OPTS),
         ('publisher_notifier', ceilometer.publisher.messaging.NOTIFIER_OPTS),
         ('publisher_rpc', ceilometer.publisher.messaging.RPC_OPTS),
@@ -128,6 +137,7 @@ def list_opts():
                          ceilometer.neutron_client.SERVICE_OPTS,
                          ceilometer.nova_client.SERVICE_OPTS,
                          ceilometer.objectstore.swift.SERVICE_OPTS,)),
+        ('transformer_store', ceilometer.transformer.store.OPTS),
         ('vmware', ceilometer.compute.virt.vmware.inspector.OPTS),
         ('xenapi', ceilometer.compute.virt.xenapi.inspector.OPTS),
     ]
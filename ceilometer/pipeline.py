@@ -280,16 +280,14 @@ class Sink(object):
 
         return transformers
 
-    def _transform_sample(self, start, ctxt, sample):
+    def _transform_sample(self, transformer, ctxt, sample):
         try:
-            for transformer in self.transformers[start:]:
-                sample = transformer.handle_sample(ctxt, sample)
-                if not sample:
-                    LOG.debug(_(
-                        "Pipeline %(pipeline)s: Sample dropped by "
-                        "transformer %(trans)s") % ({'pipeline': self,
-                                                     'trans': transformer}))
-                    return
+            sample = transformer.handle_sample(ctxt, sample)
+            if not sample:
+                LOG.debug(_(
+                    "Pipeline %(pipeline)s: Sample dropped by "
+                    "transformer %(trans)s") % ({'pipeline': self,
+                                                 'trans': transformer}))
             return sample
         except Exception as err:
             LOG.warning(_("Pipeline %(pipeline)s: "
@@ -299,6 +297,40 @@ class Sink(object):
                                                        'smp': sample}))
             LOG.exception(err)
 
+    def _transform_samples(self, start, ctxt, samples):
+        """Pass the samples through the transformers, batch by batch.
+
+        The transformers not implementing handle_samples, or failing to
+        handle a batch, are passed the samples one by one.
+        """
+        for transformer in self.transformers[start:]:
+            if not samples:
+                break
+            LOG.debug(_(
+                "Pipeline %(pipeline)s: Transform %(count)d samples "
+                "from %(trans)s transformer") % ({'pipeline': self,
+                                                  'count': len(samples),
+                                                  'trans': transformer}))
+            if not hasattr(transformer, 'handle_samples'):
+                samples = [s for s in (
+                    self._transform_sample(transformer, ctxt, sample)
+                    for sample in samples) if s]
+                continue
+            try:
+                samples = transformer.handle_samples(ctxt, samples)
+            except Exception as err:
+                LOG.warning(_("Pipeline %(pipeline)s: "
+                              "Transform one by one after error from "
+                              "transformer %(trans)s for %(count)d "
+                              "samples") % ({'pipeline': self,
+                                             'trans': transformer,
+                                             'count': len(samples)}))
+                LOG.exception(err)
+                samples = [s for s in (
+                    self._transform_sample(transformer, ctxt, sample)
+                    for sample in samples) if s]
+        return samples
+
     def _publish_samples(self, start, ctxt, samples):
         """Push samples into pipeline for publishing.
 
@@ -310,19 +342,7 @@ class Sink(object):
 
         """
 
-        transformed_samples = []
-        if not self.transformers:
-            transformed_samples = samples
-        else:
-            for sample in samples:
-                LOG.debug(_(
-                    "Pipeline %(pipeline)s: Transform sample "
-                    "%(smp)s from %(trans)s transformer") % ({'pipeline': self,
-                                                              'smp': sample,
-                                                              'trans': start}))
-                sample = self._transform_sample(start, ctxt, sample)
-                if sample:
-                    transformed_samples.append(sample)
+        transformed_samples = self._transform_samples(start, ctxt, samples)
 
         if transformed_samples:
             for p in self.publishers:
@@ -343,7 +363,8 @@ class Sink(object):
         for (i, transformer) in enumerate(self.transformers):
             try:
                 self._publish_samples(i + 1, ctxt,
-                                      list(transformer.flush(ctxt)))
+                                      [s for s in transformer.flush(ctxt)
+                                       if s])
             except Exception as err:
                 LOG.warning(_(
                     "Pipeline %(pipeline)s: Error flushing "
@@ -97,12 +97,8 @@ class MessagingPublisher(publisher.PublisherBase):
 
         """
 
-        meters = [
-            utils.meter_message_from_counter(
-                sample,
-                cfg.CONF.publisher.metering_secret)
-            for sample in samples
-        ]
+        meters = utils.meter_messages_from_counters(
+            samples, cfg.CONF.publisher.metering_secret)
 
         topic = cfg.CONF.publisher_rpc.metering_topic
         self.local_queue.append((context, topic, meters))
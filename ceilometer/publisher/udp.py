@@ -50,10 +50,8 @@ class UDPPublisher(publisher.PublisherBase):
         :param samples: Samples from pipeline after transformation
         """
 
-        for sample in samples:
-            msg = utils.meter_message_from_counter(
-                sample,
-                cfg.CONF.publisher.metering_secret)
+        for msg in utils.meter_messages_from_counters(
+                samples, cfg.CONF.publisher.metering_secret):
             host = self.host
             port = self.port
             LOG.debug(_("Publishing sample %(msg)s over UDP to "
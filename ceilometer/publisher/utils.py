@@ -40,19 +40,69 @@ OPTS = [
 cfg.CONF.register_opts(OPTS, group="publisher")
 
 
-def compute_signature(message, secret):
-    """Return the signature for a message dictionary."""
-    digest_maker = hmac.new(secret, '', hashlib.sha256)
-    for name, value in utils.recursive_keypairs(message):
+_HMACS = {}
+
+
+class TrustedMessages(list):
+    """Messages received from a trusted transport.
+
+    Their signature is not verified by verify_signatures. Messages
+    deserialized from the wire are plain lists, so that only the process
+    which received them can mark them as trusted.
+    """
+
+
+def _hmac(secret):
+    """Return a keyed HMAC, the key being only hashed once per secret."""
+    prototype = _HMACS.get(secret)
+    if prototype is None:
+        prototype = _HMACS[secret] = hmac.new(secret, '', hashlib.sha256)
+    return prototype.copy()
+
+
+def _canonicalize(d, prefix=''):
+    """Return the bytes hashed for a dictionary when signing it."""
+    return b''.join(six.text_type(part).encode('utf-8')
+                    for name, value in utils.recursive_keypairs(d)
+                    for part in (prefix + name, value))
+
+
+def _digest(message, secret, cache=None):
+    digest_maker = _hmac(secret)
+    for name, value in sorted(six.iteritems(message)):
         if name == 'message_signature':
             # Skip any existing signature value, which would not have
             # been part of the original message.
             continue
-        digest_maker.update(six.text_type(name).encode('utf-8'))
-        digest_maker.update(six.text_type(value).encode('utf-8'))
+        if isinstance(value, dict):
+            # NOTE: the samples of a batch often share their metadata,
+            # canonicalized once for all of them.
+            key = (name, id(value))
+            cached = cache.get(key) if cache is not None else None
+            if cached is None or cached[0] is not value:
+                cached = (value, _canonicalize(value, name + ':'))
+                if cache is not None:
+                    cache[key] = cached
+            digest_maker.update(cached[1])
+        else:
+            if isinstance(value, (tuple, list)):
+                value = utils.decode_unicode(value)
+            digest_maker.update(six.text_type(name).encode('utf-8'))
+            digest_maker.update(six.text_type(value).encode('utf-8'))
     return digest_maker.hexdigest()
 
 
+def compute_signature(message, secret):
+    """Return the signature for a message dictionary."""
+    return _digest(message, secret)
+
+
+def compute_signatures(messages, secret):
+    """Return the signatures of a list of message dictionaries."""
+    cache = {}
+    return [_digest(message, secret, cache) for message in messages]
+
+
 def besteffort_compare_digest(first, second):
     """Returns True if both string inputs are equal, otherwise False.
 
@@ -89,8 +139,23 @@ def verify_signature(message, secret):
     Message is verified against the value computed from the rest of the
     contents.
     """
+    return _verify(message, compute_signature(message, secret))
+
+
+def verify_signatures(messages, secret):
+    """Check the signatures of a list of messages.
+
+    Return a list of booleans telling whether every message is correctly
+    signed, TrustedMessages being assumed to be.
+    """
+    if isinstance(messages, TrustedMessages):
+        return [True] * len(messages)
+    return [_verify(message, signature) for message, signature in
+            zip(messages, compute_signatures(messages, secret))]
+
+
+def _verify(message, new_sig):
     old_sig = message.get('message_signature', '')
-    new_sig = compute_signature(message, secret)
 
     if isinstance(old_sig, six.text_type):
         try:
@@ -107,17 +172,31 @@ def meter_message_from_counter(sample, secret):
     Returns a dictionary containing a metering message
     for a notification message and a Sample instance.
     """
-    msg = {'source': sample.source,
-           'counter_name': sample.name,
-           'counter_type': sample.type,
-           'counter_unit': sample.unit,
-           'counter_volume': sample.volume,
-           'user_id': sample.user_id,
-           'project_id': sample.project_id,
-           'resource_id': sample.resource_id,
-           'timestamp': sample.timestamp,
-           'resource_metadata': sample.resource_metadata,
-           'message_id': sample.id,
-           }
-    msg['message_signature'] = compute_signature(msg, secret)
-    return msg
+    return meter_messages_from_counters([sample], secret)[0]
+
+
+def meter_messages_from_counters(samples, secret):
+    """Make the metering messages of a list of samples.
+
+    The metadata shared by the samples is canonicalized once when signing
+    them.
+    """
+    msgs = [_meter_message(sample) for sample in samples]
+    for msg, signature in zip(msgs, compute_signatures(msgs, secret)):
+        msg['message_signature'] = signature
+    return msgs
+
+
+def _meter_message(sample):
+    return {'source': sample.source,
+            'counter_name': sample.name,
+            'counter_type': sample.type,
+            'counter_unit': sample.unit,
+            'counter_volume': sample.volume,
+            'user_id': sample.user_id,
+            'project_id': sample.project_id,
+            'resource_id': sample.resource_id,
+            'timestamp': sample.timestamp,
+            'resource_metadata': sample.resource_metadata,
+            'message_id': sample.id,
+            }
@@ -23,10 +23,11 @@ ensure that all of the appropriate fields have been filled
 in by the plugins that create them.
 """
 
-import copy
+import operator
 import uuid
 
 from oslo.config import cfg
+import six
 
 
 OPTS = [
@@ -55,6 +56,19 @@ cfg.CONF.register_opts(OPTS)
 # Timestamp: when the sample has been read
 # Resource metadata: various metadata
 class Sample(object):
+    """A sample, holding its fields in slots to keep it compact.
+
+    The id of the sample is only generated when first read. The resource
+    metadata may be shared with other samples and must not be modified.
+    """
+
+    FIELDS = ('name', 'type', 'unit', 'volume', 'user_id', 'project_id',
+              'resource_id', 'timestamp', 'resource_metadata', 'source',
+              'id')
+
+    __slots__ = FIELDS[:-1] + ('_id',)
+
+    _get_fields = operator.attrgetter(*FIELDS)
 
     def __init__(self, name, type, unit, volume, user_id, project_id,
                  resource_id, timestamp, resource_metadata, source=None):
@@ -68,10 +82,28 @@ class Sample(object):
         self.timestamp = timestamp
         self.resource_metadata = resource_metadata
         self.source = source or cfg.CONF.sample_source
-        self.id = str(uuid.uuid1())
+        self._id = None
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = str(uuid.uuid1())
+        return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
 
     def as_dict(self):
-        return copy.copy(self.__dict__)
+        return dict(zip(self.FIELDS, self._get_fields(self)))
+
+    def __getstate__(self):
+        # NOTE: the copies of a sample share its id.
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        for name, value in six.iteritems(state):
+            setattr(self, name, value)
 
     def __repr__(self):
         return '<name: %s, volume: %s, resource_id: %s, timestamp: %s>' % (
@@ -81,9 +113,6 @@ class Sample(object):
     def from_notification(cls, name, type, volume, unit,
                           user_id, project_id, resource_id,
                           message, source=None):
-        metadata = copy.copy(message['payload'])
-        metadata['event_type'] = message['event_type']
-        metadata['host'] = message['publisher_id']
         return cls(name=name,
                    type=type,
                    volume=volume,
@@ -92,9 +121,26 @@ class Sample(object):
                    project_id=project_id,
                    resource_id=resource_id,
                    timestamp=message['timestamp'],
-                   resource_metadata=metadata,
+                   resource_metadata=_notification_metadata(message),
                    source=source)
 
+
+# NOTE: the samples built from the same notification share its metadata,
+# the plugins usually building several samples from every notification.
+_last_notification = (None, None)
+
+
+def _notification_metadata(message):
+    global _last_notification
+    last_message, metadata = _last_notification
+    if last_message is not message:
+        metadata = dict(message['payload'],
+                        event_type=message['event_type'],
+                        host=message['publisher_id'])
+        _last_notification = (message, metadata)
+    return metadata
+
+
 TYPE_GAUGE = 'gauge'
 TYPE_DELTA = 'delta'
 TYPE_CUMULATIVE = 'cumulative'
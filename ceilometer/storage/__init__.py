@@ -68,6 +68,45 @@ OPTS = [
                help="The max length of resources id in DB2 nosql, "
                     "the value should be larger than len(hostname) * 2 "
                     "as compute node's resource id is <hostname>_<nodename>."),
+    cfg.IntOpt('sql_id_cache_size',
+               default=50000,
+               help="Number of meter and resource definitions whose internal "
+                    "ids are cached by the SQL backend when recording "
+                    "samples (<= 0 disables the cache)."),
+    cfg.IntOpt('sql_expire_batch_size',
+               default=0,
+               help="Number of rows deleted per transaction by the SQL "
+                    "backend when clearing expired data, committing between "
+                    "batches so that the tables are not locked for the whole "
+                    "run. 0 deletes everything in a single transaction."),
+    cfg.FloatOpt('sql_expire_batch_interval',
+                 default=0,
+                 help="Seconds to wait between two batches when clearing "
+                      "expired data in batches, to limit the load put on "
+                      "the SQL database."),
+    cfg.StrOpt('sql_sample_partition',
+               default=None,
+               choices=['day', 'week'],
+               help="Partition the samples stored by the SQL backend per "
+                    "day or per week, so that expired samples are removed "
+                    "by dropping whole partitions. Supported by MySQL and "
+                    "PostgreSQL, enabled on the next database upgrade. "
+                    "MySQL partitioned tables can not have foreign keys, "
+                    "so sql_id_cache_size is ignored on MySQL and the ids "
+                    "of the meters and resources are looked up for every "
+                    "batch. Unset keeps a single sample table."),
+    cfg.ListOpt('rollup_resolutions',
+                default=[],
+                help="Resolutions, in seconds, of the rollups maintained by "
+                     "the SQL backend when recording samples (e.g. "
+                     "60,3600,86400) and used to answer statistics "
+                     "queries whose bounds and period are multiples of "
+                     "them. It must be set to the same value for every "
+                     "collector and API service. Empty disables rollups."),
+    cfg.IntOpt('hbase_scan_batch_size',
+               default=1000,
+               help="Number of rows fetched from HBase per round-trip when "
+                    "scanning samples to compute statistics."),
 ]
 
 cfg.CONF.register_opts(OPTS, group='database')
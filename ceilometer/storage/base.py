@@ -191,6 +191,21 @@ class Connection(object):
         raise ceilometer.NotImplementedError(
             'Recording metering data is not implemented')
 
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        Drivers able to store several samples in one round-trip should
+        override this; the default falls back to recording each sample
+        with record_metering_data().
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+
+        All timestamps must be naive utc datetime object.
+        """
+        for sample in samples:
+            self.record_metering_data(sample)
+
     @staticmethod
     def clear_expired_metering_data(ttl):
         """Clear expired data from the backend storage system.
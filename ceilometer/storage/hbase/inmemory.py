@@ -65,6 +65,9 @@ class MTable(object):
     def delete(self, key):
         del self._rows_with_ts[key]
 
+    def batch(self, timestamp=None):
+        return MBatch(self, timestamp)
+
     def _get_latest_dict(self, row):
         # The idea here is to return latest versions of columns.
         # In _rows_with_ts we store {row: {ts_1: {data}, ts_2: {data}}}.
@@ -78,7 +81,7 @@ class MTable(object):
         return data
 
     def scan(self, filter=None, columns=None, row_start=None, row_stop=None,
-             limit=None):
+             limit=None, batch_size=1000):
         columns = columns or []
         sorted_keys = sorted(self._rows_with_ts)
         # copy data between row_start and row_stop into a dict
@@ -244,6 +247,29 @@ class MTable(object):
         return r
 
 
+class MBatch(object):
+    """HappyBase.Batch mock."""
+    def __init__(self, table, timestamp=None):
+        self.table = table
+        self.timestamp = timestamp
+        self._mutations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.send()
+
+    def put(self, key, data):
+        self._mutations.append((key, data))
+
+    def send(self):
+        for key, data in self._mutations:
+            self.table.put(key, data, self.timestamp)
+        self._mutations = []
+
+
 class MConnectionPool(object):
     def __init__(self):
         self.conn = MConnection()
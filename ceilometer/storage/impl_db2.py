@@ -212,6 +212,36 @@ class Connection(pymongo_base.Connection):
     def record_metering_data(self, data):
         """Write the data to the backend storage system.
 
+        :param data: a dictionary such as returned by
+                     ceilometer.meter.meter_message_from_counter
+        """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        Resources are updated sample by sample, the raw samples are then
+        written to the meter collection with a single bulk insert.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+        # NOTE: the _id given by our caller, if any, lets a sample recorded
+        # again, e.g. one by one after the bulk insert failed partway, not
+        # be duplicated.
+        records = [self._update_resource(data) for data in samples]
+        try:
+            self.db.meter.insert(records)
+        except pymongo.errors.DuplicateKeyError:
+            if len(records) > 1:
+                raise
+            LOG.debug('Sample %s already recorded', records[0]['_id'])
+
+    def _update_resource(self, data):
+        """Record the resource of a sample and return the meter record.
+
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
@@ -235,7 +265,7 @@ class Connection(pymongo_base.Connection):
             upsert=True,
         )
 
-        # Record the raw data for the meter. Use a copy so we do not
+        # Build the raw data for the meter. Use a copy so we do not
         # modify a data structure owned by our caller (the driver adds
         # a new key '_id').
         record = copy.copy(data)
@@ -244,7 +274,7 @@ class Connection(pymongo_base.Connection):
         # automatically.
         if record.get('_id') is None:
             record['_id'] = str(bson.objectid.ObjectId())
-        self.db.meter.insert(record)
+        return record
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
@@ -11,15 +11,20 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import datetime
+import math
 import operator
 import time
 
+from oslo.config import cfg
 from oslo.utils import timeutils
+import six
 
 import ceilometer
 from ceilometer.i18n import _
 from ceilometer.openstack.common import log
+from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage.hbase import base as hbase_base
 from ceilometer.storage.hbase import migration as hbase_migration
@@ -37,9 +42,19 @@ AVAILABLE_CAPABILITIES = {
                             'metadata': True}},
     'samples': {'query': {'simple': True,
                           'metadata': True}},
-    'statistics': {'query': {'simple': True,
+    'statistics': {'groupby': True,
+                   'query': {'simple': True,
                              'metadata': True},
-                   'aggregation': {'standard': True}},
+                   'aggregation': {'standard': True,
+                                   'selectable': {
+                                       'max': True,
+                                       'min': True,
+                                       'sum': True,
+                                       'avg': True,
+                                       'count': True,
+                                       'stddev': True,
+                                       'cardinality': True}}
+                   },
 }
 
 
@@ -48,6 +63,106 @@ AVAILABLE_STORAGE_CAPABILITIES = {
 }
 
 
+STANDARD_AGGREGATES = ('count', 'min', 'max', 'sum', 'avg')
+
+UNPARAMETERIZED_AGGREGATES = ('stddev',)
+
+PARAMETERIZED_AGGREGATES = dict(
+    validate=dict(
+        cardinality=lambda p: p in ['resource_id', 'user_id', 'project_id',
+                                    'source']
+    ),
+)
+
+GROUPBY_FIELDS = ('user_id', 'project_id', 'resource_id', 'source',
+                  'resource_metadata.instance_type')
+
+
+def _field_column(field):
+    """Return the meter table column holding a sample field."""
+    if field == 'source':
+        # NOTE: the source is only stored in a column named after its value,
+        # so it is read from the raw message instead.
+        return 'f:message'
+    if field.startswith('resource_metadata.'):
+        return 'f:r_metadata.' + field[len('resource_metadata.'):]
+    return 'f:' + field
+
+
+def _field_value(meter, metadata, field):
+    """Return the value of a sample field from a deserialized meter row."""
+    if field == 'source':
+        return meter['message']['source']
+    if field.startswith('resource_metadata.'):
+        return metadata.get(field[len('resource_metadata.'):])
+    return meter[field]
+
+
+class _StatisticsAccumulator(object):
+    """Running statistics of the samples of one period and group.
+
+    The standard deviation is computed with Welford's online algorithm, so
+    the samples do not have to be kept around.
+    """
+
+    def __init__(self, cardinality):
+        self.unit = None
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.distinct = dict((field, set()) for field in cardinality)
+        self.duration_start = None
+        self.duration_end = None
+
+    def update(self, volume, timestamp, unit, distinct):
+        self.unit = unit
+        self.count += 1
+        self.sum += volume
+        if self.min is None or volume < self.min:
+            self.min = volume
+        if self.max is None or volume > self.max:
+            self.max = volume
+        delta = volume - self.mean
+        self.mean += delta / float(self.count)
+        self.m2 += delta * (volume - self.mean)
+        for field, value in six.iteritems(distinct):
+            self.distinct[field].add(value)
+        if self.duration_start is None or timestamp < self.duration_start:
+            self.duration_start = timestamp
+        if self.duration_end is None or timestamp > self.duration_end:
+            self.duration_end = timestamp
+
+    def to_model(self, period, period_start, period_end, groupby, aggregate):
+        values = dict(count=self.count, min=self.min, max=self.max,
+                      sum=self.sum, avg=self.sum / float(self.count))
+        if aggregate:
+            data = {'aggregate': {}}
+            for a in aggregate:
+                key = '%s%s' % (a.func, '/%s' % a.param if a.param else '')
+                if a.func in STANDARD_AGGREGATES:
+                    data[a.func] = data['aggregate'][key] = values[a.func]
+                elif a.func == 'stddev':
+                    data['aggregate'][key] = math.sqrt(self.m2 / self.count)
+                else:
+                    data['aggregate'][key] = len(self.distinct[a.param])
+        else:
+            data = values
+        return models.Statistics(
+            unit=self.unit,
+            period=period,
+            period_start=period_start,
+            period_end=period_end,
+            duration=timeutils.delta_seconds(self.duration_start,
+                                             self.duration_end),
+            duration_start=self.duration_start,
+            duration_end=self.duration_end,
+            groupby=groupby,
+            **data)
+
+
 class Connection(hbase_base.Connection, base.Connection):
     """Put the metering data into a HBase database
 
@@ -147,41 +262,72 @@ class Connection(hbase_base.Connection, base.Connection):
         :param data: a dictionary such as returned by
           ceilometer.meter.meter_message_from_counter
         """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        Samples are sent to the meter table in a single batch. Resource
+        updates are batched as well, one batch per distinct sample
+        timestamp since it is used as the HBase cell version.
+
+        :param samples: a list of dictionaries such as returned by
+          ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+        resources = collections.defaultdict(list)
         with self.conn_pool.connection() as conn:
             resource_table = conn.table(self.RESOURCE_TABLE)
             meter_table = conn.table(self.METER_TABLE)
 
-            resource_metadata = data.get('resource_metadata', {})
-            # Determine the name of new meter
-            rts = hbase_utils.timestamp(data['timestamp'])
-            new_meter = hbase_utils.prepare_key(
-                rts, data['source'], data['counter_name'],
-                data['counter_type'], data['counter_unit'])
-
-            # TODO(nprivalova): try not to store resource_id
-            resource = hbase_utils.serialize_entry(**{
-                'source': data['source'],
-                'meter': {new_meter: data['timestamp']},
-                'resource_metadata': resource_metadata,
-                'resource_id': data['resource_id'],
-                'project_id': data['project_id'], 'user_id': data['user_id']})
-            # Here we put entry in HBase with our own timestamp. This is needed
-            # when samples arrive out-of-order
-            # If we use timestamp=data['timestamp'] the newest data will be
-            # automatically 'on the top'. It is needed to keep metadata
-            # up-to-date: metadata from newest samples is considered as actual.
-            ts = int(time.mktime(data['timestamp'].timetuple()) * 1000)
-            resource_table.put(hbase_utils.encode_unicode(data['resource_id']),
-                               resource, ts)
-
-            # Rowkey consists of reversed timestamp, meter and a
-            # message signature for purposes of uniqueness
-            row = hbase_utils.prepare_key(data['counter_name'], rts,
-                                          data['message_signature'])
-            record = hbase_utils.serialize_entry(
-                data, **{'source': data['source'], 'rts': rts,
-                         'message': data, 'recorded_at': timeutils.utcnow()})
-            meter_table.put(row, record)
+            with meter_table.batch() as meter_batch:
+                for data in samples:
+                    if '_id' in data:
+                        # NOTE: the row key already identifies the sample.
+                        data = dict(data)
+                        del data['_id']
+                    resource_metadata = data.get('resource_metadata', {})
+                    # Determine the name of new meter
+                    rts = hbase_utils.timestamp(data['timestamp'])
+                    new_meter = hbase_utils.prepare_key(
+                        rts, data['source'], data['counter_name'],
+                        data['counter_type'], data['counter_unit'])
+
+                    # TODO(nprivalova): try not to store resource_id
+                    resource = hbase_utils.serialize_entry(**{
+                        'source': data['source'],
+                        'meter': {new_meter: data['timestamp']},
+                        'resource_metadata': resource_metadata,
+                        'resource_id': data['resource_id'],
+                        'project_id': data['project_id'],
+                        'user_id': data['user_id']})
+                    # Here we put entry in HBase with our own timestamp. This
+                    # is needed when samples arrive out-of-order
+                    # If we use timestamp=data['timestamp'] the newest data
+                    # will be automatically 'on the top'. It is needed to keep
+                    # metadata up-to-date: metadata from newest samples is
+                    # considered as actual.
+                    ts = int(time.mktime(
+                        data['timestamp'].timetuple()) * 1000)
+                    resources[ts].append(
+                        (hbase_utils.encode_unicode(data['resource_id']),
+                         resource))
+
+                    # Rowkey consists of reversed timestamp, meter and a
+                    # message signature for purposes of uniqueness
+                    row = hbase_utils.prepare_key(data['counter_name'], rts,
+                                                  data['message_signature'])
+                    record = hbase_utils.serialize_entry(
+                        data, **{'source': data['source'], 'rts': rts,
+                                 'message': data,
+                                 'recorded_at': timeutils.utcnow()})
+                    meter_batch.put(row, record)
+
+            for ts in sorted(resources):
+                with resource_table.batch(timestamp=ts) as resource_batch:
+                    for resource_id, resource in resources[ts]:
+                        resource_batch.put(resource_id, resource)
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
@@ -313,27 +459,26 @@ class Connection(hbase_base.Connection, base.Connection):
                 yield models.Sample(**d_meter['message'])
 
     @staticmethod
-    def _update_meter_stats(stat, meter):
-        """Do the stats calculation on a requested time bucket in stats dict
-
-        :param stats: dict where aggregated stats are kept
-        :param index: time bucket index in stats
-        :param meter: meter record as returned from HBase
-        :param start_time: query start time
-        :param period: length of the time bucket
+    def _get_cardinality_fields(aggregate):
+        """Validate the selectable aggregates.
+
+        Return the fields whose distinct values have to be counted.
         """
-        vol = meter['counter_volume']
-        ts = meter['timestamp']
-        stat.unit = meter['counter_unit']
-        stat.min = min(vol, stat.min or vol)
-        stat.max = max(vol, stat.max)
-        stat.sum = vol + (stat.sum or 0)
-        stat.count += 1
-        stat.avg = (stat.sum / float(stat.count))
-        stat.duration_start = min(ts, stat.duration_start or ts)
-        stat.duration_end = max(ts, stat.duration_end or ts)
-        stat.duration = (timeutils.delta_seconds(stat.duration_start,
-                                                 stat.duration_end))
+        fields = []
+        for a in aggregate or []:
+            if (a.func in STANDARD_AGGREGATES or
+                    a.func in UNPARAMETERIZED_AGGREGATES):
+                continue
+            validate = PARAMETERIZED_AGGREGATES['validate'].get(a.func)
+            if not validate:
+                raise ceilometer.NotImplementedError(
+                    'Selectable aggregate function %s'
+                    ' is not supported' % a.func)
+            if not validate(a.param):
+                raise storage.StorageBadAggregate('Bad aggregate: %s.%s'
+                                                  % (a.func, a.param))
+            fields.append(a.param)
+        return fields
 
     def get_meter_statistics(self, sample_filter, period=None, groupby=None,
                              aggregate=None):
@@ -345,78 +490,80 @@ class Connection(hbase_base.Connection, base.Connection):
         .. note::
 
           Due to HBase limitations the aggregations are implemented
-          in the driver itself, therefore this method will be quite slow
-          because of all the Thrift traffic it is going to create.
+          in the driver itself. The matching samples are streamed from
+          the meter table and reduced in a single pass, so only the
+          running statistics of each period and group are kept in memory.
         """
-        if groupby:
-            raise ceilometer.NotImplementedError("Group by not implemented.")
-
-        if aggregate:
+        groupby = groupby or []
+        if set(groupby) - set(GROUPBY_FIELDS):
             raise ceilometer.NotImplementedError(
-                'Selectable aggregates not implemented')
+                "Unable to group by these fields")
+        cardinality = self._get_cardinality_fields(aggregate)
 
         with self.conn_pool.connection() as conn:
             meter_table = conn.table(self.METER_TABLE)
             q, start, stop, columns = (hbase_utils.
                                        make_sample_query_from_filter
                                        (sample_filter))
-            # These fields are used in statistics' calculating
-            columns.extend(['f:timestamp', 'f:counter_volume',
-                            'f:counter_unit'])
-            meters = map(hbase_utils.deserialize_entry,
-                         list(meter for (ignored, meter) in
-                              meter_table.scan(
-                                  filter=q, row_start=start,
-                                  row_stop=stop, columns=columns)))
-
-        if sample_filter.start_timestamp:
-            start_time = sample_filter.start_timestamp
-        elif meters:
-            start_time = meters[-1][0]['timestamp']
-        else:
-            start_time = None
+            # Only the columns used by the filter and the statistics are
+            # fetched, not the whole message.
+            columns = [c for c in columns
+                       if c not in ('f:message', 'f:recorded_at')]
+            columns.append('f:timestamp')
+            ts_columns = list(columns)
+            columns.extend(['f:counter_volume', 'f:counter_unit'])
+            columns.extend(set(_field_column(f)
+                               for f in groupby + cardinality))
+
+            def scan(columns):
+                return (meter for (ignored, meter) in meter_table.scan(
+                    filter=q, row_start=start, row_stop=stop,
+                    columns=columns,
+                    batch_size=cfg.CONF.database.hbase_scan_batch_size))
 
-        if sample_filter.end_timestamp:
-            end_time = sample_filter.end_timestamp
-        elif meters:
-            end_time = meters[0][0]['timestamp']
-        else:
-            end_time = None
+            start_time = sample_filter.start_timestamp
+            if period and not start_time:
+                # NOTE: the periods are aligned on the oldest sample, which
+                # comes last as HBase meters are stored as newest-first, so
+                # look it up beforehand reading the timestamps only.
+                oldest = None
+                for oldest in scan(ts_columns):
+                    pass
+                if oldest is None:
+                    return []
+                start_time = hbase_utils.deserialize_entry(
+                    oldest)[0]['timestamp']
+
+            stats = {}
+            for meter in scan(columns):
+                meter, ignored, ignored, metadata = (
+                    hbase_utils.deserialize_entry(meter, get_raw_meta=False))
+                ts = meter['timestamp']
+                index = (int(timeutils.delta_seconds(start_time, ts) / period)
+                         if period else 0)
+                key = (index, tuple(_field_value(meter, metadata, g)
+                                    for g in groupby))
+                stat = stats.get(key)
+                if stat is None:
+                    stat = stats[key] = _StatisticsAccumulator(cardinality)
+                stat.update(meter['counter_volume'], ts,
+                            meter['counter_unit'],
+                            dict((f, _field_value(meter, metadata, f))
+                                 for f in cardinality))
 
         results = []
-
-        if not period:
-            period = 0
-            period_start = start_time
-            period_end = end_time
-
-        # As our HBase meters are stored as newest-first, we need to iterate
-        # in the reverse order
-        for meter in meters[::-1]:
-            ts = meter[0]['timestamp']
+        for (index, group), stat in sorted(six.iteritems(stats),
+                                           key=lambda item: item[0][0]):
             if period:
-                offset = int(timeutils.delta_seconds(
-                    start_time, ts) / period) * period
-                period_start = start_time + datetime.timedelta(0, offset)
-
-            if not results or not results[-1].period_start == period_start:
-                if period:
-                    period_end = period_start + datetime.timedelta(
-                        0, period)
-                results.append(
-                    models.Statistics(unit='',
-                                      count=0,
-                                      min=0,
-                                      max=0,
-                                      avg=0,
-                                      sum=0,
-                                      period=period,
-                                      period_start=period_start,
-                                      period_end=period_end,
-                                      duration=None,
-                                      duration_start=None,
-                                      duration_end=None,
-                                      groupby=None)
-                )
-            self._update_meter_stats(results[-1], meter[0])
+                period_start = start_time + datetime.timedelta(
+                    seconds=index * period)
+                period_end = period_start + datetime.timedelta(
+                    seconds=period)
+            else:
+                period_start = (sample_filter.start_timestamp or
+                                stat.duration_start)
+                period_end = sample_filter.end_timestamp or stat.duration_end
+            results.append(stat.to_model(
+                period or 0, period_start, period_end,
+                dict(zip(groupby, group)) if groupby else None, aggregate))
         return results
@@ -396,8 +396,15 @@ class Connection(pymongo_base.Connection):
         self.conn = self.CONNECTION_POOL.connect(url)
 
         # Require MongoDB 2.4 to use $setOnInsert
-        if self.conn.server_info()['versionArray'] < [2, 4]:
+        version = self.conn.server_info()['versionArray']
+        if version < [2, 4]:
             raise storage.StorageBadVersion("Need at least MongoDB 2.4")
+        # MongoDB 2.6 and pymongo 2.7 are needed for bulk operations and the
+        # $min/$max update operators.
+        self._bulk_resource_update = (
+            version >= [2, 6] and
+            hasattr(pymongo.collection.Collection,
+                    'initialize_unordered_bulk_op'))
 
         connection_options = pymongo.uri_parser.parse_uri(url)
         self.db = getattr(self.conn, connection_options['database'])
@@ -487,13 +494,122 @@ class Connection(pymongo_base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        The resources of the batch are upserted with a single unordered bulk
+        operation (when the server supports it) and the raw samples are
+        written to the meter collection with a single bulk insert.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+        records = []
+        for data in samples:
+            # Use a copy so we do not modify a data structure owned by our
+            # caller, the metadata is only copied if its keys have to be
+            # improved. The _id given by our caller, if any, lets a sample
+            # recorded again, e.g. one by one after the bulk insert failed
+            # partway, not be duplicated.
+            record = copy.copy(data)
+            record.setdefault('_id', bson.objectid.ObjectId())
+            metadata = data['resource_metadata']
+            if pymongo_utils.has_unsafe_keys(metadata):
+                metadata = pymongo_utils.improve_keys(copy.deepcopy(metadata))
+            record['resource_metadata'] = metadata
+            record['recorded_at'] = timeutils.utcnow()
+            records.append(record)
+
+        if self._bulk_resource_update:
+            self._update_resources_bulk(records)
+        else:
+            for record in records:
+                self._update_resource(record)
+
+        # Record the raw data for the meters.
+        try:
+            self.db.meter.insert(records)
+        except pymongo.errors.DuplicateKeyError:
+            if len(records) > 1:
+                raise
+            LOG.debug(_('Sample %s already recorded'), records[0]['_id'])
+
+    def _update_resources_bulk(self, records):
+        """Upsert the resources of a batch of samples in one round-trip.
+
+        The samples of each resource are folded together, then one upsert
+        per resource records the owner, the meters and the first/last sample
+        timestamps (using $min/$max so that out-of-order samples are handled
+        by the server) and one conditional update refreshes the metadata if
+        the batch holds the most recent sample of the resource. Both updates
+        give the same result whatever the order they are applied in, so they
+        can be sent as an unordered bulk operation.
+
+        :param records: list of samples with improved metadata keys
+        """
+        resources = {}
+        for record in records:
+            ts = record['timestamp']
+            meter = {'counter_name': record['counter_name'],
+                     'counter_type': record['counter_type'],
+                     'counter_unit': record['counter_unit']}
+            resource = resources.get(record['resource_id'])
+            if resource is None:
+                resource = resources[record['resource_id']] = {
+                    'first': ts, 'newest': record, 'meters': []}
+            resource['first'] = min(resource['first'], ts)
+            if resource['newest']['timestamp'] <= ts:
+                resource['newest'] = record
+            # the owner of the last sample received wins
+            resource['latest'] = record
+            if meter not in resource['meters']:
+                resource['meters'].append(meter)
+
+        bulk = self.db.resource.initialize_unordered_bulk_op()
+        for resource_id, resource in six.iteritems(resources):
+            newest = resource['newest']
+            latest = resource['latest']
+            bulk.find({'_id': resource_id}).upsert().update_one(
+                {'$set': {'project_id': latest['project_id'],
+                          'user_id': latest['user_id'],
+                          'source': latest['source'],
+                          },
+                 '$setOnInsert': {'metadata': newest['resource_metadata']},
+                 # NOTE: a null first sample timestamp is lower than any
+                 # date, so it is never updated, as it indicates a
+                 # pre-existing resource document dating from before we
+                 # started recording these timestamps.
+                 '$min': {'first_sample_timestamp': resource['first']},
+                 '$max': {'last_sample_timestamp': newest['timestamp']},
+                 '$addToSet': {'meter': {'$each': resource['meters']}},
+                 })
+            # only update the metadata if the sample is actually the latest
+            # one (the usual in-order case)
+            bulk.find({'_id': resource_id,
+                       '$or': [{'last_sample_timestamp':
+                                {'$lte': newest['timestamp']}},
+                               {'last_sample_timestamp': None}]}).update_one(
+                {'$set': {'metadata': newest['resource_metadata']}})
+        # NOTE: all the operations are idempotent, so it is safe to run
+        # them again when reconnecting.
+        pymongo_utils.safe_mongo_call(bulk.execute)()
+
+    def _update_resource(self, data):
+        """Record the resource of a sample, one update at a time.
+
+        This is used with MongoDB servers not supporting bulk operations
+        and the $min/$max update operators.
+
+        :param data: sample with improved metadata keys
+        """
         # Record the updated resource metadata - we use $setOnInsert to
         # unconditionally insert sample timestamps and resource metadata
         # (in the update case, this must be conditional on the sample not
         # being out-of-order)
-        data = copy.deepcopy(data)
-        data['resource_metadata'] = pymongo_utils.improve_keys(
-            data.pop('resource_metadata'))
         resource = self.db.resource.find_and_modify(
             {'_id': data['resource_id']},
             {'$set': {'project_id': data['project_id'],
@@ -538,13 +654,6 @@ class Connection(pymongo_base.Connection):
                 {'$set': {'first_sample_timestamp': data['timestamp']}}
             )
 
-        # Record the raw data for the meter. Use a copy so we do not
-        # modify a data structure owned by our caller (the driver adds
-        # a new key '_id').
-        record = copy.copy(data)
-        record['recorded_at'] = timeutils.utcnow()
-        self.db.meter.insert(record)
-
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
 
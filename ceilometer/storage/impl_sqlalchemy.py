@@ -17,9 +17,13 @@
 """SQLAlchemy storage backend."""
 
 from __future__ import absolute_import
+import calendar
+import copy
 import datetime
 import hashlib
+import math
 import os
+import time
 
 from oslo.config import cfg
 from oslo.db import exception as dbexc
@@ -40,6 +44,7 @@ from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage import models as api_models
 from ceilometer.storage.sqlalchemy import models
+from ceilometer.storage.sqlalchemy import partition
 from ceilometer.storage.sqlalchemy import utils as sql_utils
 from ceilometer import utils
 
@@ -58,6 +63,16 @@ UNPARAMETERIZED_AGGREGATES = dict(
     stddev=func.stddev_pop(models.Sample.volume).label('stddev')
 )
 
+ROLLUP_AGGREGATES = dict(
+    avg=(func.sum(models.Rollup.volume_sum) /
+         sa.cast(func.sum(models.Rollup.sample_count), sa.Float)).label('avg'),
+    sum=func.sum(models.Rollup.volume_sum).label('sum'),
+    min=func.min(models.Rollup.volume_min).label('min'),
+    max=func.max(models.Rollup.volume_max).label('max'),
+    count=sa.cast(func.sum(models.Rollup.sample_count),
+                  sa.BigInteger).label('count')
+)
+
 PARAMETERIZED_AGGREGATES = dict(
     validate=dict(
         cardinality=lambda p: p in ['resource_id', 'user_id', 'project_id']
@@ -69,6 +84,109 @@ PARAMETERIZED_AGGREGATES = dict(
     )
 )
 
+
+def _mysql_period_bucket(start, period):
+    # NOTE: timestamps are stored as decimal epoch in MySQL
+    ts = sa.type_coerce(models.Sample.timestamp, sa.Numeric(20, 6))
+    start = sa.literal(utils.dt_to_decimal(start), sa.Numeric(20, 6))
+    return func.floor((ts - start) / period)
+
+
+def _postgresql_period_bucket(start, period):
+    ts = sa.type_coerce(models.Sample.timestamp, sa.DateTime)
+    start = sa.literal(start, sa.DateTime)
+    return func.floor(sa.extract('epoch', ts - start) / period)
+
+
+def _sqlite_period_bucket(start, period):
+    # NOTE: timestamps are stored as 'YYYY-MM-DD HH:MM:SS.ffffff' strings in
+    # SQLite, convert them to microseconds since epoch so that the bucket is
+    # computed with integer arithmetic. The fraction is stripped before
+    # calling strftime() as SQLite rounds it to milliseconds.
+    ts = sa.type_coerce(models.Sample.timestamp, sa.String)
+    ts_usec = (sa.cast(func.strftime('%s', func.substr(ts, 1, 19)),
+                       sa.Integer) * 1000000 +
+               sa.cast(func.substr(ts, 21, 6), sa.Integer))
+    start_usec = (calendar.timegm(start.utctimetuple()) * 1000000 +
+                  start.microsecond)
+    return (ts_usec - start_usec) / (int(period) * 1000000)
+
+
+_ROLLUP_KEY = ('resolution', 'timestamp', 'meter_id', 'resource_id')
+_ROLLUP_MERGE = (('sample_count', '%(old)s + %(new)s'),
+                 ('volume_sum', '%(old)s + %(new)s'),
+                 ('volume_min', 'LEAST(%(old)s, %(new)s)'),
+                 ('volume_max', 'GREATEST(%(old)s, %(new)s)'),
+                 ('first_timestamp', 'LEAST(%(old)s, %(new)s)'),
+                 ('last_timestamp', 'GREATEST(%(old)s, %(new)s)'))
+
+
+def _rollup_upsert(on_duplicate, old, new):
+    """Build the statement inserting or merging rollup buckets.
+
+    :param on_duplicate: the clause updating a duplicate bucket, formatted
+                         with its assignments
+    :param old: the existing value of a column, formatted with its name
+    :param new: the inserted value of a column, formatted with its name
+    """
+    rollup = models.Rollup.__table__
+    columns = _ROLLUP_KEY + tuple(c for c, _merge in _ROLLUP_MERGE)
+    assignments = ', '.join(
+        '%s = %s' % (c, merge % dict(old=old % c, new=new % c))
+        for c, merge in _ROLLUP_MERGE)
+    return sa.text(
+        'INSERT INTO rollup (%s) VALUES (%s) ' % (
+            ', '.join(columns), ', '.join(':' + c for c in columns)) +
+        on_duplicate % assignments,
+        bindparams=[sa.bindparam(c, type_=rollup.c[c].type)
+                    for c in columns])
+
+
+def _mysql_rollup_upsert():
+    return _rollup_upsert('ON DUPLICATE KEY UPDATE %s', '%s', 'VALUES(%s)')
+
+
+def _postgresql_rollup_upsert():
+    # NOTE: ON CONFLICT requires PostgreSQL 9.5 or later.
+    return _rollup_upsert(
+        'ON CONFLICT (%s) DO UPDATE SET %%s' % ', '.join(_ROLLUP_KEY),
+        'rollup.%s', 'EXCLUDED.%s')
+
+
+def _epoch(timestamp):
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def _rollup_resolutions():
+    return sorted(set(int(r) for r in cfg.CONF.database.rollup_resolutions))
+
+
+def _id_ranges(ids):
+    """Group ids into (first, last) ranges of consecutive values."""
+    ranges = []
+    for i in sorted(ids):
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
+# Expressions computing, per SQL dialect, the index of the period a sample
+# belongs to, used to get statistics of all periods with a single query.
+PERIOD_BUCKETS = {
+    'mysql': _mysql_period_bucket,
+    'postgresql': _postgresql_period_bucket,
+    'sqlite': _sqlite_period_bucket,
+}
+
+# Statements inserting or merging, per SQL dialect, the rollup buckets of a
+# batch of samples with a single executemany.
+ROLLUP_UPSERTS = {
+    'mysql': _mysql_rollup_upsert,
+    'postgresql': _postgresql_rollup_upsert,
+}
+
 AVAILABLE_CAPABILITIES = {
     'meters': {'query': {'simple': True,
                          'metadata': True}},
@@ -211,6 +329,25 @@ class Connection(base.Connection):
               message_signature: message signature
               message_id: message uuid
               }
+        - rollup
+          - the samples pre-aggregated per bucket of resolution seconds
+          - { meter_id: meter id            (->meter.id)
+              resolution: bucket length in seconds
+              timestamp: bucket start, in seconds since epoch
+              resource_id: resource id      (->resource.internal_id)
+              sample_count: number of samples
+              volume_sum: sum of the sample volumes
+              volume_min: minimum sample volume
+              volume_max: maximum sample volume
+              first_timestamp: datetime of the first sample
+              last_timestamp: datetime of the last sample
+              }
+        - rollup_resolution
+          - the maintained rollup resolutions
+          - { resolution: bucket length in seconds
+              since: start of the first complete bucket, in seconds since
+                     epoch
+              }
     """
     CAPABILITIES = utils.update_nested(base.Connection.CAPABILITIES,
                                        AVAILABLE_CAPABILITIES)
@@ -229,13 +366,32 @@ class Connection(base.Connection):
             url,
             **dict(cfg.CONF.database.items())
         )
+        self._rollups_registered = False
+        self._partition_manager = partition.get_manager(
+            self._engine_facade.get_engine().dialect.name)
+        self._partitions = None
+        # NOTE: caches of the internal ids of meter and resource
+        # definitions, saving a SELECT for every recorded sample. A cached
+        # id deleted by the expirer of another process is only noticed
+        # thanks to the foreign keys of the samples, the cache is disabled
+        # without them.
+        cache_size = cfg.CONF.database.sql_id_cache_size
+        if (self._partition_manager is not None and
+                not self._partition_manager.foreign_keys):
+            cache_size = 0
+        self._meter_cache = utils.LRUCache(cache_size)
+        self._resource_cache = utils.LRUCache(cache_size)
 
     def upgrade(self):
         # NOTE(gordc): to minimise memory, only import migration when needed
         from oslo.db.sqlalchemy import migration
         path = os.path.join(os.path.abspath(os.path.dirname(__file__)),
                             'sqlalchemy', 'migrate_repo')
-        migration.db_sync(self._engine_facade.get_engine(), path)
+        engine = self._engine_facade.get_engine()
+        migration.db_sync(engine, path)
+        if self._partition_manager is not None:
+            with engine.begin() as conn:
+                self._partition_manager.setup(conn)
 
     def clear(self):
         engine = self._engine_facade.get_engine()
@@ -243,10 +399,16 @@ class Connection(base.Connection):
             engine.execute(table.delete())
         self._engine_facade._session_maker.close_all()
         engine.dispose()
+        self._clear_id_caches()
+        self._rollups_registered = False
+        self._partitions = None
+
+    def _clear_id_caches(self):
+        self._meter_cache.clear()
+        self._resource_cache.clear()
 
     @staticmethod
     def _create_meter(conn, name, type, unit):
-        # TODO(gordc): implement lru_cache to improve performance
         try:
             meter = models.Meter.__table__
             trans = conn.begin_nested()
@@ -269,14 +431,103 @@ class Connection(base.Connection):
 
         return meter_id
 
+    @staticmethod
+    def _update_rollups(conn, rollups):
+        """Add the buckets aggregated from a batch of samples to the rollups.
+
+        MySQL and PostgreSQL merge all of them with a single upsert
+        statement, the buckets are updated and inserted one by one otherwise.
+        """
+        upsert = ROLLUP_UPSERTS.get(conn.dialect.name)
+        if upsert is None:
+            for key, bucket in six.iteritems(rollups):
+                Connection._update_rollup(conn, key, *bucket)
+            return
+        columns = _ROLLUP_KEY + tuple(c for c, _merge in _ROLLUP_MERGE)
+        conn.execute(upsert(), [dict(zip(columns, key + tuple(bucket)))
+                                for key, bucket in six.iteritems(rollups)])
+
+    @staticmethod
+    def _update_rollup(conn, key, count, vsum, vmin, vmax, first, last):
+        rollup = models.Rollup.__table__
+        resolution, timestamp, meter_id, resource_id = key
+        first = sa.literal(first, models.PreciseTimestamp())
+        last = sa.literal(last, models.PreciseTimestamp())
+        try:
+            trans = conn.begin_nested()
+            if conn.dialect.name == 'sqlite':
+                trans = conn.begin()
+            with trans:
+                result = conn.execute(
+                    rollup.update()
+                    .where(sa.and_(rollup.c.resolution == resolution,
+                                   rollup.c.timestamp == timestamp,
+                                   rollup.c.meter_id == meter_id,
+                                   rollup.c.resource_id == resource_id))
+                    .values(sample_count=rollup.c.sample_count + count,
+                            volume_sum=rollup.c.volume_sum + vsum,
+                            volume_min=sa.case(
+                                [(rollup.c.volume_min > vmin, vmin)],
+                                else_=rollup.c.volume_min),
+                            volume_max=sa.case(
+                                [(rollup.c.volume_max < vmax, vmax)],
+                                else_=rollup.c.volume_max),
+                            first_timestamp=sa.case(
+                                [(rollup.c.first_timestamp > first, first)],
+                                else_=rollup.c.first_timestamp),
+                            last_timestamp=sa.case(
+                                [(rollup.c.last_timestamp < last, last)],
+                                else_=rollup.c.last_timestamp)))
+                if not result.rowcount:
+                    conn.execute(rollup.insert(), resolution=resolution,
+                                 timestamp=timestamp, meter_id=meter_id,
+                                 resource_id=resource_id, sample_count=count,
+                                 volume_sum=vsum, volume_min=vmin,
+                                 volume_max=vmax,
+                                 first_timestamp=first.value,
+                                 last_timestamp=last.value)
+        except dbexc.DBDuplicateEntry:
+            # retry function to update the duplicate committed bucket
+            Connection._update_rollup(conn, key, count, vsum, vmin, vmax,
+                                      first.value, last.value)
+
+    def _register_rollups(self):
+        """Register the configured rollup resolutions in the database.
+
+        A new resolution is only complete from its next bucket on, which is
+        recorded so that statistics queries starting earlier are not answered
+        from it. Resolutions no longer configured are unregistered.
+        """
+        resolutions = set(_rollup_resolutions())
+        table = models.RollupResolution.__table__
+        now = _epoch(timeutils.utcnow())
+        engine = self._engine_facade.get_engine()
+        try:
+            with engine.begin() as conn:
+                registered = set(r for r, in conn.execute(
+                    sa.select([table.c.resolution])))
+                stale = registered - resolutions
+                if stale:
+                    conn.execute(table.delete()
+                                 .where(table.c.resolution.in_(stale)))
+                for r in resolutions - registered:
+                    conn.execute(table.insert(), resolution=r,
+                                 since=now - now % r + r)
+        except dbexc.DBDuplicateEntry:
+            # registered concurrently by another collector
+            return self._register_rollups()
+        self._rollups_registered = True
+
+    @staticmethod
+    def _metadata_hash(rmeta):
+        return hashlib.md5(jsonutils.dumps(rmeta, sort_keys=True)).hexdigest()
+
     @staticmethod
     def _create_resource(conn, res_id, user_id, project_id, source_id,
-                         rmeta):
-        # TODO(gordc): implement lru_cache to improve performance
+                         rmeta, m_hash=None):
+        m_hash = m_hash or Connection._metadata_hash(rmeta)
         try:
             res = models.Resource.__table__
-            m_hash = hashlib.md5(jsonutils.dumps(rmeta,
-                                                 sort_keys=True)).hexdigest()
             trans = conn.begin_nested()
             if conn.dialect.name == 'sqlite':
                 trans = conn.begin()
@@ -317,7 +568,7 @@ class Connection(base.Connection):
         except dbexc.DBDuplicateEntry:
             # retry function to pick up duplicate committed object
             internal_id = Connection._create_resource(
-                conn, res_id, user_id, project_id, source_id, rmeta)
+                conn, res_id, user_id, project_id, source_id, rmeta, m_hash)
 
         return internal_id
 
@@ -327,33 +578,174 @@ class Connection(base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        The meter and resource definitions are resolved one by one, but all
+        the samples are written with a single multi-row INSERT in the same
+        transaction.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+        try:
+            self._record_samples(samples)
+        except dbexc.DBReferenceError:
+            # NOTE: a cached meter or resource definition may have been
+            # removed by an expirer running in another process, retry with
+            # ids fetched from the database.
+            self._clear_id_caches()
+            self._record_samples(samples)
+        except dbexc.DBDuplicateEntry:
+            # NOTE: a rollup bucket has been concurrently created by another
+            # collector, retry updating it.
+            self._record_samples(samples)
+
+    def _ensure_partitions(self, starts):
+        """Create the partitions missing to store samples, if any."""
+        manager = self._partition_manager
+        if self._partitions is not None and not manager.missing(
+                self._partitions, starts):
+            return
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            self._partitions = manager.partitions(conn)
+        for start in manager.missing(self._partitions, starts):
+            try:
+                with engine.begin() as conn:
+                    manager.create(conn, start)
+                LOG.info(_("Partition %s of samples created"),
+                         manager.name(start))
+            except dbexc.DBError as e:
+                # NOTE: the partition may have been concurrently created by
+                # another collector, otherwise storing the samples fails.
+                LOG.debug(_("Partition %(name)s of samples not created: "
+                            "%(error)s"), {'name': manager.name(start),
+                                           'error': e})
+        with engine.begin() as conn:
+            self._partitions = manager.partitions(conn)
+
+    def _record_samples(self, samples):
+        meter_ids = {}
+        resource_ids = {}
+        resolutions = _rollup_resolutions()
+        if not self._rollups_registered:
+            self._register_rollups()
+        manager = self._partition_manager
+        if manager is not None:
+            self._ensure_partitions(
+                [manager.start(_epoch(data['timestamp']))
+                 for data in samples])
+        rollups = {}
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            rows = []
+            for data in samples:
+                m_key = (data['counter_name'], data['counter_type'],
+                         data['counter_unit'])
+                m_id = meter_ids.get(m_key) or self._meter_cache.get(m_key)
+                if m_id is None:
+                    m_id = self._create_meter(conn, *m_key)
+                meter_ids[m_key] = m_id
+
+                rmeta = data['resource_metadata']
+                m_hash = self._metadata_hash(rmeta)
+                res_key = (data['resource_id'], data['user_id'],
+                           data['project_id'], data['source'], m_hash)
+                res_id = (resource_ids.get(res_key) or
+                          self._resource_cache.get(res_key))
+                if res_id is None:
+                    res_id = self._create_resource(conn,
+                                                   data['resource_id'],
+                                                   data['user_id'],
+                                                   data['project_id'],
+                                                   data['source'],
+                                                   rmeta, m_hash)
+                resource_ids[res_key] = res_id
+
+                rows.append({'meter_id': m_id,
+                             'resource_id': res_id,
+                             'timestamp': data['timestamp'],
+                             'volume': data['counter_volume'],
+                             'message_signature': data['message_signature'],
+                             'message_id': data['message_id']})
+
+                ts = data['timestamp']
+                epoch = _epoch(ts)
+                volume = data['counter_volume']
+                for r in resolutions:
+                    key = (r, epoch - epoch % r, m_id, res_id)
+                    bucket = rollups.get(key)
+                    if bucket is None:
+                        rollups[key] = [1, volume, volume, volume, ts, ts]
+                    else:
+                        bucket[0] += 1
+                        bucket[1] += volume
+                        bucket[2] = min(bucket[2], volume)
+                        bucket[3] = max(bucket[3], volume)
+                        bucket[4] = min(bucket[4], ts)
+                        bucket[5] = max(bucket[5], ts)
+            # Record the raw data for the samples.
+            if manager is None:
+                conn.execute(models.Sample.__table__.insert(), rows)
+            else:
+                self._insert_partitioned_samples(conn, rows)
+            # Add them to the rollups in the same transaction.
+            self._update_rollups(conn, rollups)
+
+        # Only cache the ids once the transaction creating them is committed.
+        self._meter_cache.update(meter_ids)
+        self._resource_cache.update(resource_ids)
+
+    def _insert_partitioned_samples(self, conn, rows):
+        manager = self._partition_manager
+        now = timeutils.utcnow()
+        tables = {}
+        for row in rows:
+            row['recorded_at'] = now
+            table = manager.table(manager.start(_epoch(row['timestamp'])))
+            tables.setdefault(table.name, (table, []))[1].append(row)
+        for table, table_rows in six.itervalues(tables):
+            conn.execute(table.insert(), table_rows)
+
+    def _drop_expired_partitions(self, ttl):
+        """Drop the partitions only holding samples older than the ttl."""
+        manager = self._partition_manager
+        end = _epoch(timeutils.utcnow() - datetime.timedelta(seconds=ttl))
         engine = self._engine_facade.get_engine()
         with engine.begin() as conn:
-            # Record the raw data for the sample.
-            m_id = self._create_meter(conn,
-                                      data['counter_name'],
-                                      data['counter_type'],
-                                      data['counter_unit'])
-            res_id = self._create_resource(conn,
-                                           data['resource_id'],
-                                           data['user_id'],
-                                           data['project_id'],
-                                           data['source'],
-                                           data['resource_metadata'])
-            sample = models.Sample.__table__
-            conn.execute(sample.insert(), meter_id=m_id,
-                         resource_id=res_id,
-                         timestamp=data['timestamp'],
-                         volume=data['counter_volume'],
-                         message_signature=data['message_signature'],
-                         message_id=data['message_id'])
+            starts = manager.partitions(conn)
+        for start in starts:
+            if start + manager.period > end:
+                break
+            with engine.begin() as conn:
+                manager.drop(conn, start)
+            LOG.info(_("Partition %s of expired samples dropped"),
+                     manager.name(start))
+        self._partitions = None
 
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
 
-        Clearing occurs according to the time-to-live.
+        Clearing occurs according to the time-to-live. When the samples are
+        partitioned, the partitions holding expired samples only are
+        dropped before deleting the remaining expired samples.
         :param ttl: Number of seconds to keep records for.
         """
+        if self._partition_manager is not None:
+            self._drop_expired_partitions(ttl)
+
+        if cfg.CONF.database.sql_expire_batch_size > 0:
+            try:
+                self._clear_expired_metering_data_in_batches(ttl)
+            finally:
+                # the definitions removed may be cached
+                self._clear_id_caches()
+            return
 
         session = self._engine_facade.get_session()
         with session.begin():
@@ -369,6 +761,9 @@ class Connection(base.Connection):
                  .delete())
 
             rows = sample_q.delete()
+            # NOTE: expire the rollup buckets before the definitions deleted
+            # below as they may reference them.
+            self._expire_rollups(session.connection(), end)
             # remove Meter definitions with no matching samples
             (session.query(models.Meter)
              .filter(~models.Meter.samples.any())
@@ -377,6 +772,136 @@ class Connection(base.Connection):
              .filter(~models.Resource.samples.any())
              .delete(synchronize_session='fetch'))
             LOG.info(_("%d samples removed from database"), rows)
+        # the definitions removed above may be cached
+        self._clear_id_caches()
+
+    @staticmethod
+    def _expire_rollups(conn, end):
+        """Expire the rollup buckets of the samples older than end.
+
+        The buckets ending before end are removed, the ones straddling it
+        are rebuilt from the samples left so that they still match them.
+        """
+        rollup = models.Rollup.__table__
+        sample = models.Sample.__table__
+        end = _epoch(end)
+        conn.execute(rollup.delete()
+                     .where(rollup.c.timestamp + rollup.c.resolution <= end))
+        resolutions = [r[0] for r in conn.execute(
+            sa.select([rollup.c.resolution]).distinct()
+            .where(rollup.c.timestamp < end))]
+        for resolution in resolutions:
+            start = end - end % resolution
+            conn.execute(rollup.delete()
+                         .where(rollup.c.resolution == resolution)
+                         .where(rollup.c.timestamp == start))
+            buckets = conn.execute(
+                sa.select([sample.c.meter_id, sample.c.resource_id,
+                           func.count(sample.c.id),
+                           func.sum(sample.c.volume),
+                           func.min(sample.c.volume),
+                           func.max(sample.c.volume),
+                           func.min(sample.c.timestamp),
+                           func.max(sample.c.timestamp)])
+                .where(sample.c.timestamp >=
+                       datetime.datetime.utcfromtimestamp(start))
+                .where(sample.c.timestamp <
+                       datetime.datetime.utcfromtimestamp(start + resolution))
+                .group_by(sample.c.meter_id, sample.c.resource_id)).fetchall()
+            if buckets:
+                conn.execute(rollup.insert(), [
+                    dict(resolution=resolution, timestamp=start,
+                         meter_id=b[0], resource_id=b[1], sample_count=b[2],
+                         volume_sum=b[3], volume_min=b[4], volume_max=b[5],
+                         first_timestamp=b[6], last_timestamp=b[7])
+                    for b in buckets])
+
+    def _clear_expired_metering_data_in_batches(self, ttl):
+        """Clear expired data in bounded batches, committing between them.
+
+        The expired samples are looked up through the timestamp index and
+        deleted by primary key ranges. The resource definitions are then
+        scanned by primary key ranges to remove the ones left without
+        samples. As every batch is committed, an interrupted run is simply
+        resumed by the next one.
+        """
+        batch_size = cfg.CONF.database.sql_expire_batch_size
+        interval = cfg.CONF.database.sql_expire_batch_interval
+        end = timeutils.utcnow() - datetime.timedelta(seconds=ttl)
+        engine = self._engine_facade.get_engine()
+        sample = models.Sample.__table__
+        meter = models.Meter.__table__
+        resource = models.Resource.__table__
+
+        def pause():
+            if interval > 0:
+                time.sleep(interval)
+
+        rows = 0
+        while True:
+            with engine.begin() as conn:
+                ids = [r[0] for r in conn.execute(
+                    sa.select([sample.c.id])
+                    .where(sample.c.timestamp < end)
+                    .order_by(sample.c.timestamp)
+                    .limit(batch_size))]
+                for first, last in _id_ranges(ids):
+                    conn.execute(sample.delete()
+                                 .where(sample.c.id.between(first, last)))
+            rows += len(ids)
+            if len(ids) < batch_size:
+                break
+            LOG.info(_("%d expired samples removed so far"), rows)
+            pause()
+        LOG.info(_("%d samples removed from database"), rows)
+
+        with engine.begin() as conn:
+            # NOTE: expire the rollup buckets before the definitions deleted
+            # below as they may reference them.
+            self._expire_rollups(conn, end)
+            # remove Meter definitions with no matching samples
+            conn.execute(meter.delete().where(
+                ~sa.exists().where(sample.c.meter_id == meter.c.id)))
+
+        # remove Resource definitions with no matching samples
+        scanned = removed = 0
+        last_id = None
+        while True:
+            with engine.begin() as conn:
+                query = sa.select([resource.c.internal_id])
+                if last_id is not None:
+                    query = query.where(resource.c.internal_id > last_id)
+                ids = [r[0] for r in conn.execute(
+                    query.order_by(resource.c.internal_id).limit(batch_size))]
+                if not ids:
+                    break
+                last_id = ids[-1]
+                orphans = [r[0] for r in conn.execute(
+                    sa.select([resource.c.internal_id])
+                    .where(resource.c.internal_id.between(ids[0], last_id))
+                    .where(~sa.exists().where(
+                        sample.c.resource_id == resource.c.internal_id)))]
+                for first, last in _id_ranges(orphans):
+                    for table in [models.MetaText, models.MetaBigInt,
+                                  models.MetaFloat, models.MetaBool]:
+                        table = table.__table__
+                        conn.execute(table.delete()
+                                     .where(table.c.id.between(first, last))
+                                     .where(~sa.exists().where(
+                                         sample.c.resource_id == table.c.id)))
+                    conn.execute(resource.delete()
+                                 .where(resource.c.internal_id.between(
+                                     first, last))
+                                 .where(~sa.exists().where(
+                                     sample.c.resource_id ==
+                                     resource.c.internal_id)))
+            scanned += len(ids)
+            removed += len(orphans)
+            LOG.info(_("%(scanned)d resources scanned, %(removed)d removed "
+                       "so far"), {'scanned': scanned, 'removed': removed})
+            if len(ids) < batch_size:
+                break
+            pause()
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
@@ -614,14 +1139,28 @@ class Connection(base.Connection):
 
         return functions
 
-    def _make_stats_query(self, sample_filter, groupby, aggregate):
-
-        select = [
-            func.min(models.Sample.timestamp).label('tsmin'),
-            func.max(models.Sample.timestamp).label('tsmax'),
-            models.Meter.unit
-        ]
-        select.extend(self._get_aggregate_functions(aggregate))
+    def _make_stats_query(self, sample_filter, groupby, aggregate,
+                          rollup=False):
+
+        if rollup:
+            table = models.Rollup
+            select = [
+                func.min(models.Rollup.first_timestamp).label('tsmin'),
+                func.max(models.Rollup.last_timestamp).label('tsmax'),
+                models.Meter.unit
+            ]
+            select.extend(ROLLUP_AGGREGATES[a.func]
+                          for a in aggregate or [])
+            if not aggregate:
+                select.extend(ROLLUP_AGGREGATES.values())
+        else:
+            table = models.Sample
+            select = [
+                func.min(models.Sample.timestamp).label('tsmin'),
+                func.max(models.Sample.timestamp).label('tsmax'),
+                models.Meter.unit
+            ]
+            select.extend(self._get_aggregate_functions(aggregate))
 
         session = self._engine_facade.get_session()
 
@@ -640,9 +1179,9 @@ class Connection(base.Connection):
         query = (
             session.query(*select)
             .join(models.Meter,
-                  models.Meter.id == models.Sample.meter_id)
+                  models.Meter.id == table.meter_id)
             .join(models.Resource,
-                  models.Resource.internal_id == models.Sample.resource_id)
+                  models.Resource.internal_id == table.resource_id)
             .group_by(models.Meter.unit))
 
         if groupby:
@@ -704,6 +1243,15 @@ class Connection(base.Connection):
                     raise ceilometer.NotImplementedError('Unable to group by '
                                                          'these fields')
 
+        resolution = self._get_rollup_resolution(sample_filter, period,
+                                                 aggregate)
+        if resolution:
+            stats = self._get_rollup_statistics(resolution, sample_filter,
+                                                period, groupby, aggregate)
+            for stat in stats:
+                yield stat
+            return
+
         if not period:
             for res in self._make_stats_query(sample_filter,
                                               groupby,
@@ -724,16 +1272,25 @@ class Connection(base.Connection):
                 # sample has found with sample filter(s).
                 return
 
+        start = sample_filter.start_timestamp or res.tsmin
+        end = sample_filter.end_timestamp or res.tsmax
+        dialect = self._engine_facade.get_engine().dialect.name
+        if dialect in PERIOD_BUCKETS:
+            stats = self._get_period_statistics(PERIOD_BUCKETS[dialect],
+                                                sample_filter, start, end,
+                                                period, groupby, aggregate)
+            for stat in stats:
+                yield stat
+            return
+
         query = self._make_stats_query(sample_filter, groupby, aggregate)
         # HACK(jd) This is an awful method to compute stats by period, but
         # since we're trying to be SQL agnostic we have to write portable
         # code, so here it is, admire! We're going to do one request to get
         # stats by period. We would like to use GROUP BY, but there's no
         # portable way to manipulate timestamp in SQL, so we can't.
-        for period_start, period_end in base.iter_period(
-                sample_filter.start_timestamp or res.tsmin,
-                sample_filter.end_timestamp or res.tsmax,
-                period):
+        # NOTE: this is only used for dialects not in PERIOD_BUCKETS.
+        for period_start, period_end in base.iter_period(start, end, period):
             q = query.filter(models.Sample.timestamp >= period_start)
             q = q.filter(models.Sample.timestamp < period_end)
             for r in q.all():
@@ -747,3 +1304,108 @@ class Connection(base.Connection):
                         groupby=groupby,
                         aggregate=aggregate
                     )
+
+    def _get_period_statistics(self, period_bucket, sample_filter, start, end,
+                               period, groupby, aggregate):
+        """Compute the statistics of every period with a single query.
+
+        The samples are grouped on the index of the period they belong to,
+        computed by the dialect specific period_bucket expression. The
+        periods are the same as the ones returned by base.iter_period.
+        """
+        periods = int(math.ceil(timeutils.delta_seconds(start, end)
+                                / float(period)))
+        if not periods:
+            return
+        end = start + datetime.timedelta(seconds=period * periods)
+        bucket = sa.literal_column('period_bucket')
+        query = (self._make_stats_query(sample_filter, groupby, aggregate)
+                 .add_columns(period_bucket(start, period)
+                              .label('period_bucket'))
+                 .filter(models.Sample.timestamp >= start)
+                 .filter(models.Sample.timestamp < end)
+                 .group_by(bucket)
+                 .order_by(bucket))
+        for r in query.all():
+            if r.count:
+                period_start = start + datetime.timedelta(
+                    seconds=period * int(r.period_bucket))
+                yield self._stats_result_to_model(
+                    result=r,
+                    period=int(period),
+                    period_start=period_start,
+                    period_end=period_start + datetime.timedelta(
+                        seconds=period),
+                    groupby=groupby,
+                    aggregate=aggregate
+                )
+
+    def _get_rollup_resolution(self, sample_filter, period, aggregate):
+        """Return the coarsest rollup resolution able to answer a query.
+
+        The query bounds and period must be multiples of the resolution, and
+        the start must be covered by complete rollup buckets. None is
+        returned if the raw samples have to be used.
+        """
+        resolutions = _rollup_resolutions()
+        start = sample_filter.start_timestamp
+        end = sample_filter.end_timestamp
+        if (not resolutions or not start or sample_filter.message_id or
+                sample_filter.start_timestamp_op == 'gt' or
+                sample_filter.end_timestamp_op == 'le' or
+                start.microsecond or (end and end.microsecond) or
+                any(a.func not in ROLLUP_AGGREGATES
+                    for a in aggregate or [])):
+            return None
+
+        table = models.RollupResolution
+        session = self._engine_facade.get_session()
+        since = dict(session.query(table.resolution, table.since)
+                     .filter(table.resolution.in_(resolutions)))
+        start = _epoch(start)
+        end = end and _epoch(end)
+        for r in reversed(resolutions):
+            if (r in since and since[r] <= start and not start % r and
+                    not (end and end % r) and not (period and period % r)):
+                return r
+
+    def _get_rollup_statistics(self, resolution, sample_filter, period,
+                               groupby, aggregate):
+        """Compute the statistics from the rollups of a resolution."""
+        start = _epoch(sample_filter.start_timestamp)
+        rollup_filter = copy.copy(sample_filter)
+        rollup_filter.start_timestamp = rollup_filter.end_timestamp = None
+        query = (self._make_stats_query(rollup_filter, groupby, aggregate,
+                                        rollup=True)
+                 .filter(models.Rollup.resolution == resolution)
+                 .filter(models.Rollup.timestamp >= start))
+        if sample_filter.end_timestamp:
+            query = query.filter(models.Rollup.timestamp <
+                                 _epoch(sample_filter.end_timestamp))
+        if period:
+            period_start = sa.literal_column('period_start')
+            query = (query.add_columns(
+                (models.Rollup.timestamp -
+                 (models.Rollup.timestamp - start) % int(period))
+                .label('period_start'))
+                .group_by(period_start)
+                .order_by(period_start))
+
+        for r in query.all():
+            if not r.count:
+                continue
+            if period:
+                period_start = datetime.datetime.utcfromtimestamp(
+                    int(r.period_start))
+                yield self._stats_result_to_model(
+                    result=r,
+                    period=int(period),
+                    period_start=period_start,
+                    period_end=period_start + datetime.timedelta(
+                        seconds=period),
+                    groupby=groupby,
+                    aggregate=aggregate
+                )
+            else:
+                yield self._stats_result_to_model(r, 0, r.tsmin, r.tsmax,
+                                                  groupby, aggregate)
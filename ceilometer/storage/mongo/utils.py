@@ -169,6 +169,20 @@ def quote_key(key, reverse=False):
         yield k
 
 
+def has_unsafe_keys(data):
+    """Check whether improve_keys() would change the dictionary.
+
+    :param data: is a dictionary where keys need to be checked
+    :return: True if a key, at any level, contains '.' or starts with '$'.
+    """
+    if not isinstance(data, dict):
+        return False
+    for key, value in six.iteritems(data):
+        if '.' in key or key.startswith('$') or has_unsafe_keys(value):
+            return True
+    return False
+
+
 def improve_keys(data, metaquery=False):
     """Improves keys in dict if they contained '.' or started with '$'.
 
@@ -0,0 +1,58 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import sqlalchemy as sa
+
+from ceilometer.storage.sqlalchemy import models
+
+
+def upgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    sa.Table('meter', meta, autoload=True)
+    sa.Table('resource', meta, autoload=True)
+    rollup = sa.Table(
+        'rollup', meta,
+        sa.Column('meter_id', sa.Integer, sa.ForeignKey('meter.id'),
+                  primary_key=True),
+        sa.Column('resolution', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('timestamp', sa.BigInteger, primary_key=True,
+                  autoincrement=False),
+        sa.Column('resource_id', sa.Integer,
+                  sa.ForeignKey('resource.internal_id'), primary_key=True),
+        sa.Column('sample_count', sa.BigInteger, nullable=False),
+        sa.Column('volume_sum', sa.Float(53)),
+        sa.Column('volume_min', sa.Float(53)),
+        sa.Column('volume_max', sa.Float(53)),
+        sa.Column('first_timestamp', models.PreciseTimestamp()),
+        sa.Column('last_timestamp', models.PreciseTimestamp()),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    rollup.create()
+    sa.Index('ix_rollup_resource_id', rollup.c.resource_id).create()
+
+    rollup_resolution = sa.Table(
+        'rollup_resolution', meta,
+        sa.Column('resolution', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('since', sa.BigInteger, nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    rollup_resolution.create()
+
+
+def downgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    for name in ['rollup_resolution', 'rollup']:
+        sa.Table(name, meta, autoload=True).drop()
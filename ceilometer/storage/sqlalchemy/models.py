@@ -226,6 +226,42 @@ class Sample(Base):
     message_id = Column(String(1000))
 
 
+class Rollup(Base):
+    """Pre-aggregated metering data.
+
+    Count, sum, min and max of the volume of the samples of a meter and a
+    resource, per bucket of resolution seconds starting at timestamp.
+    """
+
+    __tablename__ = 'rollup'
+    __table_args__ = (
+        Index('ix_rollup_resource_id', 'resource_id'),
+    )
+    meter_id = Column(Integer, ForeignKey('meter.id'), primary_key=True)
+    resolution = Column(Integer, primary_key=True, autoincrement=False)
+    timestamp = Column(BigInteger, primary_key=True, autoincrement=False)
+    resource_id = Column(Integer, ForeignKey('resource.internal_id'),
+                         primary_key=True)
+    sample_count = Column(BigInteger, nullable=False)
+    volume_sum = Column(Float(53))
+    volume_min = Column(Float(53))
+    volume_max = Column(Float(53))
+    first_timestamp = Column(PreciseTimestamp())
+    last_timestamp = Column(PreciseTimestamp())
+
+
+class RollupResolution(Base):
+    """Resolution of the maintained rollups.
+
+    The rollup buckets of a resolution are complete from the since
+    timestamp on.
+    """
+
+    __tablename__ = 'rollup_resolution'
+    resolution = Column(Integer, primary_key=True, autoincrement=False)
+    since = Column(BigInteger, nullable=False)
+
+
 class FullSample(Base):
     """Mapper model.
 
@@ -0,0 +1,253 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Time partitioning of the sample table.
+
+The samples are spread over partitions covering a day or a week each, so
+that expired samples are removed by dropping whole partitions instead of
+being deleted row by row.
+
+On PostgreSQL, every partition is a table inheriting from the sample
+table, with a CHECK constraint on its time range that the planner uses
+to skip the partitions out of the timestamp bounds of a query, and the
+foreign keys of the sample table. MySQL partitions the sample table
+natively, by range of timestamp, which requires dropping its foreign
+keys.
+"""
+
+import calendar
+import datetime
+import re
+
+from oslo.config import cfg
+import sqlalchemy as sa
+
+from ceilometer.i18n import _
+from ceilometer.openstack.common import log
+from ceilometer.storage.sqlalchemy import models
+
+LOG = log.getLogger(__name__)
+
+cfg.CONF.import_opt('sql_sample_partition', 'ceilometer.storage',
+                    group='database')
+
+PERIODS = {'day': 86400, 'week': 7 * 86400}
+
+# NOTE: the epoch is a Thursday, start the weeks on Mondays.
+OFFSETS = {'day': 0, 'week': 4 * 86400}
+
+
+class PartitionManager(object):
+    """Create, list and drop the partitions of the sample table.
+
+    A partition is identified by the epoch it starts at and named after
+    its start date.
+    """
+
+    # whether the samples still reference their meter and resource with
+    # foreign keys once partitioned
+    foreign_keys = True
+
+    def __init__(self, period):
+        self.period = PERIODS[period]
+        self.offset = OFFSETS[period]
+
+    def start(self, epoch):
+        """Return the start of the partition holding the given epoch."""
+        return epoch - (epoch - self.offset) % self.period
+
+    @staticmethod
+    def name(start):
+        return 'p' + datetime.datetime.utcfromtimestamp(start).strftime(
+            '%Y%m%d')
+
+    @staticmethod
+    def parse(name):
+        """Return the start of a partition from its name, None if invalid."""
+        match = re.match(r'^p(\d{8})$', name)
+        if match is None:
+            return None
+        date = datetime.datetime.strptime(match.group(1), '%Y%m%d')
+        return calendar.timegm(date.utctimetuple())
+
+    def setup(self, conn):
+        """Prepare the sample table to be partitioned."""
+
+    def partitions(self, conn):
+        """Return the sorted starts of the existing partitions."""
+        raise NotImplementedError
+
+    def missing(self, partitions, starts):
+        """Return the sorted starts lacking a partition to store samples."""
+        return sorted(set(starts) - set(partitions))
+
+    def create(self, conn, start):
+        raise NotImplementedError
+
+    def drop(self, conn, start):
+        raise NotImplementedError
+
+    def table(self, start):
+        """Return the table samples of the partition are inserted into."""
+        return models.Sample.__table__
+
+
+class PostgreSQLPartitionManager(PartitionManager):
+    """Partitions inheriting from the sample table."""
+
+    def __init__(self, period):
+        super(PostgreSQLPartitionManager, self).__init__(period)
+        self._tables = {}
+
+    @classmethod
+    def table_name(cls, start):
+        return 'sample_' + cls.name(start)
+
+    @staticmethod
+    def _foreign_keys():
+        """Return the (column, table, referred column) of the samples."""
+        return sorted((fk.parent.name, fk.column.table.name, fk.column.name)
+                      for fk in models.Sample.__table__.foreign_keys)
+
+    def setup(self, conn):
+        # NOTE: foreign keys are not inherited, add those missing from the
+        # partitions created without them.
+        inspector = sa.inspect(conn)
+        for start in self.partitions(conn):
+            name = self.table_name(start)
+            existing = set(tuple(fk['constrained_columns'])
+                           for fk in inspector.get_foreign_keys(name))
+            for column, table, referred in self._foreign_keys():
+                if (column,) not in existing:
+                    conn.execute('ALTER TABLE %s ADD FOREIGN KEY (%s) '
+                                 'REFERENCES %s (%s)' %
+                                 (name, column, table, referred))
+
+    def partitions(self, conn):
+        names = conn.execute(sa.text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'sample'"))
+        starts = (self.parse(name[len('sample_'):]) for name, in names)
+        return sorted(start for start in starts if start is not None)
+
+    def create(self, conn, start):
+        name = self.table_name(start)
+        lower, upper = [
+            datetime.datetime.utcfromtimestamp(t).isoformat(' ')
+            for t in (start, start + self.period)]
+        foreign_keys = ''.join(
+            'FOREIGN KEY (%s) REFERENCES %s (%s), ' % fk
+            for fk in self._foreign_keys())
+        conn.execute(
+            "CREATE TABLE %(name)s (PRIMARY KEY (id), %(foreign_keys)s"
+            "CHECK (\"timestamp\" >= '%(lower)s' AND "
+            "\"timestamp\" < '%(upper)s')) "
+            "INHERITS (sample)" % {'name': name, 'lower': lower,
+                                   'upper': upper,
+                                   'foreign_keys': foreign_keys})
+        # NOTE: indexes and foreign keys are not inherited.
+        for index in models.Sample.__table__.indexes:
+            columns = [c.name for c in index.columns]
+            conn.execute('CREATE INDEX ix_%s_%s ON %s (%s)' % (
+                name, '_'.join(columns), name,
+                ', '.join('"%s"' % c for c in columns)))
+
+    def drop(self, conn, start):
+        conn.execute('DROP TABLE %s' % self.table_name(start))
+
+    def table(self, start):
+        name = self.table_name(start)
+        if name not in self._tables:
+            self._tables[name] = sa.sql.table(
+                name, *[sa.sql.column(c.name, c.type)
+                        for c in models.Sample.__table__.columns
+                        if c.name != 'id'])
+        return self._tables[name]
+
+
+class MySQLPartitionManager(PartitionManager):
+    """Native range partitions of the sample table.
+
+    A range partition holds the samples older than its upper bound which
+    are not held by a previous partition, the samples newer than the last
+    partition are held by the pmax catch-all partition. Partitioned tables
+    can not have foreign keys, so nothing prevents a sample from being
+    inserted with the id of a deleted meter or resource.
+    """
+
+    foreign_keys = False
+
+    def _layout(self, conn):
+        return conn.execute(sa.text(
+            "SELECT partition_name, partition_description "
+            "FROM information_schema.partitions "
+            "WHERE table_schema = DATABASE() AND table_name = 'sample'"
+        )).fetchall()
+
+    def setup(self, conn):
+        if any(name for name, bound in self._layout(conn)):
+            return
+        LOG.info(_("Partitioning the sample table"))
+        # NOTE: partitioned tables can not have foreign keys and their
+        # partitioning column must be part of every unique key.
+        for fk in sa.inspect(conn).get_foreign_keys('sample'):
+            conn.execute('ALTER TABLE sample DROP FOREIGN KEY %s' %
+                         fk['name'])
+        conn.execute('ALTER TABLE sample '
+                     'MODIFY `timestamp` DECIMAL(20, 6) NOT NULL, '
+                     'DROP PRIMARY KEY, ADD PRIMARY KEY (id, `timestamp`)')
+        conn.execute('ALTER TABLE sample '
+                     'PARTITION BY RANGE (FLOOR(`timestamp`)) '
+                     '(PARTITION pmax VALUES LESS THAN MAXVALUE)')
+
+    def partitions(self, conn):
+        starts = (self.parse(name) for name, bound in self._layout(conn)
+                  if name)
+        return sorted(start for start in starts if start is not None)
+
+    def missing(self, partitions, starts):
+        # NOTE: samples older than the last partition already have one.
+        if partitions:
+            starts = [s for s in starts if s > partitions[-1]]
+        return sorted(set(starts))
+
+    def create(self, conn, start):
+        conn.execute('ALTER TABLE sample REORGANIZE PARTITION pmax INTO '
+                     '(PARTITION %s VALUES LESS THAN (%d), '
+                     'PARTITION pmax VALUES LESS THAN MAXVALUE)' %
+                     (self.name(start), start + self.period))
+
+    def drop(self, conn, start):
+        conn.execute('ALTER TABLE sample DROP PARTITION %s' %
+                     self.name(start))
+
+
+MANAGERS = {
+    'mysql': MySQLPartitionManager,
+    'postgresql': PostgreSQLPartitionManager,
+}
+
+
+def get_manager(dialect):
+    """Return the partition manager configured for a SQL dialect, if any."""
+    period = cfg.CONF.database.sql_sample_partition
+    if not period:
+        return None
+    manager = MANAGERS.get(dialect)
+    if manager is None:
+        LOG.warn(_("Partitioning of the sample table is not supported by "
+                   "%s, expired samples are deleted row by row"), dialect)
+        return None
+    return manager(period)
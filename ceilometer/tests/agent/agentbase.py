@@ -25,6 +25,7 @@ import abc
 import copy
 import datetime
 
+import eventlet
 import mock
 from oslo.config import fixture as fixture_config
 from oslotest import mockpatch
@@ -50,7 +51,7 @@ class TestSample(sample.Sample):
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.as_dict() == other.as_dict()
         return False
 
     def __ne__(self, other):
@@ -288,7 +289,57 @@ class BaseAgentManagerTestCase(base.BaseTestCase):
         self.mgr.join_partitioning_groups.assert_called_once_with()
         self.mgr.setup_polling_tasks.assert_called_once_with()
         timer_call = mock.call(1.0, self.mgr.partition_coordinator.heartbeat)
-        self.assertEqual([timer_call], self.mgr.tg.add_timer.call_args_list)
+        stats_call = mock.call(600, self.mgr.log_polling_stats,
+                               initial_delay=600)
+        self.assertEqual([timer_call, stats_call],
+                         self.mgr.tg.add_timer.call_args_list)
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline')
+    def test_start_without_polling_stats(self, setup_pipeline):
+        self.mgr.join_partitioning_groups = mock.MagicMock()
+        self.mgr.setup_polling_tasks = mock.MagicMock()
+        self.CONF.set_override('heartbeat', 1.0, group='coordination')
+        self.CONF.set_override('polling_stats_interval', 0, group='polling')
+        self.mgr.start()
+        self.mgr.tg.add_timer.assert_called_once_with(
+            1.0, self.mgr.partition_coordinator.heartbeat)
+
+    @mock.patch('ceilometer.agent.base.LOG')
+    def test_log_polling_stats(self, LOG):
+        self.mgr.join_partitioning_groups = mock.MagicMock()
+        with mock.patch('ceilometer.pipeline.setup_pipeline',
+                        return_value=self.mgr.pipeline_manager):
+            self.mgr.start()
+        self.mgr.log_polling_stats()
+        (polling, stats), (cache, cache_stats) = [
+            c[0] for c in LOG.info.call_args_list]
+        self.assertEqual(self.mgr.polling_stats()[60], stats)
+        self.assertEqual(self.mgr.discovery_cache.stats(), cache_stats)
+
+    def test_start_spreads_polling_tasks(self):
+        self.mgr.join_partitioning_groups = mock.MagicMock()
+        self.mgr.partition_coordinator.is_active.return_value = False
+        with mock.patch('ceilometer.pipeline.setup_pipeline',
+                        return_value=self.mgr.pipeline_manager):
+            self.mgr.start()
+        self.assertEqual([60], list(self.mgr.schedulers))
+        scheduler = self.mgr.schedulers[60]
+        self.assertEqual(6, scheduler.jitter)
+        (args, kwargs), = self.mgr.tg.add_dynamic_timer.call_args_list
+        self.assertEqual((scheduler,), args)
+        self.assertEqual(self.mgr._phase(60), kwargs['initial_delay'])
+        self.assertTrue(0 <= kwargs['initial_delay'] < 60)
+        self.assertEqual(0, self.mgr.polling_stats()[60]['runs'])
+
+    def test_start_without_spreading_polling_tasks(self):
+        self.CONF.set_override('spread_polling', False, group='polling')
+        self.mgr.join_partitioning_groups = mock.MagicMock()
+        self.mgr.partition_coordinator.is_active.return_value = False
+        with mock.patch('ceilometer.pipeline.setup_pipeline',
+                        return_value=self.mgr.pipeline_manager):
+            self.mgr.start()
+        self.mgr.tg.add_dynamic_timer.assert_called_once_with(
+            self.mgr.schedulers[60], initial_delay=None)
 
     def test_join_partitioning_groups(self):
         self.mgr.discovery_manager = self.create_discovery_manager()
@@ -472,6 +523,38 @@ class BaseAgentManagerTestCase(base.BaseTestCase):
         self.assertEqual(discovered_resources, self.Pollster.resources)
         self.assertEqual(discovered_resources, self.PollsterAnother.resources)
 
+    def _poll_tasks_of_different_intervals(self):
+        self.Pollster.discovery = 'testdiscovery'
+        self.PollsterAnother.discovery = 'testdiscovery'
+        self.mgr.discovery_manager = self.create_discovery_manager()
+        self.Discovery.resources = ['discovered_1', 'discovered_2']
+        self.pipeline_cfg[0]['resources'] = []
+        self.pipeline_cfg.append({
+            'name': "test_pipeline_1",
+            'interval': 10,
+            'counters': ['testanother'],
+            'resources': [],
+            'transformers': [],
+            'publishers': ["test"],
+        })
+        self.setup_pipeline()
+        polling_tasks = self.mgr.setup_polling_tasks()
+        self.mgr.interval_task(polling_tasks.get(60))
+        self.mgr.interval_task(polling_tasks.get(10))
+
+    def test_discovery_shared_by_polling_tasks(self):
+        self._poll_tasks_of_different_intervals()
+        self.assertEqual(1, len(self.Discovery.params))
+        self.assertEqual(self.Discovery.resources,
+                         self.PollsterAnother.resources)
+        self.assertEqual(1, self.mgr.discovery_cache.stats()['hits'])
+
+    def test_discovery_cache_ttl_per_discoverer(self):
+        self.CONF.set_override('discovery_cache_ttls',
+                               {'testdiscovery': '0'}, group='polling')
+        self._poll_tasks_of_different_intervals()
+        self.assertEqual(2, len(self.Discovery.params))
+
     def _do_test_per_pipeline_discovery(self,
                                         discovered_resources,
                                         static_resources):
@@ -689,3 +772,92 @@ class BaseAgentManagerTestCase(base.BaseTestCase):
         self.assertEqual(1, len(samples))
         self.assertEqual('test_sum', samples[0].name)
         self.assertEqual(11, samples[0].volume)
+
+    def _poll_with(self, get_samples):
+        self.pipeline_cfg[0]['counters'] = ['test', 'testanother']
+        self.setup_pipeline()
+        with mock.patch.object(self.Pollster, 'get_samples',
+                               side_effect=get_samples):
+            with mock.patch.object(self.PollsterAnother, 'get_samples',
+                                   side_effect=get_samples):
+                self.mgr.setup_polling_tasks()[60].poll_and_publish()
+        return self.mgr.pipeline_manager.pipelines[0].publishers[0].samples
+
+    def test_pollsters_run_one_after_the_other(self):
+        events = []
+
+        def get_samples(manager, cache, resources):
+            events.append('start')
+            eventlet.sleep(0.01)
+            events.append('end')
+            return [copy.deepcopy(default_test_data)]
+
+        samples = self._poll_with(get_samples)
+        self.assertEqual(['start', 'end', 'start', 'end'], events)
+        self.assertEqual(2, len(samples))
+
+    def test_publish_error_passed_to_publish_context(self):
+        with mock.patch.object(pipeline.PublishContext, '__exit__',
+                               return_value=False) as exit:
+            with mock.patch.object(pipeline.Pipeline,
+                                   'publish_samples',
+                                   side_effect=ValueError('boom')):
+                self.assertRaises(ValueError, self._poll_with,
+                                  lambda manager, cache, resources:
+                                  [copy.deepcopy(default_test_data)])
+        self.assertEqual(ValueError, exit.call_args[0][0])
+
+    def test_pollsters_listed_in_cache(self):
+        caches = []
+
+        def get_samples(manager, cache, resources):
+            caches.append(cache)
+            return []
+
+        self._poll_with(get_samples)
+        self.assertIs(caches[0], caches[1])
+        self.assertEqual(
+            set([self.Pollster, self.PollsterAnother]),
+            set(type(p) for p in
+                caches[0][plugin_base.CACHE_KEY_POLLSTERS]))
+
+    def test_pollsters_run_concurrently(self):
+        self.CONF.set_override('pollster_workers', 2, group='polling')
+        events = []
+
+        def get_samples(manager, cache, resources):
+            events.append('start')
+            eventlet.sleep(0.01)
+            events.append('end')
+            return [copy.deepcopy(default_test_data)]
+
+        samples = self._poll_with(get_samples)
+        self.assertEqual(['start', 'start', 'end', 'end'], events)
+        self.assertEqual(2, len(samples))
+
+    def test_pollster_timeout(self):
+        self.CONF.set_override('pollster_timeout', 0.01, group='polling')
+
+        def get_samples(manager, cache, resources):
+            yield copy.deepcopy(default_test_data)
+            eventlet.sleep(10)
+            yield copy.deepcopy(default_test_data)
+
+        samples = self._poll_with(get_samples)
+        self.assertEqual(2, len(samples))
+
+    def test_samples_streamed_in_batches(self):
+        self.CONF.set_override('pollster_batch_size', 2, group='polling')
+        published = []
+
+        def get_samples(manager, cache, resources):
+            pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
+            for i in range(5):
+                published.append(len(pub.samples))
+                yield copy.deepcopy(default_test_data)
+                eventlet.sleep(0)
+
+        samples = self._poll_with(get_samples)
+        self.assertEqual(10, len(samples))
+        self.assertNotEqual(0, max(published))
+        self.assertTrue(max(published) < 10)
@@ -0,0 +1,158 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/agent/base.py
+"""
+import eventlet
+from eventlet import greenpool
+import mock
+from oslotest import base
+
+from ceilometer.agent import base as agent_base
+
+
+class TestPollingScheduler(base.BaseTestCase):
+
+    def _run(self, durations, **kwargs):
+        """Run a scheduler whose runs last the given durations."""
+        clock = [0]
+
+        def run():
+            clock[0] += durations.pop(0)
+
+        def sleep(idle):
+            clock[0] += idle
+
+        scheduler = agent_base.PollingScheduler(10, run, **kwargs)
+        idles = []
+        with mock.patch('time.time', side_effect=lambda: clock[0]):
+            while durations:
+                idles.append(scheduler())
+                sleep(idles[-1])
+        return scheduler, idles
+
+    def test_on_schedule(self):
+        scheduler, idles = self._run([1, 2, 3])
+        self.assertEqual([9, 8, 7], idles)
+        stats = scheduler.stats()
+        self.assertEqual(3, stats['runs'])
+        self.assertEqual(0, stats['overruns'])
+        self.assertEqual(3, stats['max_duration'])
+        self.assertEqual(2, stats['mean_duration'])
+
+    def test_overrun_skips_missed_runs(self):
+        scheduler, idles = self._run([25, 1])
+        self.assertEqual([5, 9], idles)
+        stats = scheduler.stats()
+        self.assertEqual(1, stats['overruns'])
+        self.assertEqual(2, stats['skipped'])
+
+    @mock.patch('ceilometer.agent.base.LOG')
+    def test_overrun_logged_with_stats(self, LOG):
+        self._run([25, 1, 15])
+        self.assertEqual(2, LOG.warn.call_count)
+        stats = LOG.warn.call_args[0][1]
+        self.assertEqual(2, stats['overruns'])
+        self.assertEqual(3, stats['skipped'])
+        self.assertEqual(3, stats['runs'])
+
+    def test_overrun_coalesces_missed_runs(self):
+        scheduler, idles = self._run([25, 1, 1], policy='coalesce')
+        self.assertEqual([0, 9, 9], idles)
+        self.assertEqual(2, scheduler.stats()['skipped'])
+
+    @mock.patch('random.uniform', return_value=0.5)
+    def test_jitter(self, uniform):
+        scheduler, idles = self._run([1, 1], jitter=1)
+        self.assertEqual([9.5, 9], idles)
+        uniform.assert_called_with(0, 1)
+
+
+class TestDiscoveryCache(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestDiscoveryCache, self).setUp()
+        self.cache = agent_base.DiscoveryCache()
+        self.calls = 0
+
+    def _discover(self, resources=('a',), delay=0):
+        def discover():
+            self.calls += 1
+            if delay:
+                eventlet.sleep(delay)
+            return list(resources)
+        return discover
+
+    def test_cached_until_expiry(self):
+        with mock.patch('time.time', return_value=0):
+            self.assertEqual(['a'], self.cache.get('url', 60,
+                                                   self._discover()))
+        with mock.patch('time.time', return_value=59):
+            self.assertEqual(['a'], self.cache.get('url', 60,
+                                                   self._discover(['b'])))
+        with mock.patch('time.time', return_value=60):
+            self.assertEqual(['b'], self.cache.get('url', 60,
+                                                   self._discover(['b'])))
+        self.assertEqual(2, self.calls)
+        self.assertEqual({'hits': 1, 'misses': 2, 'stale': 0,
+                          'coalesced': 0, 'size': 1}, self.cache.stats())
+
+    def test_not_cached_without_ttl(self):
+        self.cache.get('url', 0, self._discover())
+        self.cache.get('url', 0, self._discover())
+        self.assertEqual(2, self.calls)
+        self.assertEqual(0, self.cache.stats()['size'])
+
+    def test_concurrent_discoveries_coalesced(self):
+        pool = greenpool.GreenPool()
+        results = list(pool.imap(
+            lambda i: self.cache.get('url', 60,
+                                     self._discover(delay=0.01)),
+            range(3)))
+        self.assertEqual([['a']] * 3, results)
+        self.assertEqual(1, self.calls)
+        self.assertEqual(2, self.cache.stats()['coalesced'])
+
+    def test_failure_raised_to_waiters(self):
+        def discover():
+            eventlet.sleep(0.01)
+            raise ValueError('boom')
+
+        waiter = eventlet.spawn(self.cache.get, 'url', 60, discover)
+        eventlet.sleep(0)
+        self.assertRaises(ValueError, self.cache.get, 'url', 60,
+                          self._discover())
+        self.assertRaises(ValueError, waiter.wait)
+        self.assertEqual(0, self.calls)
+
+    def test_serve_stale(self):
+        with mock.patch('time.time', return_value=0):
+            self.cache.get('url', 60, self._discover())
+        with mock.patch('time.time', return_value=60):
+            self.assertEqual(['a'], self.cache.get(
+                'url', 60, self._discover(['b']), grace=30))
+            eventlet.sleep(0)
+            self.assertEqual(['b'], self.cache.get(
+                'url', 60, self._discover(['c']), grace=30))
+        self.assertEqual(2, self.calls)
+        self.assertEqual(1, self.cache.stats()['stale'])
+
+    def test_stale_not_served_after_grace(self):
+        # NOTE: polling every 600 seconds with a ttl of 300 seconds, the
+        # resources are always expired for longer than the grace period.
+        for cycle, resources in enumerate(['a', 'b', 'c']):
+            with mock.patch('time.time', return_value=cycle * 600):
+                self.assertEqual([resources], self.cache.get(
+                    'url', 300, self._discover([resources]), grace=60))
+        self.assertEqual(3, self.calls)
+        self.assertEqual(0, self.cache.stats()['stale'])
+        self.assertEqual(3, self.cache.stats()['misses'])
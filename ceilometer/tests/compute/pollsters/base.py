@@ -29,6 +29,7 @@ class TestPollsterBase(base.BaseTestCase):
         super(TestPollsterBase, self).setUp()
 
         self.inspector = mock.Mock()
+        self.inspector.snapshot.return_value = self.inspector
         self.instance = mock.MagicMock()
         self.instance.name = 'instance-00000001'
         setattr(self.instance, 'OS-EXT-SRV-ATTR:instance_name',
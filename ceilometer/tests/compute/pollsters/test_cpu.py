@@ -77,6 +77,24 @@ class TestCPUPollster(base.TestPollsterBase):
         self.assertEqual(10 ** 6, samples[0].volume)
         self.assertEqual(0, len(cache))
 
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def test_get_samples_from_snapshot(self):
+        snapshot = mock.Mock()
+        snapshot.inspect_cpus.return_value = virt_inspector.CPUStats(
+            time=1 * (10 ** 6), number=2)
+        self.inspector.snapshot.return_value = snapshot
+
+        mgr = manager.AgentManager()
+        pollster = cpu.CPUPollster()
+
+        cache = {}
+        samples = list(pollster.get_samples(mgr, cache, [self.instance]))
+        self.assertEqual(10 ** 6, samples[0].volume)
+        self.assertIs(snapshot, cache[pollster.CACHE_KEY_INSPECTOR])
+        list(pollster.get_samples(mgr, cache, [self.instance]))
+        self.assertEqual(1, self.inspector.snapshot.call_count)
+        self.assertFalse(self.inspector.inspect_cpus.called)
+
 
 class TestCPUUtilPollster(base.TestPollsterBase):
 
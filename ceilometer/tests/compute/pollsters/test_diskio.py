@@ -35,6 +35,7 @@ class TestBaseDiskIO(base.BaseTestCase):
         super(TestBaseDiskIO, self).setUp()
 
         self.inspector = mock.Mock()
+        self.inspector.snapshot.return_value = self.inspector
         self.instance = self._get_fake_instances()
         patch_virt = mockpatch.Patch(
             'ceilometer.compute.virt.inspector.get_hypervisor_inspector',
@@ -0,0 +1,164 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/compute/discovery.py
+"""
+import datetime
+
+import mock
+from oslo.config import fixture as fixture_config
+from oslo.utils import timeutils
+from oslotest import base
+
+import ceilometer
+from ceilometer.compute import discovery
+
+
+class TestInstanceDiscovery(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestInstanceDiscovery, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.set_override('host', 'compute-1')
+        self.CONF.set_override('hypervisor_cross_check', False,
+                               group='compute')
+        with mock.patch('ceilometer.nova_client.Client'):
+            self.discovery = discovery.InstanceDiscovery()
+        self.nova = self.discovery.nova_cli
+        self.now = datetime.datetime(2015, 7, 2, 10, 0)
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+
+    @staticmethod
+    def _instance(id, vm_state='active', status='ACTIVE'):
+        instance = mock.Mock(id=id, status=status)
+        setattr(instance, 'OS-EXT-STS:vm_state', vm_state)
+        return instance
+
+    def _discover(self, seconds, instances):
+        timeutils.set_time_override(
+            self.now + datetime.timedelta(seconds=seconds))
+        self.nova.instance_get_all_by_host.return_value = instances
+        return [i.id for i in self.discovery.discover(None)]
+
+    def test_naive(self):
+        self.CONF.set_override('instance_discovery_method', 'naive',
+                               group='compute')
+        self.assertEqual(['a'], self._discover(0, [
+            self._instance('a'), self._instance('b', vm_state='error')]))
+        self.assertEqual(['a'], self._discover(60, [self._instance('a')]))
+        self.nova.instance_get_all_by_host.assert_called_with('compute-1')
+
+    def test_incremental(self):
+        self.assertEqual(['a', 'b'], self._discover(0, [
+            self._instance('a'), self._instance('b')]))
+        self.nova.instance_get_all_by_host.assert_called_with('compute-1',
+                                                              None)
+        self.assertEqual(['a', 'c'], self._discover(60, [
+            self._instance('b', vm_state='deleted', status='DELETED'),
+            self._instance('c'),
+            self._instance('d', vm_state='error')]))
+        self.nova.instance_get_all_by_host.assert_called_with(
+            'compute-1', '2015-07-02T09:59:00Z')
+        self.assertEqual(['a', 'c'], self._discover(120, []))
+        self.nova.instance_get_all_by_host.assert_called_with(
+            'compute-1', '2015-07-02T10:00:00Z')
+
+    def test_incremental_margin(self):
+        self.CONF.set_override('changes_since_margin', 5, group='compute')
+        self._discover(0, [])
+        self._discover(60, [])
+        self.nova.instance_get_all_by_host.assert_called_with(
+            'compute-1', '2015-07-02T09:59:55Z')
+
+    def test_incremental_resync(self):
+        self.CONF.set_override('resync_interval', 100, group='compute')
+        self._discover(0, [self._instance('a'), self._instance('b')])
+        self._discover(60, [])
+        self.assertEqual(['b'], self._discover(120, [self._instance('b')]))
+        self.nova.instance_get_all_by_host.assert_called_with('compute-1',
+                                                              None)
+
+    @mock.patch('ceilometer.compute.virt.inspector.get_hypervisor_inspector')
+    def test_hypervisor_cross_check(self, get_inspector):
+        self.CONF.clear_override('hypervisor_cross_check', group='compute')
+        inspector = get_inspector.return_value
+        inspector.list_instance_ids.return_value = ['a']
+        self.assertEqual(['a'], self._discover(0, [
+            self._instance('a'), self._instance('b')]))
+
+        # NOTE: c runs on the hypervisor but is missing from the delta.
+        inspector.list_instance_ids.return_value = ['a', 'c']
+        timeutils.advance_time_seconds(300)
+        self.nova.instance_get_all_by_host.side_effect = [
+            [], [self._instance('a'), self._instance('c')]]
+        self.assertEqual(['a', 'c'],
+                         [i.id for i in self.discovery.discover(None)])
+        self.assertEqual(mock.call('compute-1', None),
+                         self.nova.instance_get_all_by_host.call_args)
+        self.assertEqual(3, self.nova.instance_get_all_by_host.call_count)
+
+    @mock.patch('ceilometer.compute.virt.inspector.get_hypervisor_inspector')
+    def test_hypervisor_cross_check_evicts_migrated(self, get_inspector):
+        self.CONF.clear_override('hypervisor_cross_check', group='compute')
+        inspector = get_inspector.return_value
+        inspector.list_instance_ids.return_value = ['a', 'b']
+        self.assertEqual(['a', 'b'], self._discover(0, [
+            self._instance('a'), self._instance('b')]))
+
+        # NOTE: b migrated to another host, so is missing from the delta.
+        inspector.list_instance_ids.return_value = ['a']
+        self.assertEqual(['a'], self._discover(60, []))
+        self.assertEqual(['a'], list(self.discovery.instances))
+        self.assertEqual(2, self.nova.instance_get_all_by_host.call_count)
+
+    @mock.patch('ceilometer.compute.virt.inspector.get_hypervisor_inspector')
+    def test_hypervisor_cross_check_not_implemented(self, get_inspector):
+        self.CONF.clear_override('hypervisor_cross_check', group='compute')
+        inspector = get_inspector.return_value
+        inspector.list_instance_ids.side_effect = (
+            ceilometer.NotImplementedError)
+        self.assertEqual(['a', 'b'], self._discover(0, [
+            self._instance('a'), self._instance('b')]))
+
+    @mock.patch('ceilometer.compute.virt.inspector.get_hypervisor_inspector')
+    def test_hypervisor_cross_check_ignores_unmanaged(self, get_inspector):
+        self.CONF.clear_override('hypervisor_cross_check', group='compute')
+        inspector = get_inspector.return_value
+        # NOTE: x is a domain nova does not manage.
+        inspector.list_instance_ids.return_value = ['a', 'x']
+        self.assertEqual(['a'], self._discover(0, [self._instance('a')]))
+        self.assertEqual(['a'], self._discover(60, []))
+        self.assertEqual(['a'], self._discover(120, []))
+        self.assertEqual([mock.call('compute-1', None),
+                          mock.call('compute-1', '2015-07-02T09:59:00Z'),
+                          mock.call('compute-1', '2015-07-02T10:00:00Z')],
+                         self.nova.instance_get_all_by_host.call_args_list)
+
+    @mock.patch('ceilometer.compute.virt.inspector.get_hypervisor_inspector')
+    def test_hypervisor_cross_check_rebuild_rate_limited(self, get_inspector):
+        self.CONF.clear_override('hypervisor_cross_check', group='compute')
+        self.CONF.set_override('min_resync_interval', 100, group='compute')
+        inspector = get_inspector.return_value
+        inspector.list_instance_ids.return_value = ['a']
+        self._discover(0, [self._instance('a')])
+        inspector.list_instance_ids.return_value = ['a', 'b']
+        self.assertEqual(['a'], self._discover(60, []))
+        self.assertEqual(2, self.nova.instance_get_all_by_host.call_count)
+        timeutils.advance_time_seconds(60)
+        self.nova.instance_get_all_by_host.side_effect = [
+            [], [self._instance('a'), self._instance('b')]]
+        self.assertEqual(['a', 'b'],
+                         [i.id for i in self.discovery.discover(None)])
+        self.assertEqual(mock.call('compute-1', None),
+                         self.nova.instance_get_all_by_host.call_args)
+        self.assertEqual(4, self.nova.instance_get_all_by_host.call_count)
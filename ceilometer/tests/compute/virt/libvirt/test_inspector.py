@@ -22,6 +22,7 @@ import contextlib
 
 import fixtures
 import mock
+from oslo.config import fixture as fixture_config
 from oslo.utils import units
 from oslotest import base
 
@@ -56,6 +57,14 @@ class TestLibvirtInspection(base.BaseTestCase):
                 self.assertEqual(2L, cpu_info.number)
                 self.assertEqual(999999L, cpu_info.time)
 
+    def test_list_instance_ids(self):
+        self.domain.UUIDString.return_value = self.instance.id
+        connection = self.inspector.connection
+        with mock.patch.object(connection, 'listAllDomains',
+                               return_value=[self.domain]):
+            self.assertEqual([self.instance.id],
+                             self.inspector.list_instance_ids())
+
     def test_inspect_vnics(self):
         dom_xml = """
              <domain type='kvm'>
@@ -292,3 +301,237 @@ class TestLibvirtInspectionWithError(base.BaseTestCase):
     def test_inspect_unknown_error(self):
         self.assertRaises(virt_inspector.InspectorException,
                           self.inspector.inspect_cpus, 'foo')
+
+
+class TestLibvirtSnapshot(base.BaseTestCase):
+
+    DOM_XML = """
+        <domain type='kvm'>
+            <devices>
+                <interface type='bridge'>
+                    <mac address='fa:16:3e:71:ec:6d'/>
+                    <target dev='vnet0'/>
+                    <filterref filter='nova-instance-00000001-fa163e71ec6d'>
+                        <parameter name='IP' value='10.0.0.2'/>
+                    </filterref>
+                </interface>
+                <disk type='file' device='disk'>
+                    <target dev='vda' bus='virtio'/>
+                </disk>
+            </devices>
+        </domain>
+    """
+
+    STATS = {'state.state': 1,
+             'cpu.time': 999999,
+             'vcpu.current': 2,
+             'balloon.available': 51200,
+             'balloon.unused': 25600,
+             'net.count': 1,
+             'net.0.name': 'vnet0',
+             'net.0.rx.bytes': 1,
+             'net.0.rx.pkts': 2,
+             'net.0.tx.bytes': 3,
+             'net.0.tx.pkts': 4,
+             'block.count': 1,
+             'block.0.name': 'vda',
+             'block.0.rd.reqs': 5,
+             'block.0.rd.bytes': 6,
+             'block.0.wr.reqs': 7,
+             'block.0.wr.bytes': 8}
+
+    def setUp(self):
+        super(TestLibvirtSnapshot, self).setUp()
+
+        class VMInstance:
+            id = 'ff58e738-12f4-4c58-acde-77617b68da56'
+            name = 'instance-00000001'
+        self.instance = VMInstance
+        self.inspector = libvirt_inspector.LibvirtInspector()
+        self.inspector.connection = mock.Mock()
+        libvirt_inspector.libvirt = mock.MagicMock()
+        libvirt_inspector.libvirt.VIR_DOMAIN_SHUTOFF = 5
+        self.domain = mock.Mock()
+        self.domain.UUIDString.return_value = self.instance.id
+        self.domain.XMLDesc.return_value = self.DOM_XML
+
+    def _snapshot(self, stats):
+        connection = self.inspector.connection
+        connection.getAllDomainStats.return_value = [(self.domain, stats)]
+        snapshot = self.inspector.snapshot()
+        self.assertIsInstance(snapshot, libvirt_inspector.LibvirtSnapshot)
+        return snapshot
+
+    def test_inspect_from_snapshot(self):
+        snapshot = self._snapshot(self.STATS)
+
+        cpu_info = snapshot.inspect_cpus(self.instance)
+        self.assertEqual(2, cpu_info.number)
+        self.assertEqual(999999, cpu_info.time)
+
+        (vnic, vnic_info), = snapshot.inspect_vnics(self.instance)
+        self.assertEqual('vnet0', vnic.name)
+        self.assertEqual('fa:16:3e:71:ec:6d', vnic.mac)
+        self.assertEqual('10.0.0.2', vnic.parameters.get('ip'))
+        self.assertEqual(virt_inspector.InterfaceStats(rx_bytes=1,
+                                                       rx_packets=2,
+                                                       tx_bytes=3,
+                                                       tx_packets=4),
+                         vnic_info)
+
+        (disk, disk_info), = snapshot.inspect_disks(self.instance)
+        self.assertEqual('vda', disk.device)
+        self.assertEqual(virt_inspector.DiskStats(read_requests=5,
+                                                  read_bytes=6,
+                                                  write_requests=7,
+                                                  write_bytes=8,
+                                                  errors=-1), disk_info)
+
+        memory = snapshot.inspect_memory_usage(self.instance)
+        self.assertEqual(25600 / units.Ki, memory.usage)
+
+        self.assertEqual(1, self.domain.XMLDesc.call_count)
+        self.assertFalse(
+            self.inspector.connection.lookupByUUIDString.called)
+
+    def test_snapshot_delegates_shutoff_domains(self):
+        snapshot = self._snapshot({'state.state': 5})
+        with mock.patch.object(self.inspector, 'inspect_vnics',
+                               return_value=iter([])) as inspect_vnics:
+            self.assertEqual([], list(snapshot.inspect_vnics(self.instance)))
+            inspect_vnics.assert_called_once_with(self.instance)
+
+    def test_snapshot_delegates_other_inspections(self):
+        snapshot = self._snapshot(self.STATS)
+        self.assertEqual(self.inspector.inspect_cpu_util,
+                         snapshot.inspect_cpu_util)
+
+    def test_snapshot_unsupported(self):
+        self.inspector.connection = mock.Mock(spec=['lookupByUUIDString'])
+        self.assertIs(self.inspector, self.inspector.snapshot())
+        self.assertFalse(self.inspector.bulk_stats)
+
+    def test_snapshot_disabled(self):
+        self.inspector.bulk_stats = False
+        self.assertIs(self.inspector, self.inspector.snapshot())
+        self.assertFalse(self.inspector.connection.getAllDomainStats.called)
+
+
+class TestLibvirtDevicesCache(base.BaseTestCase):
+
+    DOM_XML = TestLibvirtSnapshot.DOM_XML
+
+    def setUp(self):
+        super(TestLibvirtDevicesCache, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.inspector = libvirt_inspector.LibvirtInspector()
+        self.inspector.connection = mock.Mock()
+        self.inspector._devices_watched = True
+        libvirt_inspector.libvirt = mock.MagicMock()
+        self.domain = self._domain('ff58e738-12f4-4c58-acde-77617b68da56')
+
+    def _domain(self, uuid, domain_id=1):
+        domain = mock.Mock()
+        domain.UUIDString.return_value = uuid
+        domain.ID.return_value = domain_id
+        domain.XMLDesc.return_value = self.DOM_XML
+        return domain
+
+    def test_devices_cached(self):
+        devices = self.inspector._get_devices(self.domain)
+        self.assertEqual(['vnet0'], [i.name for i in devices.interfaces])
+        self.assertEqual(['vda'], [d.device for d in devices.disks])
+        self.assertIs(devices, self.inspector._get_devices(self.domain))
+        self.assertEqual(1, self.domain.XMLDesc.call_count)
+        self.assertEqual({'hits': 1, 'misses': 1, 'invalidations': 0,
+                          'size': 1}, self.inspector.devices_cache_stats())
+
+    def test_devices_cache_disabled(self):
+        self.CONF.set_override('libvirt_devices_cache_ttl', 0)
+        self.inspector._get_devices(self.domain)
+        self.inspector._get_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_devices_reparsed_on_restart(self):
+        self.inspector._get_devices(self.domain)
+        self.domain.ID.return_value = 2
+        self.inspector._get_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_devices_expire(self):
+        self.CONF.set_override('libvirt_devices_cache_ttl', 60)
+        with mock.patch('time.time', return_value=0):
+            self.inspector._get_devices(self.domain)
+        with mock.patch('time.time', return_value=59):
+            self.inspector._get_devices(self.domain)
+        self.assertEqual(1, self.domain.XMLDesc.call_count)
+        with mock.patch('time.time', return_value=60):
+            self.inspector._get_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_devices_invalidated_on_event(self):
+        self.inspector._get_devices(self.domain)
+        self.inspector._on_domain_event(None, self.domain, 'vda', None)
+        self.inspector._get_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+        self.assertEqual(1, self.inspector.devices_cache['invalidations'])
+
+    def test_devices_invalidated_while_parsed_not_cached(self):
+        def xml_desc(flags):
+            # NOTE: a device is added while the description is parsed.
+            self.inspector._on_domain_event(None, self.domain, 'vdb', None)
+            return self.DOM_XML
+
+        self.domain.XMLDesc.side_effect = xml_desc
+        self.inspector._get_devices(self.domain)
+        self.assertEqual(0, self.inspector.devices_cache_stats()['size'])
+        self.domain.XMLDesc.side_effect = None
+        self.inspector._get_devices(self.domain)
+        self.inspector._get_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+        self.assertEqual(1, self.inspector.devices_cache_stats()['size'])
+
+    def test_devices_not_cached_without_events(self):
+        self.inspector._devices_watched = False
+        self.inspector._get_devices(self.domain)
+        self.inspector._get_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_devices_of_removed_domains_invalidated(self):
+        other = self._domain('0d4f1ac2-4c8b-4c4e-8ba4-5f3d2b9b8c7a')
+        self.inspector._get_devices(self.domain)
+        self.inspector._get_devices(other)
+        connection = self.inspector.connection
+        connection.getAllDomainStats.return_value = [(other, {})]
+        self.inspector.snapshot()
+        self.assertEqual({'hits': 0, 'misses': 2, 'invalidations': 1,
+                          'size': 1}, self.inspector.devices_cache_stats())
+
+    @mock.patch.object(libvirt_inspector, '_start_event_loop')
+    def test_events_registered_on_connection(self, start_event_loop):
+        self.inspector.connection = None
+        connection = libvirt_inspector.libvirt.openReadOnly.return_value
+        self.assertIs(connection, self.inspector._get_connection())
+        start_event_loop.assert_called_once_with()
+        self.assertEqual(3, connection.domainEventRegisterAny.call_count)
+        self.assertTrue(self.inspector._devices_watched)
+
+    @mock.patch.object(libvirt_inspector, '_start_event_loop')
+    def test_device_events_not_provided(self, start_event_loop):
+        del libvirt_inspector.libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_ADDED
+        self.inspector.connection = None
+        connection = self.inspector._get_connection()
+        self.assertEqual(2, connection.domainEventRegisterAny.call_count)
+        self.assertFalse(self.inspector._devices_watched)
+        self.inspector._get_devices(self.domain)
+        self.inspector._get_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    @mock.patch.object(libvirt_inspector, '_start_event_loop')
+    def test_events_disabled(self, start_event_loop):
+        self.CONF.set_override('libvirt_events', False)
+        self.inspector.connection = None
+        connection = self.inspector._get_connection()
+        self.assertFalse(start_event_loop.called)
+        self.assertFalse(connection.domainEventRegisterAny.called)
+        self.assertFalse(self.inspector._devices_watched)
@@ -22,8 +22,10 @@ from oslo.config import fixture as fixture_config
 from oslotest import base
 
 from ceilometer.dispatcher import database
+from ceilometer.dispatcher import http
 from ceilometer.event.storage import models as event_models
 from ceilometer.publisher import utils
+from ceilometer import storage
 
 
 class TestDispatcherDB(base.BaseTestCase):
@@ -35,6 +37,19 @@ class TestDispatcherDB(base.BaseTestCase):
         self.dispatcher = database.DatabaseDispatcher(self.CONF)
         self.ctx = None
 
+    def _record(self, msgs):
+        """Dispatch the messages, returning the batch recorded."""
+        with mock.patch.object(self.dispatcher.meter_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data(msgs)
+        self.assertEqual(1, record_batch.call_count)
+        recorded = []
+        for sample in record_batch.call_args[0][0]:
+            sample = dict(sample)
+            self.assertTrue(sample.pop('_id'))
+            recorded.append(sample)
+        return recorded
+
     def test_event_conn(self):
         event = event_models.Event(uuid.uuid4(), 'test',
                                    datetime.datetime(2012, 7, 2, 13, 53, 40),
@@ -54,11 +69,53 @@ class TestDispatcherDB(base.BaseTestCase):
             self.CONF.publisher.metering_secret,
         )
 
-        with mock.patch.object(self.dispatcher.meter_conn,
-                               'record_metering_data') as record_metering_data:
-            self.dispatcher.record_metering_data(msg)
+        self.assertEqual([msg], self._record(msg))
+
+    def test_batch_of_messages(self):
+        msgs = []
+        for i in range(3):
+            msg = {'counter_name': 'test',
+                   'resource_id': '%s-%d' % (self.id(), i),
+                   'counter_volume': i,
+                   }
+            msg['message_signature'] = utils.compute_signature(
+                msg,
+                self.CONF.publisher.metering_secret,
+            )
+            msgs.append(msg)
+        invalid = {'counter_name': 'test',
+                   'resource_id': self.id(),
+                   'counter_volume': 1,
+                   'message_signature': 'invalid-signature'}
+
+        self.assertEqual(msgs, self._record(msgs + [invalid]))
+
+    def test_batch_failure_falls_back_to_single_samples(self):
+        msgs = []
+        for i in range(2):
+            msg = {'counter_name': 'test',
+                   'resource_id': '%s-%d' % (self.id(), i),
+                   'counter_volume': i,
+                   }
+            msg['message_signature'] = utils.compute_signature(
+                msg,
+                self.CONF.publisher.metering_secret,
+            )
+            msgs.append(msg)
 
-        record_metering_data.assert_called_once_with(msg)
+        with mock.patch.object(self.dispatcher.meter_conn,
+                               'record_metering_data_batch',
+                               side_effect=Exception('boom')) as batch:
+            with mock.patch.object(self.dispatcher.meter_conn,
+                                   'record_metering_data') as record:
+                self.dispatcher.record_metering_data(msgs)
+
+        # NOTE: the samples recorded again keep the ids of the batch.
+        self.assertEqual([mock.call(m) for m in batch.call_args[0][0]],
+                         record.call_args_list)
+        self.assertEqual(msgs, [dict((k, v) for k, v in m[0][0].items()
+                                     if k != '_id')
+                                for m in record.call_args_list])
 
     def test_invalid_message(self):
         msg = {'counter_name': 'test',
@@ -94,11 +151,7 @@ class TestDispatcherDB(base.BaseTestCase):
         expected = msg.copy()
         expected['timestamp'] = datetime.datetime(2012, 7, 2, 13, 53, 40)
 
-        with mock.patch.object(self.dispatcher.meter_conn,
-                               'record_metering_data') as record_metering_data:
-            self.dispatcher.record_metering_data(msg)
-
-        record_metering_data.assert_called_once_with(expected)
+        self.assertEqual([expected], self._record(msg))
 
     def test_timestamp_tzinfo_conversion(self):
         msg = {'counter_name': 'test',
@@ -115,8 +168,42 @@ class TestDispatcherDB(base.BaseTestCase):
         expected['timestamp'] = datetime.datetime(2012, 9, 30, 23,
                                                   31, 50, 262000)
 
-        with mock.patch.object(self.dispatcher.meter_conn,
-                               'record_metering_data') as record_metering_data:
-            self.dispatcher.record_metering_data(msg)
-
-        record_metering_data.assert_called_once_with(expected)
+        self.assertEqual([expected], self._record(msg))
+
+    def test_samples_shared_with_other_dispatchers(self):
+        msgs = []
+        for i in range(2):
+            msg = {'counter_name': 'test',
+                   'counter_type': 'gauge',
+                   'counter_unit': 'B',
+                   'counter_volume': i,
+                   'resource_id': '%s-%d' % (self.id(), i),
+                   'resource_metadata': {},
+                   'user_id': 'user',
+                   'project_id': 'project',
+                   'source': 'test',
+                   'message_id': str(uuid.uuid4()),
+                   'timestamp': '2012-07-02T13:53:40Z',
+                   }
+            msg['message_signature'] = utils.compute_signature(
+                msg,
+                self.CONF.publisher.metering_secret,
+            )
+            msgs.append(msg)
+        expected = [dict(m) for m in msgs]
+
+        self.dispatcher.meter_conn.upgrade()
+        self.dispatcher.record_metering_data(msgs)
+        self.assertEqual(2, len(list(
+            self.dispatcher.meter_conn.get_samples(storage.SampleFilter()))))
+
+        # NOTE: the http dispatcher runs after the database one, on the
+        # same samples.
+        self.CONF.set_override('target', 'http://localhost:8000',
+                               group='dispatcher_http')
+        http_dispatcher = http.HttpDispatcher(self.CONF)
+        with mock.patch.object(http_dispatcher.session, 'post') as post:
+            post.return_value.status_code = 200
+            http_dispatcher.record_metering_data(msgs)
+        self.assertEqual(expected, msgs)
+        self.assertEqual(2, post.call_count)
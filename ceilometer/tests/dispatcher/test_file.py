@@ -18,7 +18,9 @@ import logging.handlers
 import os
 import tempfile
 
+import fixtures
 from oslo.config import fixture as fixture_config
+from oslo.serialization import jsonutils
 from oslotest import base
 
 from ceilometer.dispatcher import file
@@ -101,3 +103,22 @@ class TestDispatcherFile(base.BaseTestCase):
 
         # The log should be None
         self.assertIsNone(dispatcher.log)
+
+    def test_file_dispatcher_json(self):
+        filename = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                'meters')
+        self.CONF.dispatcher_file.file_path = filename
+        self.CONF.dispatcher_file.format = 'json'
+        self.CONF.dispatcher_file.flush_interval = 0
+        dispatcher = file.FileDispatcher(self.CONF)
+        self.assertIsNone(dispatcher.log)
+
+        dispatcher.record_metering_data({'counter_name': 'test'})
+        dispatcher.record_metering_data([{'counter_name': 'test2'}])
+        # NOTE: the records are buffered until the buffer is full.
+        self.assertFalse(os.path.exists(filename))
+        dispatcher.sink.close()
+        with open(filename) as f:
+            self.assertEqual([{'counter_name': 'test'},
+                              {'counter_name': 'test2'}],
+                             [jsonutils.loads(line) for line in f])
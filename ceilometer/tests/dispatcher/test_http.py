@@ -15,10 +15,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import json
+import threading
+
+import eventlet
 import mock
 from oslo.config import fixture as fixture_config
 from oslotest import base
 import requests
+from six.moves import BaseHTTPServer
 
 from ceilometer.dispatcher import http
 from ceilometer.publisher import utils
@@ -55,7 +60,8 @@ class TestDispatcherHttp(base.BaseTestCase):
         # The target should be None
         self.assertEqual('', dispatcher.target)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
+            post.return_value.status_code = 200
             dispatcher.record_metering_data(self.msg)
 
         # Since the target is not set, no http post should occur, thus the
@@ -67,7 +73,8 @@ class TestDispatcherHttp(base.BaseTestCase):
         self.CONF.dispatcher_http.cadf_only = True
         dispatcher = http.HttpDispatcher(self.CONF)
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
+            post.return_value.status_code = 200
             dispatcher.record_metering_data(self.msg)
 
         self.assertEqual(0, post.call_count)
@@ -84,7 +91,8 @@ class TestDispatcherHttp(base.BaseTestCase):
             self.CONF.publisher.metering_secret,
         )
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
+            post.return_value.status_code = 200
             dispatcher.record_metering_data(self.msg)
 
         # Since the meter does not have metadata or CADF_EVENT, the method
@@ -103,7 +111,8 @@ class TestDispatcherHttp(base.BaseTestCase):
             self.CONF.publisher.metering_secret,
         )
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
+            post.return_value.status_code = 200
             dispatcher.record_metering_data(self.msg)
 
         self.assertEqual(1, post.call_count)
@@ -120,7 +129,105 @@ class TestDispatcherHttp(base.BaseTestCase):
             self.CONF.publisher.metering_secret,
         )
 
-        with mock.patch.object(requests, 'post') as post:
+        with mock.patch.object(requests.Session, 'post') as post:
+            post.return_value.status_code = 200
             dispatcher.record_metering_data(self.msg)
 
         self.assertEqual(1, post.call_count)
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.client_address,
+                                     json.loads(body)))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDispatcherHttpServer(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestDispatcherHttpServer, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                StubHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.CONF.dispatcher_http.target = ('http://127.0.0.1:%d/' %
+                                            self.server.server_port)
+        self.CONF.dispatcher_http.retry_backoff = 0.01
+        self.msgs = []
+        for i in range(5):
+            msg = {'counter_name': 'test',
+                   'resource_id': 'resource-%d' % i,
+                   'counter_volume': i}
+            msg['message_signature'] = utils.compute_signature(
+                msg, self.CONF.publisher.metering_secret)
+            self.msgs.append(msg)
+
+    def test_post_batches(self):
+        self.CONF.dispatcher_http.batch_size = 2
+        dispatcher = http.HttpDispatcher(self.CONF)
+        dispatcher.record_metering_data(self.msgs)
+        self.assertEqual([self.msgs[0:2], self.msgs[2:4], self.msgs[4:]],
+                         [body for client, body in self.server.requests])
+
+    def test_post_with_keep_alive(self):
+        dispatcher = http.HttpDispatcher(self.CONF)
+        dispatcher.record_metering_data(self.msgs[:2])
+        dispatcher.record_metering_data(self.msgs[2])
+        self.assertEqual(self.msgs[:3],
+                         [body for client, body in self.server.requests])
+        # every request has been sent over the same connection
+        self.assertEqual(1, len(set(client for client, body
+                                    in self.server.requests)))
+
+    def test_post_retried(self):
+        self.server.statuses = [503, 500]
+        dispatcher = http.HttpDispatcher(self.CONF)
+        with mock.patch('eventlet.sleep') as sleep:
+            dispatcher.record_metering_data(self.msgs[0])
+        self.assertEqual([self.msgs[0]] * 3,
+                         [body for client, body in self.server.requests])
+        self.assertEqual([mock.call(0.01), mock.call(0.02)],
+                         sleep.call_args_list)
+
+    def test_retry_backoff_yields(self):
+        self.server.statuses = [503]
+        dispatcher = http.HttpDispatcher(self.CONF)
+        # NOTE: time is not monkey patched in the collector, a backoff
+        # sleeping with time.sleep would block the other greenthreads.
+        with mock.patch('time.sleep', side_effect=AssertionError):
+            waiting = eventlet.spawn(lambda: 'ran')
+            dispatcher.record_metering_data(self.msgs[0])
+            self.assertTrue(waiting.dead)
+        self.assertEqual('ran', waiting.wait())
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_post_not_retried_on_client_error(self):
+        self.server.statuses = [400]
+        dispatcher = http.HttpDispatcher(self.CONF)
+        dispatcher.record_metering_data(self.msgs[0])
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_post_gives_up(self):
+        self.CONF.dispatcher_http.max_retries = 1
+        self.server.statuses = [500, 500, 500]
+        dispatcher = http.HttpDispatcher(self.CONF)
+        with mock.patch.object(http.LOG, 'error') as error:
+            dispatcher.record_metering_data(self.msgs[0])
+        self.assertEqual(2, len(self.server.requests))
+        self.assertTrue(error.called)
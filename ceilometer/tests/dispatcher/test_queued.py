@@ -0,0 +1,151 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import os
+import threading
+import time
+
+import fixtures
+import mock
+from oslo.config import fixture as fixture_config
+from oslotest import base
+from oslotest import mockpatch
+from stevedore import extension
+
+from ceilometer import dispatcher
+from ceilometer.dispatcher import queued
+
+
+class FakeDispatcher(object):
+    """Record the samples once released, recording the first immediately."""
+
+    def __init__(self):
+        self.recorded = []
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def record_metering_data(self, data):
+        self.started.set()
+        if self.recorded:
+            self.released.wait()
+        self.recorded.append(data)
+
+    def record_events(self, events):
+        return ['problem']
+
+
+class TestQueuedDispatcher(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestQueuedDispatcher, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.set_override('queue_size', 1, group='dispatcher_queue')
+        self.fake = FakeDispatcher()
+
+    def _wait_for(self, condition):
+        for i in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail('condition not met')
+
+    def _record(self, policy, samples):
+        self.CONF.set_override('overflow_policy', policy,
+                               group='dispatcher_queue')
+        d = queued.QueuedDispatcher('fake', self.fake, self.CONF)
+        d.record_metering_data(samples[0])
+        self._wait_for(lambda: len(self.fake.recorded) == 1)
+        if len(samples) > 1:
+            # NOTE: the worker blocks on the second sample, the third is
+            # queued and the next ones overflow.
+            self.fake.started.clear()
+            d.record_metering_data(samples[1])
+            self.fake.started.wait()
+            for sample in samples[2:]:
+                d.record_metering_data(sample)
+        return d
+
+    def test_record_from_worker(self):
+        d = self._record('drop_oldest', [{'id': 1}, {'id': 2}])
+        self.fake.released.set()
+        self._wait_for(lambda: len(self.fake.recorded) == 2)
+        self.assertEqual([{'id': 1}, {'id': 2}], self.fake.recorded)
+        stats = d.stats()
+        self.assertEqual(2, stats['recorded'])
+        self.assertEqual(0, stats['depth'])
+        self.assertEqual('fake', stats['name'])
+
+    def test_samples_copied(self):
+        sample = {'id': 1}
+        self._record('drop_oldest', [sample])
+        self.assertEqual([sample], self.fake.recorded)
+        self.assertIsNot(sample, self.fake.recorded[0])
+
+    def test_drop_oldest(self):
+        d = self._record('drop_oldest', [{'id': i} for i in range(5)])
+        self.fake.released.set()
+        self._wait_for(lambda: len(self.fake.recorded) == 3)
+        self.assertEqual([{'id': 0}, {'id': 1}, {'id': 4}],
+                         self.fake.recorded)
+        self.assertEqual(2, d.stats()['dropped'])
+
+    def test_spill(self):
+        spill_path = self.useFixture(fixtures.TempDir()).path
+        self.CONF.set_override('spill_path', spill_path,
+                               group='dispatcher_queue')
+        d = self._record('spill', [{'id': i} for i in range(5)])
+        self.assertEqual(['fake.%d.spill' % os.getpid()],
+                         os.listdir(spill_path))
+        self.fake.released.set()
+        self._wait_for(lambda: len(self.fake.recorded) == 5)
+        self.assertEqual([{'id': i} for i in range(5)], self.fake.recorded)
+        self.assertEqual(2, d.stats()['spilled'])
+        self.assertEqual([], os.listdir(spill_path))
+
+    def test_spill_without_path(self):
+        self.CONF.set_override('overflow_policy', 'spill',
+                               group='dispatcher_queue')
+        d = queued.QueuedDispatcher('fake', self.fake, self.CONF)
+        self.assertEqual('drop_oldest', d.policy)
+
+    def test_replay_spill_of_dead_process(self):
+        spill_path = self.useFixture(fixtures.TempDir()).path
+        self.CONF.set_override('spill_path', spill_path,
+                               group='dispatcher_queue')
+        with open(os.path.join(spill_path, 'fake.12345.replay'), 'w') as f:
+            f.write('{"id": 1}\n{"id": 2}\n')
+        with open(os.path.join(spill_path, 'fake.12346.spill'), 'w') as f:
+            f.write('{"id": 3}\n')
+        with open(os.path.join(spill_path, 'fake.12347.spill'), 'w') as f:
+            f.write('{"id": 4}\n')
+        with mock.patch.object(queued.QueuedDispatcher, '_is_alive',
+                               side_effect=lambda pid: pid == 12347):
+            queued.QueuedDispatcher('fake', self.fake, self.CONF)
+            self.fake.released.set()
+            self._wait_for(lambda: len(self.fake.recorded) == 3)
+        self.assertEqual([{'id': 1}, {'id': 2}, {'id': 3}],
+                         self.fake.recorded)
+        self.assertEqual(['fake.12347.spill'], os.listdir(spill_path))
+
+    def test_record_events_synchronously(self):
+        d = queued.QueuedDispatcher('fake', self.fake, self.CONF)
+        self.assertEqual(['problem'], d.record_events([]))
+
+    def test_load_dispatcher_manager(self):
+        self.useFixture(mockpatch.Patch(
+            'stevedore.named.NamedExtensionManager',
+            return_value=extension.ExtensionManager.make_test_instance([
+                extension.Extension('fake', None, None, self.fake)])))
+        manager = dispatcher.load_dispatcher_manager()
+        ext = list(manager)[0]
+        self.assertIsInstance(ext.obj, queued.QueuedDispatcher)
+        self.assertIs(self.fake, ext.obj.dispatcher)
@@ -16,8 +16,19 @@
 # under the License.
 """Tests for ceilometer/hardware/inspector/snmp/inspector.py
 """
+import socket
+
+import eventlet
+from eventlet.green import select as green_select
+from eventlet.green import socket as green_socket
+import fixtures
+import mock
+from oslo.config import fixture as fixture_config
 from oslo.utils import netutils
 from oslotest import mockpatch
+from pyasn1.codec.ber import decoder
+from pyasn1.codec.ber import encoder
+from pysnmp.proto import api
 
 from ceilometer.hardware.inspector import snmp
 from ceilometer.tests import base as test_base
@@ -48,6 +59,40 @@ def faux_bulkCmd_new(authData, transportTarget, nonRepeaters, maxRepetitions,
     return (None, None, 0, varBindTable)
 
 
+class FakeResponder(object):
+    """Answer the SNMP requests in place of the agents of the hosts."""
+
+    def __init__(self):
+        self.delays = {}
+        self.down = set()
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    def _answer(self, transportTarget, oids, cmd):
+        host = transportTarget.transportAddr[0]
+        self.requests.append((host, cmd, oids))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            eventlet.sleep(self.delays.get(host, 0))
+        finally:
+            self.active -= 1
+        return host not in self.down
+
+    def getCmd(self, authData, transportTarget, *oids, **kwargs):
+        if not self._answer(transportTarget, oids, 'get'):
+            return ('requestTimedOut', 0, 0, [])
+        return faux_getCmd_new(authData, transportTarget, *oids)
+
+    def bulkCmd(self, authData, transportTarget, nonRepeaters,
+                maxRepetitions, *oids, **kwargs):
+        if not self._answer(transportTarget, oids, 'bulk'):
+            return ('requestTimedOut', 0, 0, [])
+        return faux_bulkCmd_new(authData, transportTarget, nonRepeaters,
+                                maxRepetitions, *oids)
+
+
 class TestSNMPInspector(test_base.BaseTestCase):
     mapping = {
         'test_exact': {
@@ -143,3 +188,172 @@ class TestSNMPInspector(test_base.BaseTestCase):
         self.assertEqual(8, ret)
         self.assertIn('ip', metadata)
         self.assertIn("2", metadata['ip'])
+
+
+class TestSNMPPrefetch(test_base.BaseTestCase):
+    mapping = TestSNMPInspector.mapping
+
+    def setUp(self):
+        super(TestSNMPPrefetch, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.responder = FakeResponder()
+        self.useFixture(mockpatch.PatchObject(
+            snmp.cmdgen, 'CommandGenerator', return_value=self.responder))
+        self.inspector = snmp.SNMPInspector()
+        self.inspector.MAPPING = self.mapping
+        self.inspector._fake_post_op = TestSNMPInspector._fake_post_op
+        self.hosts = [netutils.urlsplit("snmp://127.0.0.%d" % i)
+                      for i in range(1, 5)]
+
+    def _prefetch(self, hosts=None):
+        caches = dict((h.hostname, {}) for h in hosts or self.hosts)
+        self.inspector.prefetch([(h, caches[h.hostname])
+                                 for h in hosts or self.hosts],
+                                ['test_exact', 'test_prefix', 'unknown'])
+        return caches
+
+    def _requests(self, host):
+        return [r[1:] for r in self.responder.requests if r[0] == host]
+
+    def test_one_merged_request_per_host(self):
+        caches = self._prefetch()
+        for host in self.hosts:
+            self.assertEqual(
+                [('get', ('1.3.6.1.4.1.2021.10.1.3.1',
+                          '1.3.6.1.4.1.2021.10.1.3.8')),
+                 ('bulk', ('1.3.6.1.4.1.2021.9.1.3',
+                           '1.3.6.1.4.1.2021.9.1.8'))],
+                self._requests(host.hostname))
+        del self.responder.requests[:]
+        for host in self.hosts:
+            cache = caches[host.hostname]
+            exact = list(self.inspector.inspect_generic(host, 'test_exact',
+                                                        cache))
+            prefix = list(self.inspector.inspect_generic(host,
+                                                         'test_prefix',
+                                                         cache))
+            self.assertEqual(1, exact[0][0])
+            self.assertEqual(2, len(prefix))
+        self.assertEqual([], self.responder.requests)
+
+    def test_hosts_queried_concurrently(self):
+        for host in self.hosts:
+            self.responder.delays[host.hostname] = 0.01
+        self._prefetch()
+        self.assertEqual(4, self.responder.max_active)
+
+    def test_workers(self):
+        self.CONF.set_override('snmp_workers', 2, group='hardware')
+        for host in self.hosts:
+            self.responder.delays[host.hostname] = 0.01
+        self._prefetch()
+        self.assertEqual(2, self.responder.max_active)
+        self.assertEqual(8, len(self.responder.requests))
+
+    def test_host_timeout(self):
+        self.CONF.set_override('snmp_timeout', 0.01, group='hardware')
+        self.CONF.set_override('snmp_retries', 0, group='hardware')
+        slow, fast = self.hosts[:2]
+        self.responder.delays[slow.hostname] = 1
+        caches = self._prefetch([slow, fast])
+        self.assertRaises(snmp.SNMPUnreachable, list,
+                          self.inspector.inspect_generic(
+                              slow, 'test_exact', caches[slow.hostname]))
+        self.assertEqual(2, len(list(self.inspector.inspect_generic(
+            fast, 'test_prefix', caches[fast.hostname]))))
+        self.assertEqual(1, len(self._requests(slow.hostname)))
+
+    def test_circuit_breaker(self):
+        self.CONF.set_override('snmp_failure_threshold', 2, group='hardware')
+        self.CONF.set_override('snmp_failure_cooldown', 60, group='hardware')
+        down = self.hosts[0]
+        self.responder.down.add(down.hostname)
+        with mock.patch('time.time', return_value=0):
+            for i in range(3):
+                caches = self._prefetch([down])
+            self.assertEqual(2, len(self._requests(down.hostname)))
+            self.assertRaises(snmp.SNMPUnreachable, list,
+                              self.inspector.inspect_generic(
+                                  down, 'test_exact', {}))
+            self.assertEqual(2, len(self._requests(down.hostname)))
+        self.assertIn(self.inspector._CACHE_KEY_ERROR,
+                      caches[down.hostname])
+        self.responder.down.clear()
+        with mock.patch('time.time', return_value=60):
+            self._prefetch([down])
+        self.assertEqual(4, len(self._requests(down.hostname)))
+        self.assertEqual({}, self.inspector._failures)
+
+
+class UDPResponder(object):
+    """Answer the SNMP GetRequests sent to a local UDP port."""
+
+    def __init__(self, address, delay):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.sock = green_socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((address, 0))
+        self.address = address
+        self.port = self.sock.getsockname()[1]
+        self.thread = eventlet.spawn(self._serve)
+
+    def stop(self):
+        self.thread.kill()
+        self.sock.close()
+
+    def _serve(self):
+        while True:
+            msg, addr = self.sock.recvfrom(65535)
+            eventlet.spawn_n(self._answer, msg, addr)
+
+    def _answer(self, msg, addr):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            eventlet.sleep(self.delay)
+        finally:
+            self.active -= 1
+        p_mod = api.protoModules[int(api.decodeMessageVersion(msg))]
+        request, _rest = decoder.decode(msg, asn1Spec=p_mod.Message())
+        response = p_mod.apiMessage.getResponse(request)
+        var_binds = [(oid, p_mod.Integer(1)) for oid, _val in
+                     p_mod.apiPDU.getVarBinds(
+                         p_mod.apiMessage.getPDU(request))]
+        p_mod.apiPDU.setVarBinds(p_mod.apiMessage.getPDU(response),
+                                 var_binds)
+        self.sock.sendto(encoder.encode(response), addr)
+
+
+class TestSNMPInspectorUDP(test_base.BaseTestCase):
+    """Query real UDP agents, as the agent does once monkey patched."""
+
+    def setUp(self):
+        super(TestSNMPInspectorUDP, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.set_override('snmp_timeout', 2, group='hardware')
+        self.CONF.set_override('snmp_retries', 0, group='hardware')
+        self.useFixture(fixtures.MonkeyPatch('socket.socket',
+                                             green_socket.socket))
+        self.useFixture(fixtures.MonkeyPatch('select.select',
+                                             green_select.select))
+        self.responders = [UDPResponder('127.0.0.%d' % i, 0.2)
+                           for i in range(1, 4)]
+        for responder in self.responders:
+            self.addCleanup(responder.stop)
+        self.inspector = snmp.SNMPInspector()
+
+    def test_hosts_queried_concurrently(self):
+        hosts = [(netutils.urlsplit('snmp://public@%s:%d' %
+                                    (responder.address, responder.port)),
+                  {})
+                 for responder in self.responders]
+        start = eventlet.hubs.get_hub().clock()
+        self.inspector.prefetch(hosts, ['cpu.load.1min'])
+        elapsed = eventlet.hubs.get_hub().clock() - start
+        for host, cache in hosts:
+            self.assertEqual([1.0], [value for value, metadata, extra in
+                                     self.inspector.inspect_generic(
+                                         host, 'cpu.load.1min', cache)])
+        self.assertEqual(3, sum(r.max_active for r in self.responders))
+        self.assertTrue(elapsed < 0.5, elapsed)
@@ -15,7 +15,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import mock
+
+from ceilometer.agent import manager
+from ceilometer.agent import plugin_base
 from ceilometer.hardware.pollsters import cpu
+from ceilometer.hardware.pollsters import memory
 from ceilometer import sample
 from ceilometer.tests.hardware.pollsters import base
 
@@ -38,3 +43,26 @@ class TestCPUPollsters(base.TestPollsterBase):
                                 'hardware.cpu.load.15min',
                                 0.55, sample.TYPE_GAUGE,
                                 expected_unit='process')
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def test_prefetch_shared_by_pollsters(self):
+        mgr = manager.AgentManager()
+        pollsters = [cpu.CPULoad1MinPollster(), memory.MemoryTotalPollster()]
+        cache = {plugin_base.CACHE_KEY_POLLSTERS: pollsters}
+        with mock.patch.object(base.FakeInspector, 'prefetch') as prefetch:
+            for pollster in pollsters:
+                self.assertTrue(list(pollster.get_samples(mgr, cache,
+                                                          self.hosts)))
+        self.assertEqual(1, prefetch.call_count)
+        hosts, identifiers = prefetch.call_args[0]
+        self.assertEqual(self.hosts, [h.geturl() for h, c in hosts])
+        self.assertEqual(set(['cpu.load.1min', 'memory.total']), identifiers)
+        self.assertEqual(set(self.hosts),
+                         set(cache[cpu.CPULoad1MinPollster.CACHE_KEY_HOSTS]))
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def test_prefetch_without_polling_task(self):
+        with mock.patch.object(base.FakeInspector, 'prefetch') as prefetch:
+            list(cpu.CPULoad1MinPollster().get_samples(
+                manager.AgentManager(), {}, self.hosts))
+        self.assertEqual(set(['cpu.load.1min']), prefetch.call_args[0][1])
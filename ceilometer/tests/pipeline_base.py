@@ -18,6 +18,7 @@
 # under the License.
 
 import abc
+import copy
 import datetime
 import traceback
 
@@ -624,6 +625,30 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual('a_update',
                          getattr(new_publisher.samples[0], 'name'))
 
+    def test_batch_transformer_error_falls_back_per_sample(self):
+        self._reraise_exception = False
+        self._set_pipeline_cfg('counters', ['a', 'b'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        handle_sample = self.TransformerClass.handle_sample
+
+        def fail_on_b(transformer, ctxt, counter):
+            if counter.name == 'b':
+                raise Exception()
+            return handle_sample(transformer, ctxt, counter)
+
+        counter_b = copy.copy(self.test_counter)
+        counter_b.name = 'b'
+        with mock.patch.object(self.TransformerClass, 'handle_samples',
+                               side_effect=Exception()):
+            with mock.patch.object(self.TransformerClass, 'handle_sample',
+                                   fail_on_b):
+                with pipeline_manager.publisher(None) as p:
+                    p([self.test_counter, counter_b])
+
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(['a_update'], [s.name for s in publisher.samples])
+
     def test_multiple_counter_pipeline(self):
         self._set_pipeline_cfg('counters', ['a', 'b'])
         pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
@@ -1137,6 +1162,135 @@ class BasePipelineTestCase(base.BaseTestCase):
         units = ('B', 'request')
         self._do_test_rate_of_change_mapping(pipe, meters, units)
 
+    def _make_samples(self, volumes, unit='B', offset=0):
+        now = timeutils.utcnow()
+        return [sample.Sample(
+            name='disk.read.bytes',
+            type=sample.TYPE_CUMULATIVE,
+            volume=volume,
+            unit=unit,
+            user_id='test_user',
+            project_id='test_proj',
+            resource_id='test_resource%d' % (i % 2),
+            timestamp=(now + datetime.timedelta(seconds=offset + i // 2)
+                       ).isoformat(),
+            resource_metadata={}
+        ) for i, volume in enumerate(volumes)]
+
+    def _assert_same_samples(self, expected, actual):
+        fields = ('name', 'unit', 'type', 'volume', 'resource_id',
+                  'timestamp')
+        self.assertEqual([[getattr(s, f) for f in fields] for s in expected],
+                         [[getattr(s, f) for f in fields] for s in actual])
+
+    def test_unit_conversion_batch(self):
+        params = {'source': {'unit': 'B'},
+                  'target': {'name': 'disk.read.kilobytes', 'unit': 'KB',
+                             'scale': 1.0 / 1024}}
+        samples = self._make_samples([1024, 2048, 4096])
+        samples.insert(1, self._make_samples([1], unit='request')[0])
+        per_sample = conversions.ScalingTransformer(**params)
+        batch = conversions.ScalingTransformer(**params)
+        self._assert_same_samples(
+            [per_sample.handle_sample(None, s) for s in samples],
+            batch.handle_samples(None, samples))
+        self.assertEqual('request', samples[1].unit)
+
+    def test_unit_conversion_batch_expression_error(self):
+        transformer = conversions.ScalingTransformer(
+            target={'scale': '1.0 / volume'})
+        samples = self._make_samples([1, 0, 2])
+        self.assertEqual([1, 0.5], [s.volume for s in
+                                    transformer.handle_samples(None,
+                                                               samples)])
+
+    def test_rate_of_change_batch(self):
+        params = {'target': {'name': 'disk.read.bytes.rate',
+                             'unit': 'B/s', 'type': sample.TYPE_GAUGE}}
+        first = self._make_samples([100, 200])
+        second = self._make_samples([300, 150, 400, 500], offset=10)
+        per_sample = conversions.RateOfChangeTransformer(**params)
+        batch = conversions.RateOfChangeTransformer(**params)
+        expected = [s for s in (per_sample.handle_sample(None, s)
+                                for s in first + second) if s]
+        self.assertEqual([], batch.handle_samples(None, first))
+        actual = batch.handle_samples(None, second)
+        self._assert_same_samples(expected, actual)
+        self.assertEqual([20.0, 15.0, 100.0, 350.0],
+                         [s.volume for s in actual])
+
+    def test_rate_of_change_batch_error_not_cached(self):
+        params = {'target': {'name': 'disk.read.bytes.rate',
+                             'unit': 'B/s', 'type': sample.TYPE_GAUGE}}
+        first = self._make_samples([100, 200])
+        second = self._make_samples([300, 150], offset=10)
+        per_sample = conversions.RateOfChangeTransformer(**params)
+        batch = conversions.RateOfChangeTransformer(**params)
+        expected = [s for s in (per_sample.handle_sample(None, s)
+                                for s in first + second) if s]
+        self.assertEqual([], batch.handle_samples(None, first))
+        with mock.patch.object(batch, '_convert_samples',
+                               side_effect=ValueError):
+            self.assertRaises(ValueError, batch.handle_samples, None, second)
+        # NOTE: the pipeline then transforms the samples one by one.
+        actual = [batch.handle_sample(None, s) for s in second]
+        self._assert_same_samples(expected, actual)
+        self.assertEqual([20.0, 15.0], [s.volume for s in actual])
+
+    def test_arithmetic_transformer_batch(self):
+        transformer = arithmetic.ArithmeticTransformer(
+            target={'name': 'new_meter', 'unit': '%',
+                    'expr': '$(disk.read.bytes) * 2'})
+        samples = self._make_samples([1, 2])
+        self.assertEqual([], transformer.handle_samples(None, samples))
+        self.assertEqual([2, 4], sorted(s.volume for s in
+                                        transformer.flush(None)))
+
+    def test_expression_same_as_eval(self):
+        s = self._make_samples([120000000000])[0]
+        s.resource_metadata = {'cpu_number': 4, 'user_metadata': {}}
+        for expr in ('100.0 / (10**9 * (resource_metadata.cpu_number or 1))',
+                     '(resource_metadata.user_metadata.weight or 1.0) * 2',
+                     '(volume * 1.8) + 32',
+                     'volume if unit == "B" else -volume',
+                     "resource_metadata['cpu_number'] * volume",
+                     '1.0 / 1024'):
+            self.assertEqual(
+                eval(expr, {}, transformer.Namespace(s.as_dict())),
+                transformer.Expression(expr).evaluate(s))
+
+    def test_expression_constant(self):
+        expression = transformer.Expression('1.0 / 1024')
+        self.assertEqual(1.0 / 1024, expression.constant)
+        with mock.patch.object(expression, '_eval') as mock_eval:
+            self.assertEqual(1.0 / 1024, expression.evaluate(None))
+        self.assertFalse(mock_eval.called)
+
+    def test_expression_constant_error(self):
+        expression = transformer.Expression('1 / 0')
+        self.assertRaises(ZeroDivisionError, expression.evaluate, None)
+
+    def test_expression_not_allowed(self):
+        for expr in ('volume.__class__', '__import__("os")',
+                     '(lambda: 1)()', '[x for x in volume]', 'volume;'):
+            self.assertRaises((ValueError, SyntaxError),
+                              transformer.Expression, expr)
+        self.assertRaises(ValueError, conversions.ScalingTransformer,
+                          target={'scale': '_secret * volume'})
+
+    def test_transformer_batch_default_drops_failing_sample(self):
+        class HalfTransformer(transformer.TransformerBase):
+            def handle_sample(self, ctxt, s):
+                if s.volume % 2:
+                    raise ValueError(s.volume)
+                return s
+
+        samples = self._make_samples([1, 2, 3, 4])
+        with mock.patch.object(transformer, 'LOG') as mylog:
+            self.assertEqual([2, 4], [s.volume for s in HalfTransformer()
+                                      .handle_samples(None, samples)])
+        self.assertEqual(2, mylog.exception.call_count)
+
     def _do_test_aggregator(self, parameters, expected_length):
         transformer_cfg = [
             {
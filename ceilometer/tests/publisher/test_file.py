@@ -18,10 +18,19 @@
 """
 
 import datetime
+import gzip
 import logging.handlers
 import os
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 
+import eventlet
+import mock
+import msgpack
+from oslo.serialization import jsonutils
 from oslo.utils import netutils
 from oslotest import base
 
@@ -120,3 +129,167 @@ class TestFilePublisher(base.BaseTestCase):
                                   self.test_data)
 
         self.assertIsNone(publisher.publisher_logger)
+
+    def test_file_publisher_json(self):
+        name = '%s/samples' % tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit('file://%s?format=json'
+                                       '&flush_interval=0' % name)
+        publisher = file.FilePublisher(parsed_url)
+        self.assertIsNone(publisher.publisher_logger)
+        publisher.publish_samples(None, self.test_data)
+        publisher.sink.close()
+        with open(name) as f:
+            records = [jsonutils.loads(line) for line in f]
+        self.assertEqual([s.id for s in self.test_data],
+                         [r['id'] for r in records])
+
+    def test_file_publisher_msgpack(self):
+        name = '%s/samples' % tempfile.mkdtemp()
+        parsed_url = netutils.urlsplit('file://%s?format=msgpack'
+                                       '&buffer_size=1' % name)
+        publisher = file.FilePublisher(parsed_url)
+        publisher.publish_samples(None, self.test_data)
+        with open(name, 'rb') as f:
+            records = list(msgpack.Unpacker(f, encoding='utf-8'))
+        self.assertEqual([s.id for s in self.test_data],
+                         [r['id'] for r in records])
+
+    def test_file_publisher_invalid_format(self):
+        parsed_url = netutils.urlsplit('file://%s/samples?format=csv'
+                                       % tempfile.mkdtemp())
+        publisher = file.FilePublisher(parsed_url)
+        self.assertIsNone(publisher.sink)
+        self.assertIsNone(publisher.publisher_logger)
+
+    def test_file_publisher_invalid_compression(self):
+        parsed_url = netutils.urlsplit('file://%s/samples?format=json'
+                                       '&compression=lzma'
+                                       % tempfile.mkdtemp())
+        publisher = file.FilePublisher(parsed_url)
+        self.assertIsNone(publisher.sink)
+
+
+class TestBufferedFileSink(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestBufferedFileSink, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'records')
+
+    def _read(self, path, opener=open):
+        with opener(path, 'rb') as f:
+            return [jsonutils.loads(line.decode('utf-8')) for line in f]
+
+    def test_flush_on_size(self):
+        sink = file.BufferedFileSink(self.path, buffer_size=20,
+                                     flush_interval=0)
+        sink.write([{'id': 1}])
+        self.assertFalse(os.path.exists(self.path))
+        sink.write([{'id': 2}])
+        self.assertEqual([{'id': 1}, {'id': 2}], self._read(self.path))
+
+    def test_flush_on_time(self):
+        sink = file.BufferedFileSink(self.path, flush_interval=0.01)
+        sink.write([{'id': 1}])
+        for i in range(500):
+            if os.path.exists(self.path):
+                break
+            eventlet.sleep(0.01)
+        sink.close()
+        self.assertEqual([{'id': 1}], self._read(self.path))
+
+    def test_flush_on_time_monkey_patched(self):
+        # NOTE: the agents monkey patch threading but not time, which used
+        # to freeze them as soon as a flusher slept
+        script = ('import eventlet\n'
+                  'eventlet.monkey_patch(socket=True, select=True, '
+                  'thread=True)\n'
+                  'from ceilometer.publisher import file\n'
+                  'sink = file.BufferedFileSink(%r, flush_interval=0.01)\n'
+                  'sink.write([{"id": 1}])\n'
+                  'eventlet.sleep(0.1)\n' % self.path)
+        process = subprocess.Popen([sys.executable, '-c', script])
+        for i in range(500):
+            if process.poll() is not None:
+                break
+            time.sleep(0.01)
+        else:
+            process.kill()
+            self.fail('the monkey patched sink froze the process')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual([{'id': 1}], self._read(self.path))
+
+    def test_rotate_on_size_compressed(self):
+        sink = file.BufferedFileSink(self.path, buffer_size=1,
+                                     flush_interval=0, max_bytes=15,
+                                     backup_count=2, compression='gzip')
+        for i in range(4):
+            sink.write([{'id': i}])
+        sink.close()
+        self.assertEqual([{'id': 3}], self._read(self.path))
+        self.assertEqual([{'id': 2}],
+                         self._read(self.path + '.1.gz', gzip.open))
+        self.assertEqual([{'id': 1}],
+                         self._read(self.path + '.2.gz', gzip.open))
+        self.assertFalse(os.path.exists(self.path + '.3.gz'))
+
+    def test_rotate_on_time(self):
+        sink = file.BufferedFileSink(self.path, buffer_size=1,
+                                     flush_interval=0, rotate_interval=60,
+                                     backup_count=1)
+        sink.write([{'id': 1}])
+        with mock.patch('time.time', return_value=time.time() + 60):
+            sink.write([{'id': 2}])
+        self.assertEqual([{'id': 2}], self._read(self.path))
+        self.assertEqual([{'id': 1}], self._read(self.path + '.1'))
+
+    @mock.patch('os.fsync')
+    def test_fsync_on_flush(self, mock_fsync):
+        sink = file.BufferedFileSink(self.path, buffer_size=1,
+                                     flush_interval=0, fsync='flush')
+        sink.write([{'id': 1}])
+        self.assertEqual(1, mock_fsync.call_count)
+
+    @mock.patch('os.fsync')
+    def test_fsync_on_rotate(self, mock_fsync):
+        sink = file.BufferedFileSink(self.path, buffer_size=1,
+                                     flush_interval=0, max_bytes=1,
+                                     fsync='rotate')
+        sink.write([{'id': 1}])
+        self.assertFalse(mock_fsync.called)
+        sink.write([{'id': 2}])
+        self.assertEqual(1, mock_fsync.call_count)
+
+    def test_close_sinks(self):
+        sink = file.BufferedFileSink(self.path, flush_interval=0)
+        sink.write([{'id': 1}])
+        file.close_sinks()
+        self.assertEqual([{'id': 1}], self._read(self.path))
+        self.assertNotIn(sink, file._SINKS)
+
+    def test_compress_out_of_write_lock(self):
+        sink = file.BufferedFileSink(self.path, buffer_size=1,
+                                     flush_interval=0, max_bytes=1,
+                                     backup_count=1, compression='gzip')
+        locked = []
+
+        def compress(source, target):
+            def try_lock():
+                locked.append(not sink._lock.acquire(False))
+                if not locked[-1]:
+                    sink._lock.release()
+            t = threading.Thread(target=try_lock)
+            t.start()
+            t.join()
+            os.rename(source, target)
+
+        with mock.patch.object(sink, '_compress', side_effect=compress):
+            sink.write([{'id': 1}])
+            sink.write([{'id': 2}])
+        self.assertEqual([False], locked)
+        self.assertEqual([{'id': 1}], self._read(self.path + '.1.gz'))
+        self.assertEqual([{'id': 2}], self._read(self.path))
+
+    def test_zstd_requires_module(self):
+        with mock.patch.object(file, 'zstandard', None):
+            self.assertRaises(ValueError, file.BufferedFileSink, self.path,
+                              compression='zstd')
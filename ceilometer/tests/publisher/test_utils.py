@@ -18,10 +18,12 @@
 # under the License.
 """Tests for ceilometer/publisher/utils.py
 """
+import mock
 from oslo.serialization import jsonutils
 from oslotest import base
 
 from ceilometer.publisher import utils
+from ceilometer import sample
 
 
 class TestSignature(base.BaseTestCase):
@@ -121,6 +123,59 @@ class TestSignature(base.BaseTestCase):
         jsondata = jsonutils.loads(jsonutils.dumps(data))
         self.assertTrue(utils.verify_signature(jsondata, 'not-so-secret'))
 
+    def test_compute_signature_unchanged(self):
+        # NOTE: signatures must match the ones of the agents and collectors
+        # which have not been upgraded.
+        data = {'a': 'A',
+                'b': [u'\u20ac', 1],
+                'resource_metadata': {'x': {'y': 1}, 'l': (u'a',)},
+                'n': None,
+                'message_signature': 'z'}
+        self.assertEqual('5180b9e3fcd1edb4ef27e38a0bc2220b'
+                         'db700449f2c498d2508f4e18868c980c',
+                         utils.compute_signature(data, 'not-so-secret'))
+
+    def test_compute_signatures_shared_metadata(self):
+        metadata = {'a': 'A', 'nested': {'b': 'B'}}
+        messages = [{'id': i, 'resource_metadata': metadata}
+                    for i in range(2)]
+        with mock.patch.object(utils, '_canonicalize',
+                               wraps=utils._canonicalize) as canonicalize:
+            signatures = utils.compute_signatures(messages, 'not-so-secret')
+        self.assertEqual(1, canonicalize.call_count)
+        self.assertEqual([utils.compute_signature(m, 'not-so-secret')
+                          for m in messages], signatures)
+
+    def test_verify_signatures(self):
+        messages = [{'a': 'A'}, {'a': 'B'}]
+        for message in messages:
+            message['message_signature'] = utils.compute_signature(
+                message, 'not-so-secret')
+        messages[1]['a'] = 'C'
+        self.assertEqual([True, False],
+                         utils.verify_signatures(messages, 'not-so-secret'))
+
+    def test_verify_signatures_trusted(self):
+        messages = utils.TrustedMessages([{'a': 'A'}])
+        self.assertEqual([True],
+                         utils.verify_signatures(messages, 'not-so-secret'))
+
+    def test_meter_messages_from_counters(self):
+        samples = [sample.Sample(name='test', type=sample.TYPE_CUMULATIVE,
+                                 unit='', volume=i, user_id='test',
+                                 project_id='test', resource_id='test',
+                                 timestamp=None,
+                                 resource_metadata={'name': 'test'})
+                   for i in range(2)]
+        messages = utils.meter_messages_from_counters(samples,
+                                                      'not-so-secret')
+        self.assertEqual([0, 1], [m['counter_volume'] for m in messages])
+        self.assertEqual(
+            [utils.meter_message_from_counter(s, 'not-so-secret')
+             for s in samples], messages)
+        self.assertEqual([True, True],
+                         utils.verify_signatures(messages, 'not-so-secret'))
+
     def test_besteffort_compare_digest(self):
         hash1 = "f5ac3fe42b80b80f979825d177191bc5"
         hash2 = "f5ac3fe42b80b80f979825d177191bc5"
@@ -0,0 +1,118 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import calendar
+import datetime
+
+import mock
+from oslo.config import fixture as fixture_config
+from oslotest import base
+
+from ceilometer.storage.sqlalchemy import partition
+
+
+def _epoch(*args):
+    return calendar.timegm(datetime.datetime(*args).utctimetuple())
+
+
+class PartitionManagerTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(PartitionManagerTest, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF([], project='ceilometer')
+
+    def test_day_partition(self):
+        manager = partition.PartitionManager('day')
+        start = manager.start(_epoch(2015, 7, 2, 10, 39))
+        self.assertEqual(_epoch(2015, 7, 2), start)
+        self.assertEqual('p20150702', manager.name(start))
+        self.assertEqual(start, manager.parse('p20150702'))
+
+    def test_week_partition_starts_on_monday(self):
+        manager = partition.PartitionManager('week')
+        start = manager.start(_epoch(2015, 7, 2, 10, 39))
+        self.assertEqual(_epoch(2015, 6, 29), start)
+        self.assertEqual(start, manager.start(_epoch(2015, 7, 5, 23, 59)))
+        self.assertEqual(start + manager.period,
+                         manager.start(_epoch(2015, 7, 6)))
+
+    def test_parse_invalid_name(self):
+        self.assertIsNone(partition.PartitionManager.parse('pmax'))
+
+    def test_missing(self):
+        manager = partition.PartitionManager('day')
+        self.assertEqual([1, 3], manager.missing([2], [3, 1, 2, 3]))
+
+    def test_mysql_missing_only_after_last_partition(self):
+        manager = partition.MySQLPartitionManager('day')
+        day = manager.period
+        self.assertEqual([3 * day], manager.missing([day, 2 * day],
+                                                    [0, 2 * day, 3 * day]))
+        self.assertEqual([0, day], manager.missing([], [day, 0]))
+
+    def test_postgresql_create(self):
+        manager = partition.PostgreSQLPartitionManager('day')
+        conn = mock.Mock()
+        manager.create(conn, _epoch(2015, 7, 2))
+        statements = [c[0][0] for c in conn.execute.call_args_list]
+        self.assertEqual(
+            "CREATE TABLE sample_p20150702 (PRIMARY KEY (id), "
+            "FOREIGN KEY (meter_id) REFERENCES meter (id), "
+            "FOREIGN KEY (resource_id) REFERENCES resource (internal_id), "
+            "CHECK (\"timestamp\" >= '2015-07-02 00:00:00' AND "
+            "\"timestamp\" < '2015-07-03 00:00:00')) INHERITS (sample)",
+            statements[0])
+        self.assertIn('CREATE INDEX ix_sample_p20150702_timestamp '
+                      'ON sample_p20150702 ("timestamp")', statements)
+        self.assertEqual('sample_p20150702',
+                         manager.table(_epoch(2015, 7, 2)).name)
+
+    @mock.patch('sqlalchemy.inspect')
+    def test_postgresql_setup_adds_foreign_keys(self, inspect):
+        manager = partition.PostgreSQLPartitionManager('day')
+        conn = mock.Mock()
+        conn.execute.return_value = [('sample_p20150702',)]
+        inspect.return_value.get_foreign_keys.return_value = [
+            {'constrained_columns': ['meter_id']}]
+        manager.setup(conn)
+        self.assertEqual('ALTER TABLE sample_p20150702 ADD FOREIGN KEY '
+                         '(resource_id) REFERENCES resource (internal_id)',
+                         conn.execute.call_args[0][0])
+        self.assertEqual(2, conn.execute.call_count)
+
+    def test_mysql_create(self):
+        manager = partition.MySQLPartitionManager('day')
+        conn = mock.Mock()
+        manager.create(conn, _epoch(2015, 7, 2))
+        conn.execute.assert_called_once_with(
+            'ALTER TABLE sample REORGANIZE PARTITION pmax INTO '
+            '(PARTITION p20150702 VALUES LESS THAN (%d), '
+            'PARTITION pmax VALUES LESS THAN MAXVALUE)' % _epoch(2015, 7, 3))
+
+    def test_get_manager(self):
+        self.assertIsNone(partition.get_manager('postgresql'))
+        self.CONF.set_override('sql_sample_partition', 'week',
+                               group='database')
+        manager = partition.get_manager('postgresql')
+        self.assertIsInstance(manager, partition.PostgreSQLPartitionManager)
+        self.assertEqual(7 * 86400, manager.period)
+        self.assertIsInstance(partition.get_manager('mysql'),
+                              partition.MySQLPartitionManager)
+
+    @mock.patch.object(partition, 'LOG')
+    def test_get_manager_unsupported_dialect(self, mock_log):
+        self.CONF.set_override('sql_sample_partition', 'day',
+                               group='database')
+        self.assertIsNone(partition.get_manager('sqlite'))
+        self.assertTrue(mock_log.warn.called)
@@ -23,13 +23,19 @@
   running the tests. Make sure the Thrift server is running on that server.
 
 """
+import collections
+import datetime
+
 import mock
 
 from ceilometer.alarm.storage import impl_hbase as hbase_alarm
 from ceilometer.event.storage import impl_hbase as hbase_event
+from ceilometer import storage
+from ceilometer.storage.hbase import inmemory as hbase_inmemory
 from ceilometer.storage import impl_hbase as hbase
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
+from ceilometer.tests.storage import test_storage_scenarios as scenarios
 
 
 class ConnectionTest(tests_db.TestBase,
@@ -54,6 +60,80 @@ class ConnectionTest(tests_db.TestBase,
         self.assertIsInstance(conn.conn_pool, TestConn)
 
 
+@tests_db.run_with('hbase')
+class StatisticsTest(scenarios.DBTestBase,
+                     tests_db.MixinTestsWithBackendScenarios):
+
+    Aggregate = collections.namedtuple('Aggregate', ['func', 'param'])
+
+    def prepare_data(self):
+        samples = [((2012, 7, 2, 10, 40), 1, 'user-1', 'resource-1'),
+                   ((2012, 7, 2, 10, 41, 30), 2, 'user-1', 'resource-2'),
+                   ((2012, 7, 2, 10, 42, 10), 3, 'user-2', 'resource-2'),
+                   ((2012, 7, 2, 10, 42, 50), 6, 'user-1', 'resource-3')]
+        for ts, volume, user_id, resource_id in samples:
+            self.create_and_store_sample(
+                timestamp=datetime.datetime(*ts), volume=volume,
+                user_id=user_id, resource_id=resource_id)
+
+    def test_scan_only_statistics_columns(self):
+        scan = hbase_inmemory.MTable.scan
+        with mock.patch.object(hbase_inmemory.MTable, 'scan',
+                               autospec=True, side_effect=scan) as m_scan:
+            results = self.conn.get_meter_statistics(
+                storage.SampleFilter(meter='instance'))
+        self.assertEqual(1, len(results))
+        self.assertEqual(4, results[0].count)
+        self.assertEqual(1, m_scan.call_count)
+        kwargs = m_scan.call_args[1]
+        self.assertEqual(self.CONF.database.hbase_scan_batch_size,
+                         kwargs['batch_size'])
+        self.assertNotIn('f:message', kwargs['columns'])
+
+    def test_period_aligned_on_oldest_sample(self):
+        results = self.conn.get_meter_statistics(
+            storage.SampleFilter(meter='instance'), period=60)
+        self.assertEqual([datetime.datetime(2012, 7, 2, 10, 40),
+                          datetime.datetime(2012, 7, 2, 10, 41),
+                          datetime.datetime(2012, 7, 2, 10, 42)],
+                         [r.period_start for r in results])
+        self.assertEqual([1, 1, 2], [r.count for r in results])
+        self.assertEqual([1, 2, 9], [r.sum for r in results])
+        self.assertEqual(40, results[2].duration)
+
+    def test_period_groupby_selectable_aggregates(self):
+        aggregate = [self.Aggregate(func='stddev', param=None),
+                     self.Aggregate(func='cardinality', param='resource_id'),
+                     self.Aggregate(func='max', param=None)]
+        results = self.conn.get_meter_statistics(
+            storage.SampleFilter(meter='instance'), period=120,
+            groupby=['user_id'], aggregate=aggregate)
+        stats = dict(((r.period_start, r.groupby['user_id']), r)
+                     for r in results)
+        self.assertEqual(3, len(stats))
+        first = stats[(datetime.datetime(2012, 7, 2, 10, 40), 'user-1')]
+        self.assertEqual({'stddev': 0.5, 'cardinality/resource_id': 2,
+                          'max': 2}, first.aggregate)
+        self.assertEqual(2, first.max)
+        self.assertFalse(hasattr(first, 'count'))
+        second = stats[(datetime.datetime(2012, 7, 2, 10, 42), 'user-1')]
+        self.assertEqual({'stddev': 0.0, 'cardinality/resource_id': 1,
+                          'max': 6}, second.aggregate)
+        self.assertIn((datetime.datetime(2012, 7, 2, 10, 42), 'user-2'),
+                      stats)
+
+    def test_bad_aggregate(self):
+        aggregate = [self.Aggregate(func='cardinality', param='counter_name')]
+        self.assertRaises(storage.StorageBadAggregate,
+                          self.conn.get_meter_statistics,
+                          storage.SampleFilter(meter='instance'),
+                          aggregate=aggregate)
+
+    def test_no_samples(self):
+        self.assertEqual([], self.conn.get_meter_statistics(
+            storage.SampleFilter(meter='unknown'), period=60))
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
@@ -74,19 +154,19 @@ class CapabilitiesTest(test_base.BaseTestCase):
                                   'metadata': True,
                                   'complex': False}},
             'statistics': {'pagination': False,
-                           'groupby': False,
+                           'groupby': True,
                            'query': {'simple': True,
                                      'metadata': True,
                                      'complex': False},
                            'aggregation': {'standard': True,
                                            'selectable': {
-                                               'max': False,
-                                               'min': False,
-                                               'sum': False,
-                                               'avg': False,
-                                               'count': False,
-                                               'stddev': False,
-                                               'cardinality': False}}
+                                               'max': True,
+                                               'min': True,
+                                               'sum': True,
+                                               'avg': True,
+                                               'count': True,
+                                               'stddev': True,
+                                               'cardinality': True}}
                            },
         }
 
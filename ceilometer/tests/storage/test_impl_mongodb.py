@@ -23,10 +23,15 @@
 
 """
 
+import datetime
+
 from ceilometer.alarm.storage import impl_mongodb as impl_mongodb_alarm
 from ceilometer.event.storage import impl_mongodb as impl_mongodb_event
+from ceilometer.publisher import utils
+from ceilometer import sample
 from ceilometer.storage import base
 from ceilometer.storage import impl_mongodb
+from ceilometer.storage.mongo import utils as pymongo_utils
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
 from ceilometer.tests.storage import test_storage_scenarios
@@ -54,6 +59,69 @@ class MongoDBConnection(tests_db.TestBase):
         self.assertEqual(expect, ret)
 
 
+@tests_db.run_with('mongodb')
+class ResourceBulkUpdateTest(test_storage_scenarios.DBTestBase):
+
+    def prepare_data(self):
+        pass
+
+    def _record(self, bulk):
+        self.conn._bulk_resource_update = bulk
+        samples = []
+        for minute, tag in [(42, 'newest'), (40, 'oldest'), (41, 'middle')]:
+            s = sample.Sample(
+                'instance', sample.TYPE_GAUGE, unit='instance', volume=1,
+                user_id='user-id', project_id='project-id',
+                resource_id='resource-id',
+                timestamp=datetime.datetime(2012, 7, 2, 10, minute),
+                resource_metadata={'tag': tag, 'display.name': 'server'},
+                source='test')
+            samples.append(utils.meter_message_from_counter(
+                s, self.CONF.publisher.metering_secret))
+        # an in-order batch followed by an out-of-order one
+        self.conn.record_metering_data_batch(samples[1:])
+        self.conn.record_metering_data_batch(samples[:1])
+        self.conn.record_metering_data_batch(samples[1:2])
+        resource = self.conn.db.resource.find_one({'_id': 'resource-id'})
+        self.conn.clear()
+        return resource
+
+    def test_bulk_update_as_legacy(self):
+        if not self.conn._bulk_resource_update:
+            self.skipTest('MongoDB bulk operations not supported')
+        legacy = self._record(False)
+        bulk = self._record(True)
+        for key in ['first_sample_timestamp', 'last_sample_timestamp',
+                    'metadata', 'meter', 'project_id', 'user_id', 'source']:
+            self.assertEqual(legacy[key], bulk[key])
+        self.assertEqual('newest', bulk['metadata']['tag'])
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 40),
+                         bulk['first_sample_timestamp'])
+
+    def test_caller_metadata_not_modified(self):
+        metadata = {'display.name': 'server'}
+        s = sample.Sample(
+            'instance', sample.TYPE_GAUGE, unit='instance', volume=1,
+            user_id='user-id', project_id='project-id',
+            resource_id='resource-id',
+            timestamp=datetime.datetime(2012, 7, 2, 10, 40),
+            resource_metadata=metadata, source='test')
+        msg = utils.meter_message_from_counter(
+            s, self.CONF.publisher.metering_secret)
+        self.conn.record_metering_data(msg)
+        self.assertEqual({'display.name': 'server'}, msg['resource_metadata'])
+        self.assertNotIn('_id', msg)
+
+
+class MongoUtilsTest(test_base.BaseTestCase):
+
+    def test_has_unsafe_keys(self):
+        self.assertFalse(pymongo_utils.has_unsafe_keys({'a': {'b': 1}}))
+        self.assertFalse(pymongo_utils.has_unsafe_keys('a.b'))
+        self.assertTrue(pymongo_utils.has_unsafe_keys({'a.b': 1}))
+        self.assertTrue(pymongo_utils.has_unsafe_keys({'a': {'$b': 1}}))
+
+
 @tests_db.run_with('mongodb')
 class MongoDBTestMarkerBase(test_storage_scenarios.DBTestBase):
     # NOTE(Fengqian): All these three test case are the same for resource
@@ -22,6 +22,7 @@
 
 """
 
+import collections
 import datetime
 import repr
 
@@ -31,8 +32,12 @@ from oslo.utils import timeutils
 from ceilometer.alarm.storage import impl_sqlalchemy as impl_sqla_alarm
 from ceilometer.event.storage import impl_sqlalchemy as impl_sqla_event
 from ceilometer.event.storage import models
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
 from ceilometer.storage import impl_sqlalchemy
 from ceilometer.storage.sqlalchemy import models as sql_models
+from ceilometer.storage.sqlalchemy import partition
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
 from ceilometer.tests.storage import test_storage_scenarios as scenarios
@@ -194,6 +199,446 @@ class RelationshipTest(scenarios.DBTestBase):
                                  ))
 
 
+@tests_db.run_with('sqlite', 'mysql', 'postgresql')
+class RollupTest(scenarios.DBTestBase):
+    # Statistics answered from the rollups must be the same as the ones
+    # computed from the raw samples.
+
+    Aggregate = collections.namedtuple('Aggregate', ['func', 'param'])
+
+    def prepare_data(self):
+        # NOTE: utcnow is 2015-07-02 10:39, so the minute rollups are
+        # complete from 10:40 and the hourly ones from 11:00.
+        self.CONF.set_override('rollup_resolutions', ['60', '3600'],
+                               group='database')
+        samples = [((10, 40, 30), 7, 'user-1', 'resource-1'),
+                   ((11, 0, 0), 1, 'user-1', 'resource-1'),
+                   ((11, 0, 30), 2, 'user-2', 'resource-1'),
+                   ((11, 30, 15), 3, 'user-1', 'resource-2'),
+                   ((12, 15, 0), 4, 'user-1', 'resource-1'),
+                   ((12, 59, 59, 500000), 5, 'user-2', 'resource-2'),
+                   ((13, 5, 0), 6, 'user-1', 'resource-1')]
+        for ts, volume, user_id, resource_id in samples:
+            self.create_and_store_sample(
+                timestamp=datetime.datetime(2015, 7, 2, *ts), volume=volume,
+                user_id=user_id, resource_id=resource_id)
+
+    def _assert_rollup_statistics(self, resolution, f, period=None,
+                                  groupby=None, aggregate=None):
+        def key(stat):
+            return stat.period_start, sorted((stat.groupby or {}).items())
+
+        self.assertEqual(resolution, self.conn._get_rollup_resolution(
+            f, period, aggregate))
+        rollup = sorted(self.conn.get_meter_statistics(
+            f, period, groupby, aggregate), key=key)
+        with mock.patch.object(self.conn, '_get_rollup_resolution',
+                               return_value=None):
+            raw = sorted(self.conn.get_meter_statistics(
+                f, period, groupby, aggregate), key=key)
+        self.assertTrue(raw)
+        self.assertEqual([s.as_dict() for s in raw],
+                         [s.as_dict() for s in rollup])
+
+    def test_hourly_period(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2015, 7, 2, 11),
+            end_timestamp=datetime.datetime(2015, 7, 2, 14))
+        self._assert_rollup_statistics(3600, f, period=3600)
+        self._assert_rollup_statistics(3600, f, period=7200)
+
+    def test_minute_rollup_before_hourly_since(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2015, 7, 2, 10, 40),
+            end_timestamp=datetime.datetime(2015, 7, 2, 13, 6))
+        self._assert_rollup_statistics(60, f)
+        self._assert_rollup_statistics(60, f, period=1800)
+
+    def test_groupby(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2015, 7, 2, 11))
+        self._assert_rollup_statistics(3600, f,
+                                       groupby=['user_id', 'resource_id'])
+        self._assert_rollup_statistics(3600, f, period=3600,
+                                       groupby=['project_id'])
+
+    def test_filters(self):
+        f = storage.SampleFilter(
+            meter='instance', user='user-1', resource='resource-1',
+            start_timestamp=datetime.datetime(2015, 7, 2, 11))
+        self._assert_rollup_statistics(3600, f)
+
+    def test_aggregate(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2015, 7, 2, 11))
+        aggregate = [self.Aggregate(func='max', param=None),
+                     self.Aggregate(func='avg', param=None)]
+        self._assert_rollup_statistics(3600, f, period=3600,
+                                       aggregate=aggregate)
+
+    def test_batch_merged_into_rollups(self):
+        samples = []
+        for ts, volume in [((13, 10, 0), 9), ((13, 20, 0), 0),
+                           ((13, 20, 30), 8), ((12, 30, 0), 2)]:
+            s = sample.Sample(
+                'instance', sample.TYPE_CUMULATIVE, unit='', volume=volume,
+                user_id='user-1', project_id='project-id',
+                resource_id='resource-1',
+                timestamp=datetime.datetime(2015, 7, 2, *ts),
+                resource_metadata={'display_name': 'test-server',
+                                   'tag': 'self.counter'})
+            samples.append(utils.meter_message_from_counter(
+                s, self.CONF.publisher.metering_secret))
+        self.conn.record_metering_data_batch(samples)
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2015, 7, 2, 11))
+        self._assert_rollup_statistics(3600, f, period=3600)
+        self._assert_rollup_statistics(3600, f, period=3600,
+                                       groupby=['user_id'])
+
+    def test_rollups_upserted_with_executemany(self):
+        ts = datetime.datetime(2015, 7, 2, 13)
+        rollups = {(60, 1435842000, 1, 1): [2, 3.0, 1.0, 2.0, ts, ts],
+                   (3600, 1435842000, 1, 1): [2, 3.0, 1.0, 2.0, ts, ts]}
+        for dialect in ('mysql', 'postgresql'):
+            conn = mock.Mock()
+            conn.dialect.name = dialect
+            impl_sqlalchemy.Connection._update_rollups(conn, rollups)
+            self.assertEqual(1, conn.execute.call_count)
+            upsert, params = conn.execute.call_args[0]
+            self.assertIn('INSERT INTO rollup', str(upsert))
+            self.assertEqual(
+                [{'resolution': 60, 'timestamp': 1435842000,
+                  'meter_id': 1, 'resource_id': 1, 'sample_count': 2,
+                  'volume_sum': 3.0, 'volume_min': 1.0, 'volume_max': 2.0,
+                  'first_timestamp': ts, 'last_timestamp': ts},
+                 {'resolution': 3600, 'timestamp': 1435842000,
+                  'meter_id': 1, 'resource_id': 1, 'sample_count': 2,
+                  'volume_sum': 3.0, 'volume_min': 1.0, 'volume_max': 2.0,
+                  'first_timestamp': ts, 'last_timestamp': ts}],
+                sorted(params, key=lambda p: p['resolution']))
+
+    def test_raw_samples_used(self):
+        start = datetime.datetime(2015, 7, 2, 11)
+        for f, period, aggregate in [
+                (storage.SampleFilter(meter='instance'), None, None),
+                (storage.SampleFilter(meter='instance',
+                                      start_timestamp=datetime.datetime(
+                                          2015, 7, 2, 10, 39)), None, None),
+                (storage.SampleFilter(meter='instance',
+                                      start_timestamp=datetime.datetime(
+                                          2015, 7, 2, 11, 0, 30)),
+                 None, None),
+                (storage.SampleFilter(meter='instance',
+                                      start_timestamp=start,
+                                      start_timestamp_op='gt'), None, None),
+                (storage.SampleFilter(meter='instance',
+                                      start_timestamp=start,
+                                      end_timestamp=datetime.datetime(
+                                          2015, 7, 2, 12),
+                                      end_timestamp_op='le'), None, None),
+                (storage.SampleFilter(meter='instance',
+                                      start_timestamp=start,
+                                      message_id='id'), None, None),
+                (storage.SampleFilter(meter='instance',
+                                      start_timestamp=start), 90, None),
+                (storage.SampleFilter(meter='instance',
+                                      start_timestamp=start), None,
+                 [self.Aggregate(func='stddev', param=None)])]:
+            self.assertIsNone(self.conn._get_rollup_resolution(
+                f, period, aggregate))
+
+        f = storage.SampleFilter(meter='instance', start_timestamp=start)
+        self.CONF.set_override('rollup_resolutions', [], group='database')
+        self.assertIsNone(self.conn._get_rollup_resolution(f, None, None))
+
+    def test_unregister_resolution(self):
+        self.CONF.set_override('rollup_resolutions', ['60'],
+                               group='database')
+        self.conn._rollups_registered = False
+        self.create_and_store_sample(
+            timestamp=datetime.datetime(2015, 7, 2, 13, 30))
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2015, 7, 2, 11))
+        self.CONF.set_override('rollup_resolutions', ['60', '3600'],
+                               group='database')
+        self.assertEqual(60, self.conn._get_rollup_resolution(f, None, None))
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expirer_removes_rollups(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2015, 7, 2, 12, 59)
+        self.conn.clear_expired_metering_data(0)
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(
+            [(60, 1), (60, 1), (3600, 1), (3600, 1)],
+            session.query(sql_models.Rollup.resolution,
+                          sql_models.Rollup.sample_count)
+            .order_by(sql_models.Rollup.resolution).all())
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expirer_keeps_rollups_matching(self, mock_utcnow):
+        # the hourly buckets of 11:00 and 12:00 straddle the expiry times
+        for size in (0, 2):
+            self.CONF.set_override('sql_expire_batch_size', size,
+                                   group='database')
+            for expiry in (datetime.datetime(2015, 7, 2, 11, 0, 15),
+                           datetime.datetime(2015, 7, 2, 12, 30)):
+                mock_utcnow.return_value = expiry
+                self.conn.clear_expired_metering_data(0)
+                f = storage.SampleFilter(
+                    meter='instance',
+                    start_timestamp=datetime.datetime(2015, 7, 2, 11))
+                self._assert_rollup_statistics(3600, f)
+                self._assert_rollup_statistics(3600, f, period=3600)
+
+
+@tests_db.run_with('sqlite', 'mysql', 'postgresql')
+class ExpirerInBatchesTest(scenarios.DBTestBase):
+
+    def setUp(self):
+        super(ExpirerInBatchesTest, self).setUp()
+        self.CONF.set_override('sql_expire_batch_size', 2, group='database')
+        self.CONF.set_override('sql_expire_batch_interval', 0.5,
+                               group='database')
+        self.mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 10, 45)
+
+    def _assert_expired_data_cleared(self):
+        f = storage.SampleFilter(meter='instance')
+        self.assertEqual(5, len(list(self.conn.get_samples(f))))
+        self.assertEqual(5, len(list(self.conn.get_resources())))
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(
+            0, session.query(sql_models.MetaText)
+            .filter(~sql_models.MetaText.resource.has()).count())
+        self.assertEqual(
+            0, session.query(sql_models.Resource)
+            .filter(~sql_models.Resource.samples.any()).count())
+        self.assertEqual(
+            0, session.query(sql_models.Meter)
+            .filter(~sql_models.Meter.samples.any()).count())
+
+    @mock.patch.object(impl_sqlalchemy, 'time')
+    def test_clear_expired_metering_data(self, mock_time):
+        mock_sleep = mock_time.sleep
+        self.conn.clear_expired_metering_data(3 * 60)
+        self._assert_expired_data_cleared()
+        self.assertTrue(mock_sleep.called)
+        self.assertEqual([mock.call(0.5)] * mock_sleep.call_count,
+                         mock_sleep.call_args_list)
+
+    @mock.patch.object(impl_sqlalchemy, 'time')
+    def test_resume_after_interruption(self, mock_time):
+        mock_sleep = mock_time.sleep
+        session = self.conn._engine_facade.get_session()
+        samples = session.query(sql_models.Sample).count()
+        mock_sleep.side_effect = MyException('Interrupted')
+        self.assertRaises(MyException,
+                          self.conn.clear_expired_metering_data, 3 * 60)
+        # the first batch has been committed
+        self.assertEqual(samples - 2,
+                         session.query(sql_models.Sample).count())
+        mock_sleep.side_effect = None
+        self.conn.clear_expired_metering_data(3 * 60)
+        self._assert_expired_data_cleared()
+
+    def test_id_ranges(self):
+        self.assertEqual([], impl_sqlalchemy._id_ranges([]))
+        self.assertEqual([[1, 3], [5, 5], [7, 8]],
+                         impl_sqlalchemy._id_ranges([8, 1, 2, 3, 5, 7]))
+
+
+@tests_db.run_with('mysql', 'postgresql')
+class PartitionTest(scenarios.DBTestBase):
+
+    def prepare_data(self):
+        self.CONF.set_override('sql_sample_partition', 'day',
+                               group='database')
+        self.conn = impl_sqlalchemy.Connection(self.db_manager.url)
+        self.conn.upgrade()
+        super(PartitionTest, self).prepare_data()
+
+    def test_id_cache_without_foreign_keys(self):
+        self.assertEqual(self.conn._partition_manager.foreign_keys,
+                         self.conn._meter_cache.size > 0)
+        self.assertEqual(self.conn._partition_manager.foreign_keys,
+                         self.conn._resource_cache.size > 0)
+
+    def _partitions(self):
+        manager = self.conn._partition_manager
+        engine = self.conn._engine_facade.get_engine()
+        with engine.begin() as conn:
+            return [manager.name(start) for start in manager.partitions(conn)]
+
+    def test_record_samples_in_partitions(self):
+        partitions = self._partitions()
+        self.assertIn('p20120702', partitions)
+        self.assertIn('p20121201', partitions)
+        self.assertIn('p20130531', partitions)
+        f = storage.SampleFilter(meter='instance')
+        self.assertEqual(len(self.msgs), len(list(self.conn.get_samples(f))))
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 41),
+            end_timestamp=datetime.datetime(2012, 7, 2, 10, 43))
+        self.assertEqual(3, len(list(self.conn.get_samples(f))))
+
+    def test_clear_expired_metering_data_drops_partitions(self):
+        self.mock_utcnow.return_value = datetime.datetime(2013, 6, 1)
+        self.conn.clear_expired_metering_data(182 * 86400)
+        self.assertEqual(['p20121201', 'p20130531'], self._partitions())
+        f = storage.SampleFilter(meter='instance')
+        self.assertEqual(
+            [datetime.datetime(2013, 5, 31, 23, 7),
+             datetime.datetime(2012, 12, 1, 1, 25)],
+            [s.timestamp for s in self.conn.get_samples(f)])
+        self.assertEqual(2, len(list(self.conn.get_resources())))
+
+
+@tests_db.run_with('sqlite')
+class IdCacheTest(scenarios.DBTestBase):
+
+    def prepare_data(self):
+        self.msgs = []
+        self.msgs.append(self.create_and_store_sample(
+            timestamp=datetime.datetime(2012, 7, 2, 10, 40)))
+
+    def test_ids_cached(self):
+        self.assertEqual(1, len(self.conn._meter_cache))
+        self.assertEqual(1, len(self.conn._resource_cache))
+        with mock.patch.object(self.conn, '_create_meter') as create_meter:
+            with mock.patch.object(self.conn,
+                                   '_create_resource') as create_resource:
+                self.create_and_store_sample(
+                    timestamp=datetime.datetime(2012, 7, 2, 10, 41))
+        self.assertFalse(create_meter.called)
+        self.assertFalse(create_resource.called)
+        f = storage.SampleFilter(meter='instance')
+        self.assertEqual(2, len(list(self.conn.get_samples(f))))
+
+    def test_new_metadata_not_cached(self):
+        self.create_and_store_sample(
+            timestamp=datetime.datetime(2012, 7, 2, 10, 41),
+            metadata={'display_name': 'renamed-server'})
+        self.assertEqual(1, len(self.conn._meter_cache))
+        self.assertEqual(2, len(self.conn._resource_cache))
+
+    def test_cache_not_filled_on_failure(self):
+        self.conn._clear_id_caches()
+        with mock.patch.object(sql_models.Sample.__table__, 'insert',
+                               side_effect=MyException('Boom')):
+            self.assertRaises(MyException, self.create_and_store_sample,
+                              name='other')
+        self.assertEqual(0, len(self.conn._meter_cache))
+        self.assertEqual(0, len(self.conn._resource_cache))
+
+    def test_cache_disabled_without_foreign_keys(self):
+        with mock.patch.object(partition, 'get_manager',
+                               return_value=partition.MySQLPartitionManager(
+                                   'day')):
+            conn = impl_sqlalchemy.Connection(self.db_manager.url)
+        self.assertEqual(0, conn._meter_cache.size)
+        self.assertEqual(0, conn._resource_cache.size)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expirer_invalidates_cache(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 10, 45)
+        self.conn.clear_expired_metering_data(60)
+        self.assertEqual(0, len(self.conn._meter_cache))
+        self.assertEqual(0, len(self.conn._resource_cache))
+        self.create_and_store_sample(
+            timestamp=datetime.datetime(2012, 7, 2, 10, 44, 30))
+        f = storage.SampleFilter(meter='instance')
+        self.assertEqual(1, len(list(self.conn.get_samples(f))))
+        self.assertEqual(1, len(list(self.conn.get_resources())))
+
+
+@tests_db.run_with('sqlite', 'mysql', 'postgresql')
+class PeriodStatisticsTest(scenarios.DBTestBase):
+    # Statistics by period computed with a GROUP BY on a dialect specific
+    # expression must be the same as with the portable query per period.
+
+    Aggregate = collections.namedtuple('Aggregate', ['func', 'param'])
+
+    def prepare_data(self):
+        timestamps = [datetime.datetime(2012, 7, 2, 10, 40),
+                      datetime.datetime(2012, 7, 2, 10, 40, 59, 999999),
+                      datetime.datetime(2012, 7, 2, 10, 41),
+                      datetime.datetime(2012, 7, 2, 10, 41, 0, 500000),
+                      datetime.datetime(2012, 7, 2, 10, 44, 30),
+                      datetime.datetime(2012, 7, 2, 11, 40),
+                      datetime.datetime(2012, 7, 3, 10, 40, 7)]
+        for i, ts in enumerate(timestamps):
+            self.create_and_store_sample(timestamp=ts, volume=i,
+                                         user_id='user-%d' % (i % 2),
+                                         resource_id='resource-%d' % (i % 3))
+
+    def _assert_same_statistics(self, f, period, groupby=None,
+                                aggregate=None):
+        def key(stat):
+            return stat.period_start, sorted((stat.groupby or {}).items())
+
+        native = sorted(self.conn.get_meter_statistics(
+            f, period, groupby, aggregate), key=key)
+        with mock.patch.dict(impl_sqlalchemy.PERIOD_BUCKETS, clear=True):
+            portable = sorted(self.conn.get_meter_statistics(
+                f, period, groupby, aggregate), key=key)
+        self.assertEqual([s.as_dict() for s in portable],
+                         [s.as_dict() for s in native])
+        return native
+
+    def test_no_bounds(self):
+        for period in [1, 7, 60, 300, 3600, 86400]:
+            self._assert_same_statistics(
+                storage.SampleFilter(meter='instance'), period)
+
+    def test_bounds(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 39, 30, 250000),
+            end_timestamp=datetime.datetime(2012, 7, 2, 12))
+        for period in [1, 7, 60, 300]:
+            self.assertTrue(self._assert_same_statistics(f, period))
+
+    def test_bounds_operators(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 40),
+            start_timestamp_op='gt',
+            end_timestamp=datetime.datetime(2012, 7, 2, 10, 44, 30),
+            end_timestamp_op='le')
+        self.assertTrue(self._assert_same_statistics(f, 60))
+
+    def test_start_only(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 40, 30))
+        self.assertTrue(self._assert_same_statistics(f, 60))
+
+    def test_groupby(self):
+        f = storage.SampleFilter(meter='instance')
+        self.assertTrue(self._assert_same_statistics(
+            f, 60, groupby=['user_id', 'resource_id']))
+
+    def test_aggregate(self):
+        f = storage.SampleFilter(meter='instance')
+        aggregate = [self.Aggregate('count', None),
+                     self.Aggregate('max', None),
+                     self.Aggregate('cardinality', 'resource_id')]
+        self.assertTrue(self._assert_same_statistics(f, 60,
+                                                     aggregate=aggregate))
+
+    def test_no_samples(self):
+        f = storage.SampleFilter(meter='instance',
+                                 user='unknown-user')
+        self.assertEqual([], self._assert_same_statistics(f, 60))
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
@@ -19,8 +19,10 @@
 """ Base classes for DB backend implementation test
 """
 
+import copy
 import datetime
 import operator
+import uuid
 
 import mock
 from oslo.config import cfg
@@ -3622,3 +3624,67 @@ class TestRecordUnicodeSamples(DBTestBase,
         self.assertEqual(expected['counter_name'], actual['counter_name'])
         self.assertEqual(expected['resource_metadata'],
                          actual['resource_metadata'])
+
+
+class TestRecordSampleBatch(DBTestBase,
+                            tests_db.MixinTestsWithBackendScenarios):
+    def prepare_data(self):
+        self.msgs = []
+        for i in range(3):
+            s = sample.Sample(
+                'instance', sample.TYPE_GAUGE, unit='instance', volume=i,
+                user_id='user-id', project_id='project-id',
+                resource_id='resource-id-%d' % (i % 2),
+                timestamp=datetime.datetime(2012, 7, 2, 10, 40 + i),
+                resource_metadata={'display_name': 'test-server',
+                                   'tag': 'counter-%d' % i},
+                source='test-batch')
+            msg = utils.meter_message_from_counter(
+                s, self.CONF.publisher.metering_secret)
+            # NOTE: the database dispatcher gives an id to every sample.
+            msg['_id'] = uuid.uuid4().hex
+            self.msgs.append(msg)
+        self.recorded = copy.deepcopy(self.msgs)
+        self.conn.record_metering_data_batch(self.msgs)
+
+    def test_batch_not_modified(self):
+        self.assertEqual(self.recorded, self.msgs)
+
+    def test_batch_samples(self):
+        f = storage.SampleFilter(meter='instance')
+        results = sorted(self.conn.get_samples(f),
+                         key=operator.attrgetter('timestamp'))
+        self.assertEqual(3, len(results))
+        for expected, actual in zip(self.msgs, results):
+            self.assertEqual(expected['message_id'], actual.message_id)
+            self.assertEqual(expected['counter_volume'],
+                             actual.counter_volume)
+            self.assertEqual(expected['resource_metadata'],
+                             actual.resource_metadata)
+
+    def test_batch_resources(self):
+        resources = dict((r.resource_id, r)
+                         for r in self.conn.get_resources())
+        self.assertEqual(set(['resource-id-0', 'resource-id-1']),
+                         set(resources))
+        r0 = resources['resource-id-0']
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 40),
+                         r0.first_sample_timestamp)
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 42),
+                         r0.last_sample_timestamp)
+        self.assertEqual('counter-2', r0.metadata['tag'])
+
+    def test_empty_batch(self):
+        self.conn.record_metering_data_batch([])
+        f = storage.SampleFilter(meter='instance')
+        self.assertEqual(3, len(list(self.conn.get_samples(f))))
+
+    @tests_db.run_with('mongodb', 'db2')
+    def test_batch_recorded_again_one_by_one(self):
+        # a bulk insert failing partway is retried sample by sample
+        self.assertRaises(Exception, self.conn.record_metering_data_batch,
+                          self.msgs)
+        for msg in self.msgs:
+            self.conn.record_metering_data(msg)
+        f = storage.SampleFilter(meter='instance')
+        self.assertEqual(3, len(list(self.conn.get_samples(f))))
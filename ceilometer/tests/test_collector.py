@@ -16,6 +16,7 @@
 # under the License.
 import contextlib
 import socket
+import threading
 
 import mock
 import msgpack
@@ -23,6 +24,7 @@ from oslo.config import fixture as fixture_config
 import oslo.messaging
 from oslo.utils import timeutils
 from oslo_context import context
+from oslotest import base
 from oslotest import mockpatch
 from stevedore import extension
 
@@ -43,6 +45,50 @@ class FakeConnection():
         pass
 
 
+def _run_concurrently(func, *args_list):
+    results = [None] * len(args_list)
+
+    def run(i, args):
+        try:
+            results[i] = func(*args)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, args))
+               for i, args in enumerate(args_list)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class TestSampleBatcher(base.BaseTestCase):
+
+    def test_dispatch_full_batch(self):
+        dispatch = mock.Mock()
+        batcher = collector.SampleBatcher(dispatch, 3, 60)
+        _run_concurrently(batcher.add, ([1],), ([2],), ([3, 4],))
+        self.assertEqual(1, dispatch.call_count)
+        self.assertEqual([1, 2, 3, 4], sorted(dispatch.call_args[0][0]))
+
+    def test_dispatch_on_timeout(self):
+        dispatch = mock.Mock()
+        batcher = collector.SampleBatcher(dispatch, 100, 0.01)
+        batcher.add([1])
+        dispatch.assert_called_once_with([1])
+        batcher.add([2])
+        dispatch.assert_called_with([2])
+
+    def test_dispatch_error_raised_to_every_caller(self):
+        error = FakeException('boom')
+        dispatch = mock.Mock(side_effect=error)
+        batcher = collector.SampleBatcher(dispatch, 2, 60)
+        self.assertEqual([error, error],
+                         _run_concurrently(batcher.add, ([1],), ([2],)))
+        self.assertEqual(1, dispatch.call_count)
+
+
 class TestCollector(tests_base.BaseTestCase):
     def setUp(self):
         super(TestCollector, self).setUp()
@@ -87,8 +133,8 @@ class TestCollector(tests_base.BaseTestCase):
             side_effect=self._dummy_thread_group_add_thread))
 
     @staticmethod
-    def _dummy_thread_group_add_thread(method):
-        method()
+    def _dummy_thread_group_add_thread(method, *args):
+        method(*args)
 
     def _setup_messaging(self, enabled=True):
         if enabled:
@@ -108,11 +154,14 @@ class TestCollector(tests_base.BaseTestCase):
             return_value=fake_dispatcher))
         return plugin
 
-    def _make_fake_socket(self, sample):
+    def _make_fake_socket(self, *samples):
+        samples = list(samples)
+
         def recvfrom(size):
-            # Make the loop stop
-            self.srv.stop()
-            return msgpack.dumps(sample), ('127.0.0.1', 12345)
+            if len(samples) == 1:
+                # Make the loop stop
+                self.srv.stop()
+            return msgpack.dumps(samples.pop(0)), ('127.0.0.1', 12345)
 
         sock = mock.Mock()
         sock.recvfrom = recvfrom
@@ -120,11 +169,23 @@ class TestCollector(tests_base.BaseTestCase):
 
     def _verify_udp_socket(self, udp_socket):
         conf = self.CONF.collector
-        udp_socket.setsockopt.assert_called_once_with(socket.SOL_SOCKET,
-                                                      socket.SO_REUSEADDR, 1)
+        udp_socket.setsockopt.assert_any_call(socket.SOL_SOCKET,
+                                              socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            udp_socket.setsockopt.assert_any_call(socket.SOL_SOCKET,
+                                                  socket.SO_REUSEPORT, 1)
         udp_socket.bind.assert_called_once_with((conf.udp_address,
                                                  conf.udp_port))
 
+    def _make_udp_counter(self, **kwargs):
+        counter = dict(self.counter, **kwargs)
+        counter['source'] = 'mysource'
+        counter['counter_name'] = counter['name']
+        counter['counter_volume'] = counter['volume']
+        counter['counter_type'] = counter['type']
+        counter['counter_unit'] = counter['unit']
+        return counter
+
     def test_record_metering_data(self):
         mock_dispatcher = self._setup_fake_dispatcher()
         self.srv.dispatcher_manager = dispatcher.load_dispatcher_manager()
@@ -149,7 +210,7 @@ class TestCollector(tests_base.BaseTestCase):
         self._verify_udp_socket(udp_socket)
 
         mock_dispatcher.record_metering_data.assert_called_once_with(
-            self.counter)
+            [self.counter])
 
     def test_udp_receive_storage_error(self):
         self._setup_messaging(False)
@@ -169,7 +230,7 @@ class TestCollector(tests_base.BaseTestCase):
         self._verify_udp_socket(udp_socket)
 
         mock_dispatcher.record_metering_data.assert_called_once_with(
-            self.counter)
+            [self.counter])
 
     @staticmethod
     def _raise_error():
@@ -184,6 +245,52 @@ class TestCollector(tests_base.BaseTestCase):
             self.srv.start()
 
         self._verify_udp_socket(udp_socket)
+        self.assertEqual(1, self.srv.udp_stats['received'])
+        self.assertEqual(0, self.srv.udp_stats['decoded'])
+
+    def test_udp_receive_batches(self):
+        self.CONF.set_override('udp_batch_size', 2, group='collector')
+        self._setup_messaging(False)
+        mock_dispatcher = self._setup_fake_dispatcher()
+        counters = [self._make_udp_counter(resource_id='cat-%d' % i)
+                    for i in range(3)]
+
+        udp_socket = self._make_fake_socket(*counters)
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        self.assertEqual([mock.call(counters[:2]), mock.call(counters[2:])],
+                         mock_dispatcher.record_metering_data.call_args_list)
+        self.assertEqual({'received': 3, 'decoded': 3, 'dispatched': 3},
+                         self.srv.udp_stats)
+
+    def test_udp_receive_queue_full(self):
+        self.CONF.set_override('udp_queue_size', 1, group='collector')
+        self._setup_messaging(False)
+        mock_dispatcher = self._setup_fake_dispatcher()
+        counters = [self._make_udp_counter(resource_id='cat-%d' % i)
+                    for i in range(3)]
+
+        udp_socket = self._make_fake_socket(*counters)
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            counters[:1])
+        self.assertEqual({'received': 3, 'dropped': 2, 'decoded': 1,
+                          'dispatched': 1}, self.srv.udp_stats)
+
+    @mock.patch.object(collector, 'LOG')
+    def test_udp_stats_logged(self, mylog):
+        self._setup_messaging(False)
+        self._setup_fake_dispatcher()
+        udp_socket = self._make_fake_socket(self._make_udp_counter())
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+        self.srv._log_udp_stats()
+        mylog.info.assert_called_once_with(
+            mock.ANY, {'received': 1, 'dropped': 0, 'decoded': 1,
+                       'dispatched': 1})
 
     @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
     @mock.patch.object(collector.CollectorService, 'start_udp')
@@ -214,7 +321,7 @@ class TestCollector(tests_base.BaseTestCase):
                         return_value=self._make_fake_socket(self.utf8_msg)):
             self.srv.start()
             self.assertTrue(utils.verify_signature(
-                mock_dispatcher.method_calls[0][1][0],
+                mock_dispatcher.method_calls[0][1][0][0],
                 "not-so-secret"))
 
     @mock.patch('ceilometer.storage.impl_log.LOG')
@@ -244,6 +351,17 @@ class TestCollector(tests_base.BaseTestCase):
             self.assertEqual(oslo.messaging.NotificationResult.REQUEUE,
                              ret)
 
+    @mock.patch.object(collector, 'LOG')
+    @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
+    @mock.patch.object(collector.CollectorService, 'start_udp')
+    def test_collector_requeue_with_dispatcher_queue(self, udp_start,
+                                                     rpc_start, mylog):
+        self.CONF.set_override('requeue_sample_on_dispatcher_error', True,
+                               group='collector')
+        self.CONF.set_override('queue_size', 10, group='dispatcher_queue')
+        self.srv.start()
+        self.assertEqual(1, mylog.warn.call_count)
+
     @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
     @mock.patch.object(collector.CollectorService, 'start_udp')
     def test_collector_no_requeue(self, udp_start, rpc_start):
@@ -254,3 +372,60 @@ class TestCollector(tests_base.BaseTestCase):
                                side_effect=FakeException('boom')):
             self.assertRaises(FakeException, self.srv.sample, {}, 'pub_id',
                               'event', {}, {})
+
+    @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
+    @mock.patch.object(collector.CollectorService, 'start_udp')
+    def test_collector_batch(self, udp_start, rpc_start):
+        self.CONF.set_override('batch_size', 3, group='collector')
+        self.CONF.set_override('batch_timeout', 60, group='collector')
+        self.srv.start()
+        with mock.patch.object(self.srv.dispatcher_manager,
+                               'map_method') as map_method:
+            _run_concurrently(
+                lambda endpoint, *args: endpoint(*args),
+                (self.srv.sample, {}, 'pub_id', 'event', {'id': 1}, {}),
+                (self.srv.sample, {}, 'pub_id', 'event', [{'id': 2}], {}),
+                (self.srv.record_metering_data, None, {'id': 3}))
+        self.assertEqual(1, map_method.call_count)
+        self.assertEqual([1, 2, 3],
+                         sorted(s['id'] for s in
+                                map_method.call_args[1]['data']))
+
+    @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
+    @mock.patch.object(collector.CollectorService, 'start_udp')
+    def test_collector_trusted_transport(self, udp_start, rpc_start):
+        self.CONF.set_override('transport_url', 'fake://')
+        self.CONF.set_override('trusted_transports', ['fake'],
+                               group='collector')
+        self.srv.start()
+        with mock.patch.object(self.srv.dispatcher_manager,
+                               'map_method') as map_method:
+            self.srv.record_metering_data(None, {'id': 1})
+        data = map_method.call_args[1]['data']
+        self.assertIsInstance(data, utils.TrustedMessages)
+        self.assertEqual([{'id': 1}], data)
+
+    @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
+    @mock.patch.object(collector.CollectorService, 'start_udp')
+    def test_collector_untrusted_transport(self, udp_start, rpc_start):
+        self.CONF.set_override('transport_url', 'fake://')
+        self.srv.start()
+        with mock.patch.object(self.srv.dispatcher_manager,
+                               'map_method') as map_method:
+            self.srv.record_metering_data(None, {'id': 1})
+        self.assertNotIsInstance(map_method.call_args[1]['data'],
+                                 utils.TrustedMessages)
+
+    @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
+    @mock.patch.object(collector.CollectorService, 'start_udp')
+    def test_collector_batch_requeue(self, udp_start, rpc_start):
+        self.CONF.set_override('batch_size', 10, group='collector')
+        self.CONF.set_override('batch_timeout', 0.01, group='collector')
+        self.CONF.set_override('requeue_sample_on_dispatcher_error', True,
+                               group='collector')
+        self.srv.start()
+        with mock.patch.object(self.srv.dispatcher_manager, 'map_method',
+                               side_effect=Exception('boom')):
+            ret = self.srv.sample({}, 'pub_id', 'event', {}, {})
+            self.assertEqual(oslo.messaging.NotificationResult.REQUEUE,
+                             ret)
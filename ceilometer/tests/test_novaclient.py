@@ -238,6 +238,38 @@ class TestNovaClient(base.BaseTestCase):
             self.assertIsNone(instance.kernel_id)
             self.assertIsNone(instance.ramdisk_id)
 
+    def test_with_flavor_and_image_cache_across_requests(self):
+        self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(2, self._flavors_count)
+        self.assertEqual(2, self._images_count)
+
+    def test_with_flavor_and_image_cache_expiry(self):
+        self.CONF.set_override('nova_metadata_cache_ttl', 60)
+        with mock.patch('time.time', return_value=0):
+            self.nv._with_flavor_and_image(self.fake_servers_list())
+        with mock.patch('time.time', return_value=60):
+            self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(4, self._flavors_count)
+        self.assertEqual(4, self._images_count)
+
+    def test_with_flavor_and_image_cache_per_request(self):
+        self.CONF.set_override('nova_metadata_cache_ttl', 0)
+        self.nv._with_flavor_and_image(self.fake_servers_list() * 2)
+        self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(4, self._flavors_count)
+        self.assertEqual(4, self._images_count)
+
+    def test_instance_get_all_by_host_changes_since(self):
+        with mock.patch.object(self.nv.nova_client.servers, 'list',
+                               side_effect=self.fake_servers_list) as list:
+            self.nv.instance_get_all_by_host('foobar',
+                                             '2015-07-02T10:00:00Z')
+        list.assert_called_once_with(
+            detailed=True,
+            search_opts={'host': 'foobar', 'all_tenants': True,
+                         'changes-since': '2015-07-02T10:00:00Z'})
+
     def test_with_missing_image_instance(self):
         instances = self.fake_instance_image_missing()
         results = self.nv._with_flavor_and_image(instances)
@@ -12,7 +12,11 @@
 
 """Tests for ceilometer/sample.py"""
 
+import copy
 import datetime
+import pickle
+
+import mock
 
 from ceilometer import sample
 from ceilometer.tests import base
@@ -36,3 +40,61 @@ class TestSample(base.BaseTestCase):
                     'resource_id: 1ca738a1-c49c-4401-8346-5c60ebdb03f4, '
                     'timestamp: 2014-10-29 14:12:15.485877>')
         self.assertEqual(expected, str(self.SAMPLE))
+
+    def _sample(self, metadata=None):
+        return sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE,
+                             unit='ns', volume=1, user_id='user',
+                             project_id='project', resource_id='resource',
+                             timestamp='2015-07-02T10:39:00',
+                             resource_metadata=metadata or {},
+                             source='openstack')
+
+    def test_no_dict(self):
+        self.assertFalse(hasattr(self._sample(), '__dict__'))
+
+    @mock.patch('uuid.uuid1', return_value='fake-uuid')
+    def test_lazy_id(self, uuid1):
+        s = self._sample()
+        self.assertFalse(uuid1.called)
+        self.assertEqual('fake-uuid', s.id)
+        self.assertEqual('fake-uuid', s.id)
+        self.assertEqual(1, uuid1.call_count)
+        s.id = 'other-id'
+        self.assertEqual('other-id', s.id)
+
+    def test_as_dict(self):
+        s = self._sample({'a': 'A'})
+        self.assertEqual({'name': 'cpu',
+                          'type': sample.TYPE_CUMULATIVE,
+                          'unit': 'ns',
+                          'volume': 1,
+                          'user_id': 'user',
+                          'project_id': 'project',
+                          'resource_id': 'resource',
+                          'timestamp': '2015-07-02T10:39:00',
+                          'resource_metadata': {'a': 'A'},
+                          'source': 'openstack',
+                          'id': s.id}, s.as_dict())
+
+    def test_copies_share_id(self):
+        s = self._sample()
+        for c in (copy.copy(s), copy.deepcopy(s),
+                  pickle.loads(pickle.dumps(s)),
+                  pickle.loads(pickle.dumps(s, 2))):
+            self.assertEqual(s.as_dict(), c.as_dict())
+
+    def test_from_notification_shares_metadata(self):
+        message = {'payload': {'a': 'A'},
+                   'event_type': 'compute.instance.exists',
+                   'publisher_id': 'compute.host',
+                   'timestamp': '2015-07-02T10:39:00'}
+        samples = [sample.Sample.from_notification(
+            name, sample.TYPE_GAUGE, 1, 'instance', 'user', 'project',
+            'resource', message) for name in ('instance', 'vcpus')]
+        self.assertEqual({'a': 'A',
+                          'event_type': 'compute.instance.exists',
+                          'host': 'compute.host'},
+                         samples[0].resource_metadata)
+        self.assertIs(samples[0].resource_metadata,
+                      samples[1].resource_metadata)
+        self.assertEqual({'a': 'A'}, message['payload'])
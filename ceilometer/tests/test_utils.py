@@ -181,3 +181,25 @@ class TestUtils(base.BaseTestCase):
             assignments[k] -= n
         reassigned = len([c for c in assignments if c != 0])
         self.assertTrue(reassigned < num_keys / num_nodes)
+
+    def test_lru_cache(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.get('a'))
+        cache['c'] = 3
+        # 'b' is the least recently used entry
+        self.assertNotIn('b', cache)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(2, len(cache))
+        self.assertEqual(3, cache.hits)
+        self.assertEqual(1, cache.misses)
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+    def test_lru_cache_disabled(self):
+        cache = utils.LRUCache(0)
+        cache['a'] = 1
+        self.assertNotIn('a', cache)
@@ -0,0 +1,119 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/transformer/store.py
+"""
+import datetime
+
+import mock
+from oslo.config import fixture as fixture_config
+from oslotest import base
+
+from ceilometer import sample
+from ceilometer.transformer import conversions
+from ceilometer.transformer import store
+
+
+class TestMemoryStateStore(base.BaseTestCase):
+
+    START = datetime.datetime(2015, 7, 2, 10, 39)
+
+    def _at(self, seconds):
+        return self.START + datetime.timedelta(seconds=seconds)
+
+    def test_get_set(self):
+        s = store.MemoryStateStore('test')
+        s.set('a', 1, self._at(0))
+        s.set('b', 2, '2015-07-02T10:39:10')
+        self.assertEqual(1, s.get('a'))
+        self.assertIsNone(s.get('c'))
+        self.assertIn('b', s)
+        self.assertEqual([('a', 1), ('b', 2)], s.items())
+        self.assertEqual(2, s.pop('b'))
+        self.assertEqual(['a'], s.keys())
+        s.clear()
+        self.assertEqual(0, len(s))
+
+    def test_ttl_on_sample_timestamps(self):
+        s = store.MemoryStateStore('test', ttl=60)
+        s.set('a', 1, self._at(0))
+        s.set('b', 2, self._at(30))
+        s.set('c', 3, self._at(60))
+        self.assertEqual(['a', 'b', 'c'], s.keys())
+        s.set('b', 4, self._at(61))
+        self.assertEqual(['c', 'b'], s.keys())
+        s.set('d', 5, self._at(200))
+        self.assertEqual(['d'], s.keys())
+        self.assertEqual(3, s.stats()['expired'])
+
+    def test_max_entries_evicts_least_recently_seen(self):
+        s = store.MemoryStateStore('test', max_entries=2)
+        s.set('a', 1, self._at(0))
+        s.set('b', 2, self._at(1))
+        s.set('a', 3, self._at(2))
+        s.set('c', 4, self._at(3))
+        self.assertEqual([('a', 3), ('c', 4)], s.items())
+        self.assertEqual(1, s.stats()['evicted'])
+
+    def test_stats(self):
+        s = store.MemoryStateStore('test')
+        s.set('a', 1, None)
+        s.get('a')
+        s.get('b')
+        self.assertEqual({'name': 'test', 'size': 1, 'hits': 1,
+                          'misses': 1, 'expired': 0, 'evicted': 0},
+                         s.stats())
+
+    @mock.patch.object(store, 'LOG')
+    def test_stats_logged(self, mylog):
+        with mock.patch('time.time', return_value=0):
+            s = store.MemoryStateStore('test', stats_interval=60)
+            s.set('a', 1, None)
+        self.assertFalse(mylog.info.called)
+        with mock.patch('time.time', return_value=60):
+            s.set('b', 2, None)
+            s.set('c', 3, None)
+        self.assertEqual(1, mylog.info.call_count)
+        self.assertEqual(2, mylog.info.call_args[0][1]['size'])
+
+
+class TestGetStateStore(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestGetStateStore, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+
+    def test_options(self):
+        self.CONF.set_override('max_entries', 10, group='transformer_store')
+        self.CONF.set_override('ttl', 0, group='transformer_store')
+        s = store.get_state_store('test')
+        self.assertIsInstance(s, store.MemoryStateStore)
+        self.assertEqual(10, s.max_entries)
+        self.assertIsNone(s.ttl)
+        self.assertEqual(600, s.stats_interval)
+
+    def test_rate_of_change_forgets_stale_resources(self):
+        self.CONF.set_override('ttl', 600, group='transformer_store')
+        t = conversions.RateOfChangeTransformer()
+
+        def cpu(resource_id, volume, timestamp):
+            return sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE,
+                                 unit='ns', volume=volume, user_id='user',
+                                 project_id='project',
+                                 resource_id=resource_id,
+                                 timestamp=timestamp,
+                                 resource_metadata={})
+
+        t.handle_sample(None, cpu('gone', 1, '2015-07-02T10:00:00'))
+        t.handle_sample(None, cpu('vm', 1, '2015-07-02T10:00:00'))
+        t.handle_sample(None, cpu('vm', 2, '2015-07-02T10:20:00'))
+        self.assertEqual(['cpuvm'], t.cache.keys())
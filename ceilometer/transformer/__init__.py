@@ -16,11 +16,17 @@
 # under the License.
 
 import abc
+import ast
 import collections
 
 import six
 from stevedore import extension
 
+from ceilometer.i18n import _
+from ceilometer.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
 
 class TransformerExtensionManager(extension.ExtensionManager):
 
@@ -61,6 +67,29 @@ class TransformerBase(object):
         :param sample: A sample.
         """
 
+    def handle_samples(self, context, samples):
+        """Transform a list of samples.
+
+        Transformers may override it to transform the samples together,
+        the default implementation handling them one by one. A sample
+        which fails to be transformed is dropped, not affecting the others.
+
+        :param context: Passed from the data collector.
+        :param samples: A list of samples.
+        :return: The list of transformed samples, without the dropped ones.
+        """
+        transformed = []
+        for s in samples:
+            try:
+                s = self.handle_sample(context, s)
+            except Exception:
+                LOG.exception(_('Transformer %(trans)s failed to transform '
+                                '%(smp)s'), {'trans': self, 'smp': s})
+                continue
+            if s:
+                transformed.append(s)
+        return transformed
+
     def flush(self, context):
         """Flush samples cached previously.
 
@@ -91,3 +120,62 @@ class Namespace(object):
 
     def __nonzero__(self):
         return len(self.__dict__) > 0
+
+
+class Expression(object):
+    """An expression evaluated against the fields of a sample.
+
+    The expression is parsed once, only allowing constants, arithmetic,
+    comparisons, boolean and conditional expressions, and accesses to the
+    fields of the sample and to their public attributes and items, then
+    compiled. It is evaluated without builtins against a Namespace of the
+    fields it uses, giving the same results as evaluating the string
+    against a Namespace of the sample. An expression using no field is only
+    evaluated once.
+    """
+
+    ALLOWED_NODES = tuple(getattr(ast, name) for name in (
+        'Expression', 'BinOp', 'UnaryOp', 'BoolOp', 'Compare', 'IfExp',
+        'Name', 'Attribute', 'Subscript', 'Index', 'Call', 'keyword',
+        'Load', 'operator',
+        'unaryop', 'boolop', 'cmpop', 'Num', 'Str', 'NameConstant',
+        'Constant') if hasattr(ast, name))
+
+    def __init__(self, expr):
+        self.expr = expr
+        tree = ast.parse(expr.strip(), mode='eval')
+        self.names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, self.ALLOWED_NODES):
+                raise ValueError(_('%(node)s is not allowed in expression '
+                                   '%(expr)s') % {'node': type(node).__name__,
+                                                  'expr': expr})
+            name = getattr(node, 'id', None) or getattr(node, 'attr', None)
+            if name is not None and name.startswith('_'):
+                raise ValueError(_('%(name)s is not allowed in expression '
+                                   '%(expr)s') % {'name': name,
+                                                  'expr': expr})
+            if isinstance(node, ast.Name):
+                self.names.add(node.id)
+        self.code = compile(tree, '<expression>', 'eval')
+        self.constant = None
+        if not self.names:
+            try:
+                self.constant = self._eval({})
+            except Exception:
+                # NOTE: the error is raised for every sample, as it used to.
+                pass
+
+    def _eval(self, ns):
+        return eval(self.code, {'__builtins__': {}}, Namespace(ns))
+
+    def evaluate(self, s):
+        """Evaluate the expression against a sample."""
+        if self.constant is not None:
+            return self.constant
+        return self._eval(dict((name, getattr(s, name))
+                               for name in self.names
+                               if name in s.FIELDS))
+
+    def __str__(self):
+        return self.expr
@@ -15,7 +15,6 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import collections
 import keyword
 import math
 import re
@@ -26,6 +25,7 @@ from ceilometer.i18n import _
 from ceilometer.openstack.common import log
 from ceilometer import sample
 from ceilometer import transformer
+from ceilometer.transformer import store
 
 LOG = log.getLogger(__name__)
 
@@ -51,7 +51,7 @@ class ArithmeticTransformer(transformer.TransformerBase):
             self.reference_meter = self.required_meters[0]
             # convert to set for more efficient contains operation
             self.required_meters = set(self.required_meters)
-            self.cache = collections.defaultdict(dict)
+            self.cache = store.get_state_store('arithmetic')
             self.latest_timestamp = None
         else:
             LOG.warn(_('Arithmetic transformer must use at least one'
@@ -62,16 +62,20 @@ class ArithmeticTransformer(transformer.TransformerBase):
         escaped_name = self.escaped_names.get(_sample.name, '')
         if escaped_name not in self.required_meters:
             return
-        self.cache[_sample.resource_id][escaped_name] = _sample
+        meters = self.cache.get(_sample.resource_id)
+        if meters is None:
+            meters = {}
+        meters[escaped_name] = _sample
+        self.cache.set(_sample.resource_id, meters, _sample.timestamp)
 
-    def _check_requirements(self, resource_id):
+    def _check_requirements(self, meters):
         """Check if all the required meters are available in the cache."""
-        return len(self.cache[resource_id]) == len(self.required_meters)
+        return len(meters) == len(self.required_meters)
 
-    def _calculate(self, resource_id):
+    def _calculate(self, meters):
         """Evaluate the expression and return a new sample if successful."""
         ns_dict = dict((m, s.as_dict()) for m, s
-                       in six.iteritems(self.cache[resource_id]))
+                       in six.iteritems(meters))
         ns = transformer.Namespace(ns_dict)
         try:
             new_volume = eval(self.expr_escaped, {}, ns)
@@ -79,7 +83,7 @@ class ArithmeticTransformer(transformer.TransformerBase):
                 raise ArithmeticError(_('Expression evaluated to '
                                         'a NaN value!'))
 
-            reference_sample = self.cache[resource_id][self.reference_meter]
+            reference_sample = meters[self.reference_meter]
             return sample.Sample(
                 name=self.target.get('name', reference_sample.name),
                 unit=self.target.get('unit', reference_sample.unit),
@@ -99,12 +103,19 @@ class ArithmeticTransformer(transformer.TransformerBase):
         self._update_cache(_sample)
         self.latest_timestamp = _sample.timestamp
 
+    def handle_samples(self, context, samples):
+        for _sample in samples:
+            self._update_cache(_sample)
+        if samples:
+            self.latest_timestamp = samples[-1].timestamp
+        return []
+
     def flush(self, context):
         new_samples = []
         if not self.misconfigured:
-            for resource_id in self.cache:
-                if self._check_requirements(resource_id):
-                    new_samples.append(self._calculate(resource_id))
+            for resource_id, meters in self.cache.items():
+                if self._check_requirements(meters):
+                    new_samples.append(self._calculate(meters))
                 else:
                     LOG.warn(_('Unable to perform calculation, not all of '
                                '{%s} are present'),
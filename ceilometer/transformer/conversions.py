@@ -16,6 +16,7 @@
 # under the License.
 
 import collections
+import itertools
 import re
 
 from oslo.utils import timeutils
@@ -25,6 +26,7 @@ from ceilometer.i18n import _
 from ceilometer.openstack.common import log
 from ceilometer import sample
 from ceilometer import transformer
+from ceilometer.transformer import store
 
 LOG = log.getLogger(__name__)
 
@@ -44,22 +46,29 @@ class ScalingTransformer(transformer.TransformerBase):
         target = target or {}
         self.source = source
         self.target = target
-        self.scale = target.get('scale')
+        self.scale = self._compile_scale(target.get('scale'))
         LOG.debug(_('scaling conversion transformer with source:'
                     ' %(source)s target: %(target)s:')
                   % {'source': source,
                      'target': target})
         super(ScalingTransformer, self).__init__(**kwargs)
 
+    @staticmethod
+    def _compile_scale(scale):
+        """Compile a scaling expression once for all the samples."""
+        if scale and isinstance(scale, six.string_types):
+            return transformer.Expression(scale)
+        return scale
+
     def _scale(self, s):
         """Apply the scaling factor.
 
-        Either a straight multiplicative factor or else a string to be eval'd.
+        Either a straight multiplicative factor or else an expression to be
+        evaluated.
         """
-        ns = transformer.Namespace(s.as_dict())
-
         scale = self.scale
-        return ((eval(scale, {}, ns) if isinstance(scale, six.string_types)
+        return ((scale.evaluate(s)
+                 if isinstance(scale, transformer.Expression)
                  else s.volume * scale) if scale else s.volume)
 
     def _map(self, s, attr):
@@ -75,6 +84,61 @@ class ScalingTransformer(transformer.TransformerBase):
                     pass
         return mapped or self.target.get(attr, getattr(s, attr))
 
+    def _scale_volumes(self, samples):
+        """Apply the scaling factor to the volumes of a list of samples.
+
+        The volume of a sample whose scaling fails is None.
+        """
+        scale = self.scale
+        if not scale:
+            return [s.volume for s in samples]
+        if not isinstance(scale, transformer.Expression):
+            return [s.volume * scale for s in samples]
+        if scale.constant is not None:
+            return [scale.constant] * len(samples)
+        volumes = []
+        for s in samples:
+            try:
+                volumes.append(self._scale(s))
+            except Exception:
+                LOG.exception(_('Unable to scale %s'), s)
+                volumes.append(None)
+        return volumes
+
+    def _convert_samples(self, samples, growths=None):
+        """Transform the appropriate fields of a list of samples.
+
+        The sample converted from a sample whose scaling fails is None.
+        """
+        names = {}
+        units = {}
+        type_ = self.target.get('type')
+        growths = growths or itertools.repeat(1)
+        converted = []
+        for s, volume, growth in six.moves.zip(
+                samples, self._scale_volumes(samples), growths):
+            if volume is None:
+                converted.append(None)
+                continue
+            # NOTE: the mapping only depends on the name or the unit, which
+            # are shared by most samples of a batch.
+            if s.name not in names:
+                names[s.name] = self._map(s, 'name')
+            if s.unit not in units:
+                units[s.unit] = self._map(s, 'unit')
+            converted.append(sample.Sample(
+                name=names[s.name],
+                unit=units[s.unit],
+                type=type_ or s.type,
+                volume=volume * growth,
+                user_id=s.user_id,
+                project_id=s.project_id,
+                resource_id=s.resource_id,
+                timestamp=s.timestamp,
+                resource_metadata=s.resource_metadata
+            ))
+        return converted
+
     def _convert(self, s, growth=1):
         """Transform the appropriate sample fields."""
         return sample.Sample(
@@ -97,6 +161,19 @@ class ScalingTransformer(transformer.TransformerBase):
             LOG.debug(_('converted to: %s'), (s,))
         return s
 
+    def handle_samples(self, context, samples):
+        """Handle a list of samples, converting them together."""
+        LOG.debug(_('handling %d samples'), len(samples))
+        unit = self.source.get('unit')
+        if unit is None:
+            converted = self._convert_samples(samples)
+        else:
+            converted = iter(self._convert_samples(
+                [s for s in samples if s.unit == unit]))
+            converted = [next(converted) if s.unit == unit else s
+                         for s in samples]
+        return [s for s in converted if s is not None]
+
 
 class RateOfChangeTransformer(ScalingTransformer):
     """Transformer based on the rate of change of a sample volume.
@@ -108,31 +185,17 @@ class RateOfChangeTransformer(ScalingTransformer):
     def __init__(self, **kwargs):
         """Initialize transformer with configured parameters."""
         super(RateOfChangeTransformer, self).__init__(**kwargs)
-        self.cache = {}
-        self.scale = self.scale or '1'
+        self.cache = store.get_state_store('rate_of_change')
+        self.scale = self.scale or self._compile_scale('1')
 
     def handle_sample(self, context, s):
         """Handle a sample, converting if necessary."""
         LOG.debug(_('handling sample %s'), (s,))
-        key = s.name + s.resource_id
-        prev = self.cache.get(key)
-        timestamp = timeutils.parse_isotime(s.timestamp)
-        self.cache[key] = (s.volume, timestamp)
-
-        if prev:
-            prev_volume = prev[0]
-            prev_timestamp = prev[1]
-            time_delta = timeutils.delta_seconds(prev_timestamp, timestamp)
-            # we only allow negative deltas for noncumulative samples, whereas
-            # for cumulative we assume that a reset has occurred in the interim
-            # so that the current volume gives a lower bound on growth
-            volume_delta = (s.volume - prev_volume
-                            if (prev_volume <= s.volume or
-                                s.type != sample.TYPE_CUMULATIVE)
-                            else s.volume)
-            rate_of_change = ((1.0 * volume_delta / time_delta)
-                              if time_delta else 0.0)
+        staged = {}
+        rate_of_change = self._rate_of_change(s, {}, staged)
+        self._commit(staged)
 
+        if rate_of_change is not None:
             s = self._convert(s, rate_of_change)
             LOG.debug(_('converted to: %s'), (s,))
         else:
@@ -141,6 +204,66 @@ class RateOfChangeTransformer(ScalingTransformer):
             s = None
         return s
 
+    def handle_samples(self, context, samples):
+        """Handle a list of samples, converting them together."""
+        LOG.debug(_('handling %d samples'), len(samples))
+        timestamps = {}
+        staged = collections.OrderedDict()
+        with_rates = []
+        rates = []
+        for s in samples:
+            try:
+                rate = self._rate_of_change(s, timestamps, staged)
+            except Exception:
+                LOG.exception(_('Unable to compute the rate of change of %s'),
+                              s)
+                continue
+            if rate is None:
+                LOG.warn(_('dropping sample with no predecessor: %s'),
+                         (s,))
+            else:
+                with_rates.append(s)
+                rates.append(rate)
+        converted = [s for s in self._convert_samples(with_rates, rates)
+                     if s is not None]
+        # NOTE: the volumes of the batch are only cached once it is
+        # converted, so that the samples the pipeline transforms one by one
+        # after a failure are not compared to themselves.
+        self._commit(staged)
+        return converted
+
+    def _rate_of_change(self, s, timestamps, staged):
+        """Return the rate of change of a sample, None if it is the first.
+
+        :param timestamps: the timestamps already parsed for the batch.
+        :param staged: the volumes of the batch not cached yet, updated with
+                       the one of the sample.
+        """
+        key = s.name + s.resource_id
+        prev = staged[key] if key in staged else self.cache.get(key)
+        timestamp = timestamps.get(s.timestamp)
+        if timestamp is None:
+            timestamp = timestamps[s.timestamp] = timeutils.parse_isotime(
+                s.timestamp)
+        staged[key] = (s.volume, timestamp)
+        if not prev:
+            return None
+        prev_volume, prev_timestamp = prev
+        time_delta = timeutils.delta_seconds(prev_timestamp, timestamp)
+        # we only allow negative deltas for noncumulative samples, whereas
+        # for cumulative we assume that a reset has occurred in the interim
+        # so that the current volume gives a lower bound on growth
+        volume_delta = (s.volume - prev_volume
+                        if (prev_volume <= s.volume or
+                            s.type != sample.TYPE_CUMULATIVE)
+                        else s.volume)
+        return (1.0 * volume_delta / time_delta) if time_delta else 0.0
+
+    def _commit(self, staged):
+        """Cache the staged volumes of the samples."""
+        for key, (volume, timestamp) in six.iteritems(staged):
+            self.cache.set(key, (volume, timestamp), timestamp)
+
 
 class AggregatorTransformer(ScalingTransformer):
     """Transformer that aggregates samples.
@@ -165,8 +288,8 @@ class AggregatorTransformer(ScalingTransformer):
                  project_id=None, user_id=None, resource_metadata="last",
                  **kwargs):
         super(AggregatorTransformer, self).__init__(**kwargs)
-        self.samples = {}
-        self.counts = collections.defaultdict(int)
+        # NOTE: the aggregated samples are stored along their count.
+        self.samples = store.get_state_store('aggregator')
         self.size = int(size) if size else None
         self.retention_time = float(retention_time) if retention_time else None
         self.initial_timestamp = None
@@ -202,27 +325,35 @@ class AggregatorTransformer(ScalingTransformer):
         # NOTE(sileht): it assumes, a meter always have the same unit/type
         return "%s-%s-%s" % (s.name, s.resource_id, non_aggregated_keys)
 
+    def handle_samples(self, context, samples):
+        # NOTE: the samples are aggregated one by one.
+        return transformer.TransformerBase.handle_samples(self, context,
+                                                          samples)
+
     def handle_sample(self, context, sample_):
         if not self.initial_timestamp:
             self.initial_timestamp = timeutils.parse_isotime(sample_.timestamp)
 
         self.aggregated_samples += 1
         key = self._get_unique_key(sample_)
-        self.counts[key] += 1
-        if key not in self.samples:
-            self.samples[key] = self._convert(sample_)
+        entry = self.samples.get(key)
+        if entry is None:
+            aggregated = self._convert(sample_)
+            count = 1
             if self.merged_attribute_policy[
                     'resource_metadata'] == 'drop':
-                self.samples[key].resource_metadata = {}
+                aggregated.resource_metadata = {}
         else:
+            aggregated, count = entry
+            count += 1
             if sample_.type == sample.TYPE_CUMULATIVE:
-                self.samples[key].volume = self._scale(sample_)
+                aggregated.volume = self._scale(sample_)
             else:
-                self.samples[key].volume += self._scale(sample_)
+                aggregated.volume += self._scale(sample_)
             for field in self.merged_attribute_policy:
                 if self.merged_attribute_policy[field] == 'last':
-                    setattr(self.samples[key], field,
-                            getattr(sample_, field))
+                    setattr(aggregated, field, getattr(sample_, field))
+        self.samples.set(key, (aggregated, count), sample_.timestamp)
 
     def flush(self, context):
         if not self.initial_timestamp:
@@ -233,14 +364,13 @@ class AggregatorTransformer(ScalingTransformer):
                                            self.retention_time))
         full = self.aggregated_samples >= self.size
         if full or expired:
-            x = self.samples.values()
-            # gauge aggregates need to be averages
-            for s in x:
+            x = []
+            for s, count in self.samples.values():
+                # gauge aggregates need to be averages
                 if s.type == sample.TYPE_GAUGE:
-                    key = self._get_unique_key(s)
-                    s.volume /= self.counts[key]
+                    s.volume /= count
+                x.append(s)
             self.samples.clear()
-            self.counts.clear()
             self.aggregated_samples = 0
             self.initial_timestamp = None
             return x
@@ -0,0 +1,209 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""State stores of the stateful transformers."""
+
+import abc
+import collections
+import datetime
+import time
+
+from oslo.config import cfg
+from oslo.utils import importutils
+from oslo.utils import timeutils
+import six
+
+from ceilometer.i18n import _
+from ceilometer.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.StrOpt('driver',
+               default='ceilometer.transformer.store.MemoryStateStore',
+               help='Class of the stores holding the state kept by the '
+                    'rate_of_change, aggregator and arithmetic transformers '
+                    'for every resource.'),
+    cfg.IntOpt('max_entries',
+               default=0,
+               help='Maximum number of resources whose state is kept by '
+                    'every transformer, the least recently seen ones being '
+                    'evicted first. 0 means no limit.'),
+    cfg.IntOpt('ttl',
+               default=0,
+               help='Number of seconds the state of a resource is kept by '
+                    'every transformer once no sample has been seen for it, '
+                    'measured on the timestamps of the samples. It must be '
+                    'longer than the gaps between the samples of a resource '
+                    'for the rate_of_change and aggregator transformers. 0 '
+                    'means the state is kept forever.'),
+    cfg.IntOpt('stats_interval',
+               default=600,
+               help='Number of seconds between two logs of the size and '
+                    'counters of every store. 0 disables them.'),
+]
+
+cfg.CONF.register_opts(OPTS, group='transformer_store')
+
+
+def get_state_store(name):
+    """Return a state store configured from the transformer_store options.
+
+    :param name: Name of the store, used in its logs.
+    """
+    conf = cfg.CONF.transformer_store
+    return importutils.import_class(conf.driver)(
+        name, max_entries=conf.max_entries, ttl=conf.ttl,
+        stats_interval=conf.stats_interval)
+
+
+@six.add_metaclass(abc.ABCMeta)
+class StateStore(object):
+    """Store of the state kept by a transformer for every key.
+
+    Every value is stored along the timestamp of the last sample seen for
+    its key, values whose timestamp is older than ttl seconds before the
+    latest one being evicted. The store holds at most max_entries values,
+    the least recently seen ones being evicted first. Its size and counters
+    are logged every stats_interval seconds.
+    """
+
+    def __init__(self, name, max_entries=0, ttl=0, stats_interval=0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = datetime.timedelta(seconds=ttl) if ttl > 0 else None
+        self.stats_interval = stats_interval
+        self.counters = collections.Counter()
+        self._last_stats = time.time()
+
+    @abc.abstractmethod
+    def get(self, key, default=None):
+        """Return the value stored for a key."""
+
+    @abc.abstractmethod
+    def set(self, key, value, timestamp):
+        """Store a value, evicting the expired and extra values.
+
+        :param timestamp: The timestamp of the last sample seen for the key,
+                          as a datetime or an ISO 8601 string, the current
+                          time if None.
+        """
+
+    @abc.abstractmethod
+    def pop(self, key, default=None):
+        """Remove a key and return its value."""
+
+    @abc.abstractmethod
+    def items(self):
+        """Return the list of the keys and their values."""
+
+    @abc.abstractmethod
+    def clear(self):
+        """Remove every value."""
+
+    @abc.abstractmethod
+    def __len__(self):
+        """Return the number of values stored."""
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def keys(self):
+        return [k for k, v in self.items()]
+
+    def values(self):
+        return [v for k, v in self.items()]
+
+    def stats(self):
+        """Return the size and the counters of the store."""
+        stats = dict((k, self.counters[k]) for k in
+                     ('hits', 'misses', 'expired', 'evicted'))
+        stats.update(name=self.name, size=len(self))
+        return stats
+
+    def _log_stats(self):
+        now = time.time()
+        if (self.stats_interval > 0 and
+                now - self._last_stats >= self.stats_interval):
+            self._last_stats = now
+            LOG.info(_('State store %(name)s: %(size)d values, %(hits)d '
+                       'hits, %(misses)d misses, %(expired)d expired and '
+                       '%(evicted)d evicted values'), self.stats())
+
+
+class MemoryStateStore(StateStore):
+    """Store the values in memory, ordered from the least recently seen."""
+
+    def __init__(self, name, max_entries=0, ttl=0, stats_interval=0):
+        super(MemoryStateStore, self).__init__(name, max_entries, ttl,
+                                               stats_interval)
+        self._values = collections.OrderedDict()
+        self._latest = None
+
+    def get(self, key, default=None):
+        entry = self._values.get(key)
+        if entry is None:
+            self.counters['misses'] += 1
+            return default
+        self.counters['hits'] += 1
+        return entry[0]
+
+    def set(self, key, value, timestamp):
+        if timestamp is None:
+            timestamp = timeutils.utcnow()
+        elif isinstance(timestamp, six.string_types):
+            timestamp = timeutils.parse_isotime(timestamp)
+        timestamp = timeutils.normalize_time(timestamp)
+        self._values.pop(key, None)
+        self._values[key] = (value, timestamp)
+        if self._latest is None or timestamp > self._latest:
+            self._latest = timestamp
+        self._evict()
+        self._log_stats()
+
+    def _evict(self):
+        expired = 0
+        if self.ttl is not None:
+            oldest = self._latest - self.ttl
+            # NOTE: the values are ordered by when they were last seen, which
+            # mostly follows the timestamps of their samples.
+            while self._values:
+                key, (value, timestamp) = next(six.iteritems(self._values))
+                if timestamp >= oldest:
+                    break
+                del self._values[key]
+                expired += 1
+        evicted = 0
+        if self.max_entries > 0:
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+                evicted += 1
+        if expired or evicted:
+            self.counters['expired'] += expired
+            self.counters['evicted'] += evicted
+            LOG.debug(_('State store %(name)s: %(expired)d expired and '
+                        '%(evicted)d evicted values'),
+                      {'name': self.name, 'expired': expired,
+                       'evicted': evicted})
+
+    def pop(self, key, default=None):
+        entry = self._values.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def items(self):
+        return [(k, v[0]) for k, v in six.iteritems(self._values)]
+
+    def clear(self):
+        self._values.clear()
+
+    def __len__(self):
+        return len(self._values)
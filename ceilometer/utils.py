@@ -20,6 +20,7 @@
 
 import bisect
 import calendar
+import collections
 import copy
 import datetime
 import decimal
@@ -249,3 +250,51 @@ class HashRing(object):
             return None
         pos = self._get_position_on_ring(key)
         return self._ring[self._sorted_keys[pos]]
+
+
+class LRUCache(object):
+    """A bounded mapping discarding the least recently used entries.
+
+    A size lower or equal to 0 disables caching altogether.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # re-insert the entry to mark it as the most recently used
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        if self.size <= 0:
+            return
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+    def update(self, mapping):
+        for key, value in six.iteritems(mapping):
+            self[key] = value
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
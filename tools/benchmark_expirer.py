@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool benchmarking the expiry of SQL metering data.
+
+A SQLite database is seeded with samples spread over a number of days,
+then the expired half of them is cleared in a single transaction and in
+batches, each run on a copy of the seeded database.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_expirer.py --samples 2000000 --batch-size 10000
+"""
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+from oslo.config import cfg
+from oslo.utils import timeutils
+
+from ceilometer import storage
+from ceilometer.storage.sqlalchemy import models
+
+
+def seed(conn, samples, resources, meters, days, chunk=10000):
+    engine = conn._engine_facade.get_engine()
+    now = timeutils.utcnow()
+    with engine.begin() as c:
+        c.execute(models.Meter.__table__.insert(),
+                  [{'id': i + 1, 'name': 'meter-%d' % i, 'type': 'gauge',
+                    'unit': 'B'} for i in range(meters)])
+        c.execute(models.Resource.__table__.insert(),
+                  [{'internal_id': i + 1, 'resource_id': 'resource-%d' % i,
+                    'user_id': 'user-%d' % (i % 100),
+                    'project_id': 'project-%d' % (i % 10),
+                    'source_id': 'openstack',
+                    'resource_metadata': {'display_name': 'vm-%d' % i},
+                    'metadata_hash': '%032x' % i}
+                   for i in range(resources)])
+        c.execute(models.MetaText.__table__.insert(),
+                  [{'id': i + 1, 'meta_key': 'display_name',
+                    'value': 'vm-%d' % i} for i in range(resources)])
+
+    step = datetime.timedelta(days=days) // samples
+    start = now - datetime.timedelta(days=days)
+    for offset in range(0, samples, chunk):
+        with engine.begin() as c:
+            c.execute(models.Sample.__table__.insert(),
+                      [{'meter_id': i % meters + 1,
+                        'resource_id': i % resources + 1,
+                        'volume': float(i),
+                        'timestamp': start + step * i,
+                        'recorded_at': now,
+                        'message_signature': 'signature',
+                        'message_id': 'message-%d' % i}
+                       for i in range(offset, min(offset + chunk, samples))])
+        print('%d samples seeded' % min(offset + chunk, samples))
+    return now
+
+
+def expire(path, ttl, now, batch_size, batch_interval):
+    cfg.CONF.set_override('sql_expire_batch_size', batch_size,
+                          group='database')
+    cfg.CONF.set_override('sql_expire_batch_interval', batch_interval,
+                          group='database')
+    conn = storage.get_connection('sqlite:///%s' % path,
+                                  'ceilometer.metering.storage')
+    with mock.patch.object(timeutils, 'utcnow', return_value=now):
+        started = time.time()
+        conn.clear_expired_metering_data(ttl)
+        return time.time() - started
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='benchmark the expiry of SQL metering data',
+    )
+    parser.add_argument(
+        '--samples',
+        default=1000000,
+        type=int,
+        help='Number of samples seeded.',
+    )
+    parser.add_argument(
+        '--resources',
+        default=10000,
+        type=int,
+        help='Number of resources the samples belong to.',
+    )
+    parser.add_argument(
+        '--meters',
+        default=20,
+        type=int,
+        help='Number of meters the samples belong to.',
+    )
+    parser.add_argument(
+        '--days',
+        default=10,
+        type=int,
+        help='Number of days the samples are spread over, the samples of '
+             'the oldest half of them are expired.',
+    )
+    parser.add_argument(
+        '--batch-size',
+        default=10000,
+        type=int,
+        help='Number of rows deleted per transaction in batches.',
+    )
+    parser.add_argument(
+        '--batch-interval',
+        default=0,
+        type=float,
+        help='Seconds to wait between two batches.',
+    )
+    return parser
+
+
+def main():
+    cfg.CONF([], project='ceilometer')
+    args = get_parser().parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        seeded = os.path.join(workdir, 'seeded.db')
+        conn = storage.get_connection('sqlite:///%s' % seeded,
+                                      'ceilometer.metering.storage')
+        conn.upgrade()
+        now = seed(conn, args.samples, args.resources, args.meters,
+                   args.days)
+        ttl = args.days * 86400 // 2
+
+        for name, batch_size in [('single transaction', 0),
+                                 ('batches of %d' % args.batch_size,
+                                  args.batch_size)]:
+            path = os.path.join(workdir, 'expired.db')
+            shutil.copy(seeded, path)
+            duration = expire(path, ttl, now, batch_size,
+                              args.batch_interval)
+            print('Expired in %s: %.2fs' % (name, duration))
+            os.remove(path)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool benchmarking the memory used by samples.
+
+Samples are built the way the compute pollsters do, sharing the metadata
+of their instance, and published through a pipeline sink without
+transformers whose publisher keeps them, as the messaging publisher does
+until they are sent. The time spent and the memory allocated per million
+samples are reported for the Sample class and for the former dictionary
+based implementation.
+
+The number of allocated blocks is measured with tracemalloc when it is
+available (Python >= 3.4), otherwise the number of objects tracked by the
+garbage collector and their size are reported.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_sample.py --samples 1000000
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import gc
+import sys
+import time
+import uuid
+
+from stevedore import extension
+
+from ceilometer import pipeline
+from ceilometer import sample
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class DictSample(object):
+    """The former implementation of Sample, holding its fields in a dict."""
+
+    def __init__(self, name, type, unit, volume, user_id, project_id,
+                 resource_id, timestamp, resource_metadata, source=None):
+        self.name = name
+        self.type = type
+        self.unit = unit
+        self.volume = volume
+        self.user_id = user_id
+        self.project_id = project_id
+        self.resource_id = resource_id
+        self.timestamp = timestamp
+        self.resource_metadata = resource_metadata
+        self.source = source or 'openstack'
+        self.id = str(uuid.uuid1())
+
+    def as_dict(self):
+        return copy.copy(self.__dict__)
+
+
+def make_sink():
+    return pipeline.Sink({'name': 'benchmark', 'transformers': [],
+                          'publishers': ['test://']},
+                         extension.ExtensionManager.make_test_instance([]))
+
+
+def build(cls, count, resources):
+    metadata = [{'display_name': 'vm-%d' % i, 'flavor': {'id': 1}}
+                for i in range(resources)]
+    return [cls(name='cpu', type=sample.TYPE_CUMULATIVE, unit='ns',
+                volume=i, user_id='user', project_id='project',
+                resource_id='resource-%d' % (i % resources),
+                timestamp='2015-07-02T10:39:00', source='openstack',
+                resource_metadata=metadata[i % resources])
+            for i in range(count)]
+
+
+def measure(cls, count, resources):
+    sink = make_sink()
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+    objects = len(gc.get_objects())
+    start = time.time()
+    sink.publish_samples(None, build(cls, count, resources))
+    elapsed = time.time() - start
+    samples = sink.publishers[0].samples
+    if tracemalloc:
+        blocks = sum(stat.count for stat in
+                     tracemalloc.take_snapshot().statistics('filename'))
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        blocks = len(gc.get_objects()) - objects
+        size = sum(sys.getsizeof(s) + sys.getsizeof(s.id) for s in samples)
+        size += sum(sys.getsizeof(s.__dict__) for s in samples
+                    if hasattr(s, '__dict__'))
+    return elapsed, blocks, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=1000000,
+                        help='Number of samples published.')
+    parser.add_argument('--resources', type=int, default=1000,
+                        help='Number of resources sharing their metadata.')
+    args = parser.parse_args()
+
+    scale = 1000000.0 / args.samples
+    for cls in (DictSample, sample.Sample):
+        elapsed, blocks, size = measure(cls, args.samples, args.resources)
+        print('%-12s %.2fs, %d %s and %d MB per million samples' % (
+            cls.__name__, elapsed * scale, blocks * scale,
+            'blocks' if tracemalloc else 'objects',
+            size * scale / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool benchmarking the scaling expressions of transformers.
+
+Every expression is evaluated for the same samples by evaluating its
+string against a Namespace of the whole sample, as the scaling
+transformers used to, and with the compiled transformer.Expression, the
+results of both being checked to be the same.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_scaling.py --samples 100000
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from ceilometer import sample
+from ceilometer import transformer
+
+EXPRESSIONS = [
+    '100.0 / (10**9 * (resource_metadata.cpu_number or 1))',
+    '(volume * 1.8) + 32',
+    '1.0 / 1024',
+    '1',
+]
+
+
+def make_samples(count):
+    return [sample.Sample(name='cpu', type=sample.TYPE_CUMULATIVE,
+                          unit='ns', volume=i, user_id='user',
+                          project_id='project', resource_id='resource',
+                          timestamp='2015-07-02T10:39:00',
+                          resource_metadata={'cpu_number': 4,
+                                             'flavor': {'id': 1,
+                                                        'ram': 2048}},
+                          source='openstack')
+            for i in range(count)]
+
+
+def evaluate_string(expr, samples):
+    return [eval(expr, {}, transformer.Namespace(s.as_dict()))
+            for s in samples]
+
+
+def evaluate_compiled(expr, samples):
+    expression = transformer.Expression(expr)
+    return [expression.evaluate(s) for s in samples]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=100000,
+                        help='Number of samples scaled per expression.')
+    args = parser.parse_args()
+
+    samples = make_samples(args.samples)
+    for expr in EXPRESSIONS:
+        timings = []
+        results = []
+        for evaluate in (evaluate_string, evaluate_compiled):
+            start = time.time()
+            results.append(evaluate(expr, samples))
+            timings.append(time.time() - start)
+        assert results[0] == results[1], expr
+        print('%-55s eval %.3fs, compiled %.3fs (x%.1f)' % (
+            expr, timings[0], timings[1], timings[0] / timings[1]))
+
+
+if __name__ == '__main__':
+    main()